@@ -1,13 +1,29 @@
-from flask import Flask, render_template, jsonify, send_from_directory, request
+from flask import Flask, render_template, jsonify, send_from_directory, send_file, request, Response
+from werkzeug.security import safe_join
 from flask_cors import CORS
 import json
+import io
+import os
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
 import logging
 from collections import deque
 import time
+import argparse
+import socket
+import multiprocessing
 from uuid import uuid4
+from werkzeug.serving import make_server
+
+from page.dashboard.AlertIndex import AlertIndex, to_timestamp
+from page.dashboard.AlertSearch import search_page, encode_cursor, decode_cursor
+from page.dashboard.AlertEvents import AlertBroker, SharedAlertBroker
+from page.dashboard.HttpCache import CacheVersion, SharedCacheVersion, conditional_json
+from page.dashboard.Thumbnails import ThumbnailStore
+from page.dashboard.DefectCrops import CropStore
+from page.dashboard.AlertRetention import RetentionManager
+from page.dashboard.AlertAnnotate import filter_detections, render_annotated
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +42,20 @@ CAMERA_CACHE_TIMESTAMP = 0
 CAMERA_CACHE_LOCK = threading.Lock()
 CAMERA_CACHE_TTL = 300  # 5分钟缓存
 
+# 告警图片按 alert_id 命名，内容基本不变，浏览器缓存 1 天后用 ETag 重新验证
+IMAGE_MAX_AGE = 86400
+
+# 新告警事件广播（SSE 实时推送）
+ALERT_BROKER = AlertBroker()
+
+# 缓存版本号：告警缓存、风机集合或索引变化时递增，用于 ETag
+CACHE_VERSION = CacheVersion()
+
+# 保留策略预览（dry-run）结果缓存，避免频繁遍历告警目录
+RETENTION_PREVIEW = {'time': 0, 'report': None}
+RETENTION_PREVIEW_LOCK = threading.Lock()
+RETENTION_PREVIEW_TTL = 60
+
 # 缺陷名称汉化映射
 try:
     with open("./models/blade/classes.json", encoding='utf-8') as f:
@@ -40,10 +70,26 @@ def translate_defect_name(english_name):
     return DEFECT_CHINESE_MAP.get(english_name, english_name)
 
 
+def enable_shared_state(index):
+    """多进程模式：事件广播和缓存版本改为保存在 SQLite 索引库中，所有工作进程共享"""
+    global ALERT_BROKER, CACHE_VERSION
+    ALERT_BROKER = SharedAlertBroker(index)
+    CACHE_VERSION = SharedCacheVersion(index)
+
+
 class AlertCollector:
     """告警收集器：1. 扫描本地文件 2. 支持外部推送写入缓存"""
 
-    def __init__(self, alert_dir='alerts'):
+    def __init__(self, alert_dir='alerts', shared=False, retention=None):
+        """
+        初始化告警收集器
+        Args:
+            alert_dir: 告警持久化目录
+            shared: 多进程模式，最近告警和风机列表从共享的索引库读取，而不是进程内缓存
+            retention: 保留策略参数（RetentionManager 的关键字参数），为空时不清理
+        """
+        self.shared = shared
+
         # 目录配置
         self.stop_event = threading.Event()
         self.alert_dir = Path(alert_dir)
@@ -58,10 +104,33 @@ class AlertCollector:
         # 确保缓存清除标记
         self.last_cache_size = 0
 
+        # 缩略图（宫格、表格视图使用）
+        self.thumbnails = ThumbnailStore(self.alert_dir)
+
+        # 缺陷小图（缺陷视图和详情缺陷列表使用）
+        self.crops = CropStore(self.alert_dir)
+
+        # 告警元数据索引（历史搜索使用），首次建立完成前历史搜索直接遍历目录
+        self.index = AlertIndex(self.alert_dir / 'alert_index.db')
+        # 只信任重建完成时写入的标记：重建前通过 API 写入的单条告警不代表索引完整
+        self._index_ready = self.index.get_meta('index_ready') == '1'
+
+        # 保留策略：只在运行文件扫描的进程中执行，其他进程只用于预览
+        self.retention = RetentionManager(
+            self.alert_dir, self.index, on_removed=self._on_alerts_removed, **(retention or {})
+        )
+
         logger.info(f"告警收集器初始化完成，告警目录: {self.alert_dir.absolute()}")
         logger.info(f"缓存最大容量: {ALERTS_CACHE.maxlen}")
 
 
+    @property
+    def index_ready(self):
+        """索引是否已建立（多进程模式下由负责扫描的主进程建立）"""
+        if not self._index_ready:
+            self._index_ready = self.index.get_meta('index_ready') == '1'
+        return self._index_ready
+
     def start(self):
         """启动告警收集器"""
         self.stop_event.clear()
@@ -73,21 +142,58 @@ class AlertCollector:
         self.collector_thread.start()
         logger.info("告警收集器（文件扫描）启动成功")
 
+        self.retention.start()
+
     def stop(self):
         """停止告警收集器"""
         self.stop_event.set()
+        self.retention.stop()
         if self.collector_thread:
             self.collector_thread.join(timeout=5.0)
         logger.info("告警收集器（文件扫描）已停止")
 
+    def _on_alerts_removed(self, alert_ids):
+        """保留策略删除告警后，同步移出进程内缓存"""
+        removed = set(alert_ids)
+        with ALERTS_LOCK:
+            remaining = [alert for alert in ALERTS_CACHE if alert.get('alert_id') not in removed]
+            if len(remaining) != len(ALERTS_CACHE):
+                ALERTS_CACHE.clear()
+                ALERTS_CACHE.extend(remaining)
+        CACHE_VERSION.bump()
+
+    def rebuild_index(self):
+        """从磁盘重建告警索引"""
+        return self.index.rebuild(self.alert_dir)
+
     def _scan_local_alerts(self):
         """扫描本地 JSON 文件，加载历史告警"""
+        # 首次启动（索引为空）时从磁盘建立索引
+        try:
+            if not self.index_ready:
+                # rebuild 在完成时写入 index_ready 标记
+                self.rebuild_index()
+                self._index_ready = True
+                CACHE_VERSION.bump()
+        except Exception as e:
+            logger.error(f"建立告警索引失败: {e}")
+
+        # 启动时用索引中最近的告警填充缓存；之后扫描只处理索引中没有的新告警
+        try:
+            if self.index_ready:
+                self._seed_cache()
+        except Exception as e:
+            logger.error(f"从索引加载最近告警失败: {e}")
+
         while self.running:
             try:
                 # 使用rglob扫描所有JSON文件（支持分层目录）
                 json_files = list(self.alert_dir.rglob('**/*.json'))
                 json_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
 
+                with ALERTS_LOCK:
+                    cached_ids = {a.get('alert_id') for a in ALERTS_CACHE}
+
                 new_alerts = []
                 for json_file in json_files:
                     try:
@@ -95,11 +201,7 @@ class AlertCollector:
                             alert_data = json.load(f)
 
                         # 检查是否已在缓存中（避免重复加载）
-                        with ALERTS_LOCK:
-                            is_duplicate = any(
-                                a.get('alert_id') == alert_data.get('alert_id')
-                                for a in ALERTS_CACHE
-                            )
+                        is_duplicate = alert_data.get('alert_id') in cached_ids
 
                         if not is_duplicate:
                             # 确保图片路径正确
@@ -124,8 +226,15 @@ class AlertCollector:
                     except Exception as e:
                         logger.error(f"读取告警文件失败 {json_file}: {e}")
 
-                # 将新发现的历史告警添加到缓存（线程安全）
+                # 只有索引中没有的才是新产生的告警：已入库但不在最近 1000 条缓存中的旧告警不再重复加入，
+                # 否则每轮扫描都会改变缓存顺序并递增缓存版本，ETag 永远无法命中
+                if new_alerts:
+                    unseen_ids = self.index.missing([a.get('alert_id') for a in new_alerts])
+                    new_alerts = [a for a in new_alerts if a.get('alert_id') in unseen_ids]
+
                 if new_alerts:
+                    self.index.add_many(new_alerts)
+
                     with ALERTS_LOCK:
                         # 按时间倒序添加（最新的在前）
                         new_alerts.sort(
@@ -134,6 +243,10 @@ class AlertCollector:
                         )
                         for alert in new_alerts:
                             ALERTS_CACHE.appendleft(alert)
+                    CACHE_VERSION.bump()
+
+                    for alert in new_alerts:
+                        ALERT_BROKER.publish(alert)
 
                     logger.info(
                         f"从本地扫描到 {len(new_alerts)} 条新历史告警，"
@@ -152,9 +265,25 @@ class AlertCollector:
                 logger.error(f"本地告警扫描线程出错: {e}")
                 time.sleep(10)
 
-    def save_alert_to_local(self, alert_info, image_file=None):
+    def _seed_cache(self):
+        """用索引中最近的告警（最多缓存容量条）填充进程内缓存"""
+        if self.shared:
+            return
+        recent = [complete_alert_fields(alert) for alert in self.index.recent(limit=ALERTS_CACHE.maxlen)]
+        with ALERTS_LOCK:
+            known = {alert.get('alert_id') for alert in ALERTS_CACHE}
+            # 缓存最新的在前；启动期间通过 API 推送进来的告警已在缓存头部
+            ALERTS_CACHE.extend(alert for alert in recent if alert.get('alert_id') not in known)
+        CACHE_VERSION.bump()
+        logger.info(f"从索引加载最近告警 {len(recent)} 条，当前缓存大小: {len(ALERTS_CACHE)}")
+
+    def save_alert_to_local(self, alert_info, image_file=None, crop_files=None):
         """
         将 API 接收的告警持久化到本地（按分层目录结构）
+        Args:
+            alert_info: 告警信息
+            image_file: 上传的告警图片
+            crop_files: 上传的缺陷小图 {缺陷序号: 文件}
         """
         # 补全必要字段
         alert_id = alert_info.get('alert_id', str(uuid4()))
@@ -185,6 +314,16 @@ class AlertCollector:
         else:
             alert_info['image_filename'] = f"{date_path}/images/{alert_id}.jpg"
 
+        # 保存缺陷小图（未上传的缺陷在首次访问时从告警图片截取）
+        if crop_files:
+            crop_dir = self.alert_dir / date_path / 'crops'
+            crop_dir.mkdir(parents=True, exist_ok=True)
+            crops = alert_info.get('crops') or []
+            for index, crop_file in crop_files.items():
+                crop = crops[index] if index < len(crops) else None
+                if crop:
+                    crop_file.save(str(crop_dir / Path(crop['filename']).name))
+
         # 保存JSON文件
         json_path = json_dir / f"{alert_id}.json"
         with open(json_path, 'w', encoding='utf-8') as f:
@@ -192,10 +331,16 @@ class AlertCollector:
             alert_info['relative_path'] = date_path
             json.dump(alert_info, f, ensure_ascii=False, indent=2)
 
+        # 更新告警索引
+        self.index.add(alert_info, json_path)
+
         return alert_info
 
     def get_alerts(self, page=1, per_page=100):
         """获取格式化后的告警列表（支持分页）"""
+        if self.shared:
+            return self._get_shared_alerts(page, per_page)
+
         with ALERTS_LOCK:
             total_alerts = len(ALERTS_CACHE)
             start_idx = (page - 1) * per_page
@@ -222,8 +367,34 @@ class AlertCollector:
                 }
             }
 
+    def _get_shared_alerts(self, page, per_page):
+        """多进程模式：从索引库读取最近的告警（与进程内缓存一样最多 1000 条）"""
+        total_alerts = min(self.index.count(), ALERTS_CACHE.maxlen)
+        start_idx = (page - 1) * per_page
+        limit = max(0, min(per_page, total_alerts - start_idx))
+
+        alerts = self.index.recent(limit=limit, offset=start_idx) if limit else []
+        for alert in alerts:
+            complete_alert_fields(alert)
+
+        return {
+            'alerts': alerts,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total_alerts,
+                'total_pages': (total_alerts + per_page - 1) // per_page if total_alerts > 0 else 1
+            }
+        }
+
     def get_stats(self):
         """获取告警统计信息"""
+        if self.shared:
+            return {
+                'total_alerts': min(self.index.count(), ALERTS_CACHE.maxlen),
+                'cached_alerts_limit': ALERTS_CACHE.maxlen
+            }
+
         with ALERTS_LOCK:
             return {
                 'total_alerts': len(ALERTS_CACHE),
@@ -236,7 +407,25 @@ def index():
     return render_template("alter_dashboard.html")
 
 
+def cache_version():
+    """告警接口的数据版本"""
+    return CACHE_VERSION.current()
+
+
+def camera_cache_version():
+    """风机列表的数据版本；缓存过期需要重新扫描时返回 None"""
+    collector = app.config.get('alert_collector')
+    if collector and (collector.shared or collector.index_ready):
+        return CACHE_VERSION.current()
+
+    with CAMERA_CACHE_LOCK:
+        if time.time() - CAMERA_CACHE_TIMESTAMP >= CAMERA_CACHE_TTL or not CAMERA_CACHE:
+            return None
+    return CACHE_VERSION.current()
+
+
 @app.route('/api/alerts', methods=['GET'])
+@conditional_json(cache_version)
 def get_alerts_api():
     """GET - 获取告警列表（支持分页）"""
     try:
@@ -286,21 +475,31 @@ def receive_alert_api():
         # 1. 解析请求数据
         alert_info = json.loads(request.form.get('alert_info', '{}'))
         image_file = request.files.get('image')
+        crop_files = {
+            int(key[len('crop_'):]): file for key, file in request.files.items()
+            if key.startswith('crop_') and key[len('crop_'):].isdigit()
+        }
 
         # 2. 补全字段并持久化到本地
-        alert_info = collector.save_alert_to_local(alert_info, image_file)
+        alert_info = collector.save_alert_to_local(alert_info, image_file, crop_files)
 
-        # 3. 线程安全地添加到缓存（实时展示）
-        with ALERTS_LOCK:
-            # 直接添加到缓存头部（最新告警优先展示）
-            ALERTS_CACHE.appendleft(alert_info)
+        # 3. 线程安全地添加到缓存（实时展示）；多进程模式下各进程直接读取索引库
+        if not collector.shared:
+            with ALERTS_LOCK:
+                # 直接添加到缓存头部（最新告警优先展示）
+                ALERTS_CACHE.appendleft(alert_info)
+        CACHE_VERSION.bump()
 
+        # 4. 推送给已连接的仪表板
+        ALERT_BROKER.publish(complete_alert_fields(dict(alert_info)))
 
-        # 4. 更新风机号缓存
+        # 5. 更新风机号缓存
         camera_id = alert_info.get('camera_id')
         if camera_id:
             with CAMERA_CACHE_LOCK:
-                CAMERA_CACHE.add(camera_id)
+                if camera_id not in CAMERA_CACHE:
+                    CAMERA_CACHE.add(camera_id)
+                    CACHE_VERSION.bump()
 
         logger.info(f"成功接收并缓存外部推送告警: {alert_info['alert_id']}")
         return jsonify({
@@ -314,6 +513,21 @@ def receive_alert_api():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/api/alerts/stream')
+def stream_alerts_api():
+    """GET - SSE 实时推送新告警（支持 Last-Event-ID 断线续传）"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    return Response(
+        ALERT_BROKER.stream(last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止 Nginx 缓冲事件流
+        }
+    )
+
+
 @app.route('/alerts/images/<path:filename>')
 def serve_alert_image(filename):
     """提供告警图片访问（支持分层目录）"""
@@ -331,20 +545,120 @@ def serve_alert_image(filename):
         except ValueError:
             return "非法路径", 403
 
-        return send_from_directory(collector.alert_dir, filename)
+        # 条件请求（ETag/Last-Modified）和 Range 分段下载由 send_from_directory 处理
+        return send_from_directory(collector.alert_dir.absolute(), filename, max_age=IMAGE_MAX_AGE)
 
     except Exception as e:
         logger.error(f"提供告警图片失败: {e}")
         return str(e), 404
 
 
+@app.route('/alerts/thumbs/<int:width>/<path:filename>')
+def serve_alert_thumbnail(width, filename):
+    """提供告警缩略图（首次请求时生成并缓存到磁盘）"""
+    try:
+        collector = app.config.get('alert_collector')
+        if not collector:
+            return "告警收集器未初始化", 500
+
+        # 安全检查：确保路径在alert_dir内
+        if safe_join(str(collector.alert_dir), filename) is None:
+            return "非法路径", 403
+
+        thumb_path = collector.thumbnails.get(filename, width)
+        if thumb_path is None:
+            return "图片不存在", 404
+
+        return send_file(thumb_path.absolute(), mimetype='image/jpeg', max_age=IMAGE_MAX_AGE)
+
+    except Exception as e:
+        logger.error(f"提供告警缩略图失败: {e}")
+        return str(e), 404
+
+
+@app.route('/alerts/crops/<alert_id>/<int:index>')
+def serve_defect_crop(alert_id, index):
+    """提供单个缺陷的小图（旋转校正、带少量背景），缺陷视图只加载小图"""
+    try:
+        collector = app.config.get('alert_collector')
+        if not collector:
+            return "告警收集器未初始化", 500
+
+        alert = find_alert(collector, alert_id)
+        if alert is None:
+            return "告警不存在", 404
+        if safe_join(str(collector.alert_dir), alert.get('relative_path', ''), 'crops') is None:
+            return "非法路径", 403
+
+        crop_path = collector.crops.get(alert, index)
+        if crop_path is None:
+            return "缺陷小图不存在", 404
+
+        return send_file(crop_path.absolute(), mimetype='image/jpeg', max_age=IMAGE_MAX_AGE)
+
+    except Exception as e:
+        logger.error(f"提供缺陷小图失败: {e}")
+        return str(e), 404
+
+
+@app.route('/api/alerts/<alert_id>/annotated')
+def export_annotated_image(alert_id):
+    """
+    GET - 导出烧录检测框的告警图片（按需绘制，不落盘）
+    参数: classes（逗号分隔的缺陷名称）、min_conf（最低置信度）、download=1（作为附件下载）
+    """
+    try:
+        collector = app.config.get('alert_collector')
+        if not collector:
+            return "告警收集器未初始化", 500
+
+        alert = collector.index.get(alert_id)
+        if alert is None:
+            return "告警不存在", 404
+        alert = complete_alert_fields(alert)
+
+        filename = alert['image_filename']
+        image_path = safe_join(str(collector.alert_dir), filename)
+        if image_path is None:
+            return "非法路径", 403
+
+        try:
+            min_conf = float(request.args.get('min_conf', 0))
+        except ValueError:
+            return "min_conf 参数无效", 400
+        classes = request.args.get('classes')
+        if classes is not None:
+            classes = {name for name in classes.split(',') if name}
+        download_name = f"{alert_id}_annotated.jpg" if request.args.get('download') == '1' else None
+
+        # 旧告警或开启 save_annotated_images 时图片本身已带标注，直接返回原图
+        if alert.get('image_annotated', True):
+            return send_file(os.path.abspath(image_path), mimetype='image/jpeg', max_age=IMAGE_MAX_AGE,
+                             as_attachment=download_name is not None, download_name=download_name)
+
+        detections = filter_detections(alert.get('detections', []), classes, min_conf)
+        data = render_annotated(image_path, detections, alert.get('image_width'), alert.get('image_height'))
+        if data is None:
+            return "图片不存在", 404
+
+        return send_file(io.BytesIO(data), mimetype='image/jpeg', max_age=IMAGE_MAX_AGE,
+                         as_attachment=download_name is not None, download_name=download_name)
+
+    except Exception as e:
+        logger.error(f"导出标注图片失败: {e}")
+        return str(e), 500
+
+
 @app.route('/api/health')
 def health_check():
     collector = app.config.get('alert_collector')
     stats = collector.get_stats() if collector else {'total_alerts': 0}
-    # 加锁读取缓存长度
-    with ALERTS_LOCK:
-        cached_count = len(ALERTS_CACHE)
+    if collector and collector.shared:
+        cached_count = stats['total_alerts']
+    else:
+        # 加锁读取缓存长度
+        with ALERTS_LOCK:
+            cached_count = len(ALERTS_CACHE)
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
@@ -354,10 +668,33 @@ def health_check():
 
 
 
+def find_alert(collector, alert_id):
+    """按告警 ID 查找告警：优先查索引，索引尚未建立时查最近告警缓存"""
+    alert = collector.index.get(alert_id)
+    if alert is None and not collector.shared:
+        with ALERTS_LOCK:
+            alert = next((dict(a) for a in ALERTS_CACHE if a.get('alert_id') == alert_id), None)
+    return alert
+
+
+def complete_alert_fields(alert):
+    """补全图片路径并汉化缺陷名称"""
+    if 'relative_path' in alert:
+        alert['image_filename'] = f"{alert['relative_path']}/images/{alert['alert_id']}.jpg"
+    elif 'image_filename' not in alert:
+        alert['image_filename'] = f"{alert['alert_id']}.jpg"
+
+    for detection in alert.get('detections', []):
+        detection['name_chinese'] = translate_defect_name(detection.get('name', ''))
+
+    return alert
+
+
 # 新增文件搜索API和智能切换逻辑
 @app.route('/api/alerts/search', methods=['GET'])
+@conditional_json(cache_version)
 def search_alerts_by_time():
-    """按时间范围从文件系统搜索历史告警（优化版）"""
+    """按时间范围搜索历史告警（优先使用 SQLite 索引，索引不可用时扫描文件）"""
     try:
         # 获取查询参数
         start_time = request.args.get('start_time')
@@ -389,94 +726,59 @@ def search_alerts_by_time():
         except ValueError:
             return jsonify({'status': 'error', 'message': '时间格式不正确'}), 400
 
-        # 计算要搜索的目录范围
         collector = app.config.get('alert_collector')
         if not collector:
             return jsonify({'status': 'error', 'message': '告警收集器未初始化'}), 503
 
-        matched_alerts = []
+        page = max(1, page)
+        per_page = max(1, per_page)
+        start_idx = (page - 1) * per_page
 
-        # 根据camera_id和日期范围确定搜索目录
-        if camera_id:
-            # 搜索特定风机
-            search_dirs = []
-            current_dt = start_dt.replace(day=1)  # 从开始时间的月份开始
-            while current_dt <= end_dt:
-                search_dir = collector.alert_dir / f"{camera_id}/{current_dt.year}/{current_dt.month:02d}"
-                if search_dir.exists():
-                    search_dirs.append(search_dir)
-                # 移动到下个月
-                if current_dt.month == 12:
-                    current_dt = current_dt.replace(year=current_dt.year + 1, month=1)
-                else:
-                    current_dt = current_dt.replace(month=current_dt.month + 1)
+        # 游标优先于页码：从上一页最后一条之后继续，不再跳过前面的结果
+        cursor = request.args.get('cursor') or None
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        filters = {
+            'camera_id': camera_id,
+            'defect_name': defect_name,
+            'min_confidence': min_confidence
+        }
+
+        if collector.index_ready:
+            # 索引查询：时间范围、风机、缺陷、置信度均在 SQLite 中完成
+            items, total = collector.index.search(
+                to_timestamp(start_dt), to_timestamp(end_dt),
+                after=after,
+                limit=per_page + 1,
+                offset=start_idx,
+                **filters
+            )
+            next_cursor = None
+            if len(items) > per_page:
+                items = items[:per_page]
+                next_cursor = encode_cursor(items[-1][0], items[-1][1].get('alert_id', ''))
+            paginated_alerts = [alert for _, alert in items]
+            total_exact = True
+            search_mode = 'index'
         else:
-            # 搜索所有风机
-            search_dirs = [collector.alert_dir]
-
-        # 遍历搜索目录
-        for search_dir in search_dirs:
-            # 查找该目录下的所有JSON文件
-            for json_file in search_dir.rglob('**/*.json'):
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        alert = json.load(f)
-
-                    # 时间筛选
-                    detection_time = alert.get('detection_time', '')
-                    if not detection_time:
-                        continue
-
-                    try:
-                        alert_dt = datetime.fromisoformat(detection_time.replace('Z', '+00:00'))
-                    except ValueError:
-                        continue
-
-                    if alert_dt < start_dt or alert_dt > end_dt:
-                        continue
-
-                    # 风机筛选（如果指定了camera_id）
-                    if camera_id and alert.get('camera_id') != camera_id:
-                        continue
-
-                    # 缺陷筛选
-                    if defect_name:
-                        detections = alert.get('detections', [])
-                        has_defect = any(det.get('name') == defect_name for det in detections)
-                        if not has_defect:
-                            continue
-
-                    # 置信度筛选
-                    if min_confidence:
-                        detections = alert.get('detections', [])
-                        if detections:
-                            max_conf = max(det.get('conf', 0) for det in detections)
-                            if max_conf < float(min_confidence):
-                                continue
-
-                    # 补全图片路径
-                    if 'relative_path' in alert:
-                        alert['image_filename'] = f"{alert['relative_path']}/images/{alert['alert_id']}.jpg"
-                    elif 'image_filename' not in alert:
-                        alert['image_filename'] = f"{alert['alert_id']}.jpg"
-
-                    # 汉化缺陷名称
-                    for detection in alert.get('detections', []):
-                        detection['name_chinese'] = translate_defect_name(detection['name'])
-
-                    matched_alerts.append(alert)
-
-                except Exception as e:
-                    logger.error(f"读取告警文件失败 {json_file}: {e}")
-
-        # 按时间倒序排序
-        matched_alerts.sort(key=lambda x: x.get('detection_time', ''), reverse=True)
-
-        # 分页
-        total = len(matched_alerts)
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        paginated_alerts = matched_alerts[start_idx:end_idx]
+            # 索引尚未就绪：按 风机/年/月/日 倒序遍历目录，页满即停止
+            paginated_alerts, next_cursor = search_page(
+                collector.alert_dir, start_dt, end_dt,
+                cursor=cursor,
+                offset=0 if cursor else start_idx,
+                limit=per_page,
+                **filters
+            )
+            # 流式遍历不统计总数，只保证能翻到下一页
+            total = start_idx + len(paginated_alerts) + (1 if next_cursor else 0)
+            total_exact = False
+            search_mode = 'file'
+
+        for alert in paginated_alerts:
+            complete_alert_fields(alert)
 
         return jsonify({
             'status': 'success',
@@ -485,13 +787,15 @@ def search_alerts_by_time():
                 'page': page,
                 'per_page': per_page,
                 'total': total,
-                'total_pages': (total + per_page - 1) // per_page if total > 0 else 1
+                'total_pages': (total + per_page - 1) // per_page if total > 0 else 1,
+                'total_exact': total_exact,
+                'next_cursor': next_cursor
             },
-            'search_mode': 'file'
+            'search_mode': search_mode
         })
 
     except Exception as e:
-        logger.error(f"文件搜索失败: {e}")
+        logger.error(f"历史搜索失败: {e}")
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -499,8 +803,9 @@ def search_alerts_by_time():
 
 
 @app.route('/api/cameras', methods=['GET'])
+@conditional_json(camera_cache_version)
 def get_all_cameras():
-    """获取所有风机号列表 - 使用缓存"""
+    """获取所有风机号列表 - 优先读取索引中的风机注册表，索引未建立时扫描目录"""
     try:
         global CAMERA_CACHE, CAMERA_CACHE_TIMESTAMP
 
@@ -508,6 +813,17 @@ def get_all_cameras():
         if not collector:
             return jsonify({'status': 'error', 'message': '告警收集器未初始化', 'cameras': []}), 503
 
+        # 风机注册表在入库时增量维护，查询代价只与风机数量有关
+        if collector.shared or collector.index_ready:
+            camera_list = natural_sort(list(collector.index.camera_ids()))
+            return jsonify({
+                'status': 'success',
+                'cameras': camera_list,
+                'count': len(camera_list),
+                'source': 'index',
+                'cached': False
+            })
+
         current_time = time.time()
 
         # 检查缓存是否过期
@@ -568,6 +884,8 @@ def get_all_cameras():
 
         # 更新缓存
         with CAMERA_CACHE_LOCK:
+            if cameras != CAMERA_CACHE:
+                CACHE_VERSION.bump()
             CAMERA_CACHE = cameras
             CAMERA_CACHE_TIMESTAMP = current_time
 
@@ -587,6 +905,145 @@ def get_all_cameras():
         return jsonify({'status': 'error', 'message': str(e), 'cameras': []}), 500
 
 
+def stats_day_range():
+    """
+    解析统计接口的日期范围参数（start_date/end_date 为 YYYY-MM-DD，或 days 表示最近 N 天）
+    Returns:
+        (start_day, end_day)
+    """
+    days = max(1, min(request.args.get('days', 30, type=int), 3660))
+    end_day = request.args.get('end_date') or datetime.now().date().isoformat()
+    start_day = request.args.get('start_date')
+
+    end_date = datetime.fromisoformat(end_day).date()
+    if not start_day:
+        start_day = (end_date - timedelta(days=days - 1)).isoformat()
+    start_date = datetime.fromisoformat(start_day).date()
+
+    return start_date.isoformat(), end_date.isoformat()
+
+
+def format_camera_stats(stats):
+    """风机汇总统计：时间戳转换为 ISO 时间"""
+    for key in ('first', 'last'):
+        ts = stats.pop(f'{key}_ts')
+        stats[f'{key}_alert_time'] = datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+    return stats
+
+
+def format_defect_stats(defects):
+    """缺陷类别统计：补充中文名称"""
+    for defect in defects:
+        defect['name_chinese'] = translate_defect_name(defect['name'])
+    return defects
+
+
+@app.route('/api/cameras/stats', methods=['GET'])
+@conditional_json(cache_version)
+def get_cameras_stats():
+    """获取所有风机的告警汇总、按日趋势和缺陷类别分布（读取索引中的汇总表）"""
+    try:
+        collector = app.config.get('alert_collector')
+        if not collector:
+            return jsonify({'status': 'error', 'message': '告警收集器未初始化'}), 503
+
+        try:
+            start_day, end_day = stats_day_range()
+        except ValueError:
+            return jsonify({'status': 'error', 'message': '日期格式不正确'}), 400
+
+        index = collector.index
+        stats_by_camera = {stats['camera_id']: stats for stats in index.camera_stats()}
+        cameras = [format_camera_stats(stats_by_camera[camera_id])
+                   for camera_id in natural_sort(list(stats_by_camera))]
+
+        return jsonify({
+            'status': 'success',
+            'cameras': cameras,
+            'count': len(cameras),
+            'start_date': start_day,
+            'end_date': end_day,
+            'daily': index.daily_stats(start_day, end_day),
+            'defects': format_defect_stats(index.defect_stats(start_day, end_day)),
+            # 索引首次建立完成前统计不完整
+            'complete': collector.index_ready
+        })
+
+    except Exception as e:
+        logger.error(f"获取风机统计失败: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/cameras/<camera_id>/stats', methods=['GET'])
+@conditional_json(cache_version)
+def get_camera_stats(camera_id):
+    """获取单个风机的告警汇总、按日趋势和缺陷类别分布"""
+    try:
+        collector = app.config.get('alert_collector')
+        if not collector:
+            return jsonify({'status': 'error', 'message': '告警收集器未初始化'}), 503
+
+        try:
+            start_day, end_day = stats_day_range()
+        except ValueError:
+            return jsonify({'status': 'error', 'message': '日期格式不正确'}), 400
+
+        index = collector.index
+        stats = index.camera_stats(camera_id)
+        if not stats:
+            return jsonify({'status': 'error', 'message': f'风机 {camera_id} 没有告警记录'}), 404
+
+        return jsonify({
+            'status': 'success',
+            'camera': format_camera_stats(stats[0]),
+            'start_date': start_day,
+            'end_date': end_day,
+            'daily': index.daily_stats(start_day, end_day, camera_id),
+            'defects': format_defect_stats(index.defect_stats(start_day, end_day, camera_id)),
+            'complete': collector.index_ready
+        })
+
+    except Exception as e:
+        logger.error(f"获取风机 {camera_id} 统计失败: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/retention', methods=['GET'])
+def get_retention_report():
+    """
+    获取告警保留策略和最近一次清理报告
+    dry_run=1 时按当前磁盘占用生成清理计划（不修改磁盘，结果缓存 60 秒）
+    """
+    try:
+        collector = app.config.get('alert_collector')
+        if not collector:
+            return jsonify({'status': 'error', 'message': '告警收集器未初始化'}), 503
+
+        retention = collector.retention
+        result = {
+            'status': 'success',
+            'enabled': retention.enabled,
+            'policy': retention.policy(),
+            'last_report': retention.latest_report()
+        }
+
+        if request.args.get('dry_run') in ('1', 'true'):
+            with RETENTION_PREVIEW_LOCK:
+                if time.time() - RETENTION_PREVIEW['time'] >= RETENTION_PREVIEW_TTL:
+                    report = retention.run(dry_run=True)
+                    if report is None:
+                        return jsonify({'status': 'error', 'message': '清理任务正在执行，请稍后再试'}), 409
+                    RETENTION_PREVIEW['report'] = report
+                    RETENTION_PREVIEW['time'] = time.time()
+                result['preview'] = RETENTION_PREVIEW['report']
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"获取保留策略报告失败: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 def cleanup():
     """系统关闭时的清理函数"""
     collector = app.config.get('alert_collector')
@@ -595,10 +1052,13 @@ def cleanup():
     logger.info("系统清理完成，已停止所有后台线程")
 
 
-def start_combined_server(host='0.0.0.0', api_port=8080, alert_dir='alerts'):
+def start_combined_server(host='0.0.0.0', api_port=8080, alert_dir='alerts', workers=1, retention=None):
     """启动告警系统"""
+    if workers > 1:
+        return start_multiprocess_server(host, api_port, alert_dir, workers, retention)
+
     # 初始化告警收集器
-    alert_collector = AlertCollector(alert_dir)
+    alert_collector = AlertCollector(alert_dir, retention=retention)
     alert_collector.start()
 
     # 将收集器存入 App 配置
@@ -620,6 +1080,79 @@ def start_combined_server(host='0.0.0.0', api_port=8080, alert_dir='alerts'):
         cleanup()
 
 
+def _serve_worker(listen_socket, host, api_port, alert_dir, worker_id, retention=None):
+    """工作进程：在共享的监听端口上处理 HTTP 请求，不运行文件扫描"""
+    logging.basicConfig(level=logging.INFO)
+
+    alert_collector = AlertCollector(alert_dir, shared=True, retention=retention)
+    enable_shared_state(alert_collector.index)
+    app.config['alert_collector'] = alert_collector
+
+    server = make_server(host, api_port, app, threaded=True, fd=listen_socket.fileno())
+    logger.info(f"工作进程 {worker_id} (pid={os.getpid()}) 开始处理请求")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def start_multiprocess_server(host='0.0.0.0', api_port=8080, alert_dir='alerts', workers=4, retention=None):
+    """
+    多进程模式：主进程监听端口后启动 workers 个工作进程共同 accept 请求；
+    告警缓存、风机列表和事件通知保存在 SQLite 索引库中共享，只有主进程运行文件扫描
+    """
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((host, api_port))
+    listen_socket.listen(1024)
+
+    # spawn 方式启动，工作进程不继承主进程的线程和数据库连接
+    ctx = multiprocessing.get_context('spawn')
+
+    def spawn(worker_id):
+        process = ctx.Process(
+            target=_serve_worker,
+            args=(listen_socket, host, api_port, alert_dir, worker_id, retention),
+            name=f"DashboardWorker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    # 主进程只负责文件扫描、保留策略（唯一的采集进程）和工作进程守护
+    alert_collector = AlertCollector(alert_dir, shared=True, retention=retention)
+    enable_shared_state(alert_collector.index)
+    app.config['alert_collector'] = alert_collector
+
+    processes = {worker_id: spawn(worker_id) for worker_id in range(workers)}
+    alert_collector.start()
+
+    print("=" * 80)
+    print(f"风机叶片检测告警系统（多进程模式，{workers} 个工作进程）已启动")
+    print(f"Web 仪表板访问地址: http://{host}:{api_port}")
+    print(f"告警接收 API 地址: http://{host}:{api_port}/api/alerts")
+    print(f"告警持久化目录: {alert_collector.alert_dir.absolute()}")
+    print("=" * 80)
+
+    try:
+        while True:
+            time.sleep(1)
+            # 工作进程异常退出时重新拉起
+            for worker_id, process in list(processes.items()):
+                if not process.is_alive():
+                    logger.warning(f"工作进程 {worker_id} 已退出 (exitcode={process.exitcode})，正在重启")
+                    processes[worker_id] = spawn(worker_id)
+    except KeyboardInterrupt:
+        logger.info("接收到关闭信号，正在停止系统...")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=5)
+        listen_socket.close()
+        cleanup()
+
+
 def natural_sort(items):
     """自然排序函数"""
     import re
@@ -633,5 +1166,37 @@ def natural_sort(items):
     return sorted(items, key=alphanum_key)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='风机叶片检测告警系统')
+    parser.add_argument('--port', type=int, default=8080, help='port')
+    parser.add_argument('--alert_dir', type=str, default='alerts', help='告警持久化目录')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数（大于 1 时启用多进程模式）')
+    parser.add_argument('--rebuild_index', action='store_true', help='从磁盘重建告警索引后退出')
+    parser.add_argument('--retention_days', type=int, default=None, help='告警最长保留天数')
+    parser.add_argument('--compact_after_days', type=int, default=None, help='超过该天数的告警图片降级为缩略图')
+    parser.add_argument('--archive_after_days', type=int, default=None, help='超过该天数的告警 JSON 压缩归档')
+    parser.add_argument('--camera_quota_mb', type=float, default=None, help='单个风机的磁盘配额（MB）')
+    parser.add_argument('--disk_budget_gb', type=float, default=None, help='告警目录的总磁盘预算（GB）')
+    parser.add_argument('--retention_io_mb', type=float, default=10, help='清理任务的读写速率上限（MB/s）')
+    parser.add_argument('--retention_dry_run', action='store_true', help='输出保留策略的清理计划后退出')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    start_combined_server(api_port=8080)
\ No newline at end of file
+    args = parse_args()
+    retention = {
+        'max_age_days': args.retention_days,
+        'compact_after_days': args.compact_after_days,
+        'archive_after_days': args.archive_after_days,
+        'camera_quota_mb': args.camera_quota_mb,
+        'disk_budget_gb': args.disk_budget_gb,
+        'io_limit_mb': args.retention_io_mb
+    }
+    if args.rebuild_index:
+        AlertCollector(args.alert_dir).rebuild_index()
+    elif args.retention_dry_run:
+        report = AlertCollector(args.alert_dir, retention=retention).retention.run(dry_run=True)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        start_combined_server(api_port=args.port, alert_dir=args.alert_dir, workers=args.workers,
+                              retention=retention)
\ No newline at end of file
@@ -0,0 +1,401 @@
+"""
+离线批量检测：扫描目录或压缩包中的巡检图片，输出 JSONL/CSV 结果和可选的标注图片
+    解码：线程池读取并解码图片，缩放到模型输入尺寸后交给检测进程（进程间只传 1024x1024 的图）
+    推理：进程池，每个进程一个 BladeDetector（CPU 推理时各进程绑定不同的核）
+    断点续跑：每张图片完成后追加到 checkpoint 文件，重新运行时跳过已完成的图片
+
+用法: python batch_inspect.py <目录|.zip|.tar|.tar.gz> --output batch_results --workers 4 --annotate
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path, PurePosixPath
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+MODEL_SIZE = 1024  # 分割模型输入尺寸；解码线程先缩放到该尺寸，检测结果与对原图检测一致
+CSV_FIELDS = ['image', 'status', 'width', 'height', 'clsId', 'name', 'conf', 'x', 'y', 'w', 'h', 'r', 'error']
+
+# 检测进程中的检测器（由进程池 initializer 创建）
+_detector = None
+
+
+def _init_detector(seg_weights, det_weights, conf_threshold, device, cores):
+    """检测进程初始化：绑定CPU核并加载模型"""
+    global _detector
+    from page.caiji.BladeDetector import BladeDetector
+
+    options = None
+    if cores:
+        from page.caiji.ShardedDetector import make_session_options
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        options = make_session_options(cores)
+    _detector = BladeDetector(seg_weights, det_weights, conf_threshold, device, session_options=options)
+
+
+def _detect(image):
+    """检测进程：对 1024x1024 的输入检测，返回 (检测结果, 推理耗时)"""
+    start = time.perf_counter()
+    detections, seg_image, _ = _detector.detect(image)
+    if seg_image is None:
+        # BladeDetector.detect 出错时只记日志并返回空结果，这里要记为失败而不是“无缺陷”
+        raise RuntimeError('检测出错，详见日志')
+    return detections, time.perf_counter() - start
+
+
+def scale_detections(detections, width, height):
+    """MODEL_SIZE 坐标的检测结果换算到原图坐标（与 BladeDetector.to_detections 的缩放方式一致）"""
+    scale_x = width / MODEL_SIZE
+    scale_y = height / MODEL_SIZE
+    for det in detections:
+        det['x'] *= scale_x
+        det['y'] *= scale_y
+        det['w'] *= scale_x
+        det['h'] *= scale_y
+    return detections
+
+
+def iter_sources(input_path):
+    """
+    输入中的所有图片
+    Yields:
+        (相对名称, 读取字节的函数)；目录中的文件在解码线程中读取，tar 只能顺序读取，在调用方线程读取
+    """
+    path = Path(input_path)
+    if path.is_dir():
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                if file_name.lower().endswith(IMAGE_SUFFIXES):
+                    full = Path(root) / file_name
+                    yield full.relative_to(path).as_posix(), full.read_bytes
+    elif path.name.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_SUFFIXES):
+                    data = archive.read(info)
+                    yield info.filename, (lambda data=data: data)
+    elif path.name.lower().endswith(ARCHIVE_SUFFIXES):
+        with tarfile.open(path, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_SUFFIXES):
+                    data = archive.extractfile(member).read()
+                    yield member.name, (lambda data=data: data)
+    else:
+        raise ValueError(f"输入必须是目录或 {'/'.join(ARCHIVE_SUFFIXES)} 压缩包: {input_path}")
+
+
+def count_sources(input_path):
+    """图片总数（用于计算剩余时间）；tar 需要完整解压才能计数，返回 None"""
+    path = Path(input_path)
+    if path.is_dir():
+        return sum(1 for _, _, files in os.walk(path) for name in files if name.lower().endswith(IMAGE_SUFFIXES))
+    if path.name.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            return sum(1 for info in archive.infolist()
+                       if not info.is_dir() and info.filename.lower().endswith(IMAGE_SUFFIXES))
+    return None
+
+
+def decode(name, read, rgb):
+    """
+    解码线程：读取、解码并缩放到模型输入尺寸
+    Returns:
+        (原图 BGR, 模型输入, 原图宽, 原图高)
+    """
+    image = cv2.imdecode(np.frombuffer(read(), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('无法解码图片')
+    height, width = image.shape[:2]
+    # 与分割模型的预处理相同的缩放（双线性），检测进程中的 resize 变为无操作
+    model_input = cv2.resize(image, (MODEL_SIZE, MODEL_SIZE))
+    if rgb:
+        cv2.cvtColor(model_input, cv2.COLOR_BGR2RGB, dst=model_input)
+    return image, model_input, width, height
+
+
+def annotated_path(annotated_dir, name):
+    """
+    标注图片的保存路径：保持输入中的相对目录结构
+    压缩包成员名可能是绝对路径或包含 ..，去掉盘符/根并拒绝 ..，保证结果在 annotated_dir 之内；
+    保留原扩展名（a.png -> a.png.jpg），避免 a.png 与 a.jpg 写到同一个文件
+    """
+    parts = [part for part in PurePosixPath(name.replace('\\', '/')).parts if part not in ('/', '.')]
+    if parts and len(parts[0]) == 2 and parts[0][1] == ':':
+        parts = parts[1:]
+    if not parts or '..' in parts:
+        raise ValueError(f'图片名不安全: {name}')
+    if not parts[-1].lower().endswith('.jpg'):
+        parts[-1] += '.jpg'
+
+    target = annotated_dir.joinpath(*parts)
+    if not target.resolve().is_relative_to(annotated_dir.resolve()):
+        raise ValueError(f'图片名不安全: {name}')
+    return target
+
+
+def save_annotated(image, detections, width, height, annotated_dir, name, quality):
+    """标注线程：在原图上绘制检测框并保存"""
+    from page.dashboard.AlertAnnotate import draw_detections
+
+    target = annotated_path(annotated_dir, name)
+    draw_detections(image, detections, width, height)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError('标注图片编码失败')
+    target.write_bytes(buffer.tobytes())
+
+
+class ResultWriter:
+    """结果输出：JSONL（每张图片一行）、CSV（每个检测框一行）和 checkpoint（已完成的图片名）"""
+
+    def __init__(self, output_dir, formats, restart=False):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_path = self.output_dir / 'checkpoint.txt'
+
+        mode = 'w' if restart else 'a'
+        self.done = set()
+        if not restart and self.checkpoint_path.exists():
+            self.done = set(self.checkpoint_path.read_text(encoding='utf-8').splitlines())
+
+        self.jsonl = open(self.output_dir / 'results.jsonl', mode, encoding='utf-8') if 'jsonl' in formats else None
+        self.csv_file = None
+        self.csv = None
+        if 'csv' in formats:
+            csv_path = self.output_dir / 'results.csv'
+            new_file = restart or not csv_path.exists() or csv_path.stat().st_size == 0
+            self.csv_file = open(csv_path, mode, encoding='utf-8-sig' if new_file else 'utf-8', newline='')
+            self.csv = csv.DictWriter(self.csv_file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.csv.writeheader()
+        self.checkpoint = open(self.checkpoint_path, mode, encoding='utf-8')
+
+    def write(self, record):
+        """先写结果再写 checkpoint，中断时最多重复处理一张图片，不会漏掉"""
+        if self.jsonl:
+            self.jsonl.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.jsonl.flush()
+        if self.csv:
+            base = {key: record.get(key) for key in ('image', 'status', 'width', 'height', 'error')}
+            rows = [dict(base, **det) for det in record.get('detections', [])] or [base]
+            self.csv.writerows(rows)
+            self.csv_file.flush()
+        self.checkpoint.write(record['image'] + '\n')
+        self.checkpoint.flush()
+        self.done.add(record['image'])
+
+    def close(self):
+        for f in (self.jsonl, self.csv_file, self.checkpoint):
+            if f:
+                f.close()
+
+
+class Progress:
+    """吞吐量和剩余时间"""
+
+    def __init__(self, total, skipped, interval):
+        self.total = total
+        self.skipped = skipped
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.completed = 0
+        self.failed = 0
+        self.defects = 0
+        self.infer_time = 0.0
+
+    def update(self, record, infer_time=0.0):
+        self.completed += 1
+        self.infer_time += infer_time
+        if record['status'] != 'ok':
+            self.failed += 1
+        self.defects += len(record.get('detections', []))
+        if time.monotonic() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        self.last_report = time.monotonic()
+        elapsed = self.last_report - self.start
+        rate = self.completed / elapsed if elapsed > 0 else 0
+        done = self.completed + self.skipped
+        if self.total is not None:
+            remaining = max(self.total - done, 0)
+            eta = f"{remaining / rate:.0f}s" if rate > 0 else '-'
+            position = f"{done}/{self.total}"
+        else:
+            eta = '-'
+            position = str(done)
+        print(f"{'完成' if final else '进度'}: {position}，本次 {self.completed} 张（失败 {self.failed}），"
+              f"缺陷 {self.defects} 个，吞吐 {rate:.2f} 张/秒，剩余 {eta}", flush=True)
+
+
+def run(args):
+    config = {}
+    if args.config and Path(args.config).exists():
+        with open(args.config, encoding='utf-8') as f:
+            config = json.load(f)
+    seg_weights = args.seg_weights or config.get('seg_weights', './models/blade/blade_seg.onnx')
+    det_weights = args.det_weights or config.get('det_weights', './models/blade/best.onnx')
+    conf_threshold = args.conf_threshold if args.conf_threshold is not None else config.get('conf_threshold', 0.45)
+    device = args.device or config.get('device', '0')
+    rgb = (args.image_format or config.get('image_format', 'RGB')).upper() == 'RGB'
+    formats = {'jsonl', 'csv'} if args.format == 'both' else {args.format}
+
+    writer = ResultWriter(args.output, formats, restart=args.restart)
+    total = count_sources(args.input)
+    skipped = len(writer.done)
+    if skipped:
+        print(f"从 checkpoint 恢复：跳过已完成的 {skipped} 张图片")
+    progress = Progress(total, skipped, args.progress_interval)
+
+    # CPU 推理时各检测进程绑定不同的核，核数不足时不绑定
+    core_sets = [None] * args.workers
+    if device == 'cpu':
+        from page.caiji.ShardedDetector import plan_core_sets
+        try:
+            core_sets = plan_core_sets(args.workers, args.cores)
+        except ValueError as e:
+            logger.warning(f"不绑定CPU核: {e}")
+
+    # 每个检测进程一个单进程池，用各自的核集合初始化；调度时选在途任务最少的进程
+    processes = []
+    for cores in core_sets:
+        processes.append(ProcessPoolExecutor(
+            max_workers=1, initializer=_init_detector,
+            initargs=(seg_weights, det_weights, conf_threshold, device, cores)))
+    io_pool = ThreadPoolExecutor(max_workers=args.decode_threads, thread_name_prefix='decode')
+    max_inflight = args.max_inflight or args.workers * 4
+    annotated_dir = Path(args.output) / 'annotated'
+
+    sources = iter_sources(args.input)
+    exhausted = False
+    pending = {}      # future -> (阶段, 图片名, 附加数据)
+    inflight = 0      # 已开始处理但还没写出结果的图片数（限制内存占用）
+    load = [0] * len(processes)
+    ok = True
+
+    def finish(record, infer_time=0.0, release=True):
+        nonlocal inflight
+        if release:
+            inflight -= 1
+        writer.write(record)
+        progress.update(record, infer_time)
+
+    try:
+        while True:
+            # 补充新图片，保持在途数量不超过上限
+            while not exhausted and inflight < max_inflight:
+                try:
+                    name, read = next(sources)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if name in writer.done:
+                    continue
+                inflight += 1
+                pending[io_pool.submit(decode, name, read, rgb)] = ('decode', name, None)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, name, extra = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if stage == 'annotate':
+                        inflight -= 1
+                        logger.error(f"{name} 标注图片保存失败: {e}")
+                        continue
+                    if isinstance(e, BrokenProcessPool):
+                        raise
+                    if stage == 'detect':
+                        load[extra[0]] -= 1
+                    finish({'image': name, 'status': 'error', 'error': str(e), 'detections': []})
+                    continue
+
+                if stage == 'decode':
+                    image, model_input, width, height = result
+                    index = load.index(min(load))
+                    load[index] += 1
+                    future = processes[index].submit(_detect, model_input)
+                    pending[future] = ('detect', name, (index, image if args.annotate else None, width, height))
+                elif stage == 'detect':
+                    index, image, width, height = extra
+                    load[index] -= 1
+                    detections, infer_time = result
+                    scale_detections(detections, width, height)
+                    record = {'image': name, 'status': 'ok', 'width': width, 'height': height,
+                              'detections': detections}
+                    # 需要保存标注图时，原图在标注完成后才释放在途名额
+                    annotate = image is not None and (detections or args.annotate_all)
+                    finish(record, infer_time, release=not annotate)
+                    if annotate:
+                        pending[io_pool.submit(save_annotated, image, detections, width, height, annotated_dir,
+                                               name, args.jpeg_quality)] = ('annotate', name, None)
+                elif stage == 'annotate':
+                    inflight -= 1
+    except KeyboardInterrupt:
+        print("已中断，已完成的结果保存在 checkpoint 中，重新运行即可继续", flush=True)
+    except BrokenProcessPool:
+        # 检测进程崩溃或模型加载失败：中止，不把剩余图片记为已完成
+        logger.error("检测进程异常退出（模型加载失败或进程崩溃），详见上方日志；修复后重新运行即可继续")
+        ok = False
+    finally:
+        io_pool.shutdown(wait=True, cancel_futures=True)
+        for process in processes:
+            process.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        progress.report(final=True)
+        if progress.completed:
+            print(f"平均推理耗时 {progress.infer_time / progress.completed * 1000:.0f} ms/张，"
+                  f"结果目录: {Path(args.output).absolute()}")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='风机叶片离线批量检测')
+    parser.add_argument('input', help='图片目录或压缩包（.zip/.tar/.tar.gz）')
+    parser.add_argument('--output', default='batch_results', help='结果目录')
+    parser.add_argument('--config', default='conf/config.json', help='模型配置文件')
+    parser.add_argument('--seg_weights', default=None, help='分割模型路径（默认取配置文件）')
+    parser.add_argument('--det_weights', default=None, help='检测模型路径（默认取配置文件）')
+    parser.add_argument('--conf_threshold', type=float, default=None, help='置信度阈值（默认取配置文件）')
+    parser.add_argument('--device', default=None, help="设备ID或 'cpu'（默认取配置文件）")
+    parser.add_argument('--image_format', default=None, choices=['RGB', 'BGR'], help='模型输入颜色顺序（默认取配置文件）')
+    parser.add_argument('--workers', type=int, default=1, help='检测进程数')
+    parser.add_argument('--cores', default=None, help='各检测进程的核列表，分号分隔，如 "0-7;8-15"')
+    parser.add_argument('--decode_threads', type=int, default=4, help='解码线程数')
+    parser.add_argument('--max_inflight', type=int, default=None, help='同时在处理中的图片数上限（默认检测进程数的 4 倍）')
+    parser.add_argument('--format', default='both', choices=['jsonl', 'csv', 'both'], help='结果格式')
+    parser.add_argument('--annotate', action='store_true', help='保存有缺陷图片的标注图')
+    parser.add_argument('--annotate_all', action='store_true', help='与 --annotate 一起使用，没有缺陷的图片也保存')
+    parser.add_argument('--jpeg_quality', type=int, default=90, help='标注图 JPEG 质量')
+    parser.add_argument('--restart', action='store_true', help='忽略 checkpoint，重新处理全部图片')
+    parser.add_argument('--progress_interval', type=float, default=5.0, help='进度输出间隔（秒）')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.workers < 1:
+        sys.exit('--workers 至少为 1')
+    sys.exit(0 if run(args) else 1)
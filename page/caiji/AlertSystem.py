@@ -5,27 +5,37 @@ import json
 import requests
 from pathlib import Path
 from page.caiji.loggermodel import logger
+from page.dashboard.AlertAnnotate import crop_detection
 
 class AlertSystem:
     """告警系统"""
 
-    def __init__(self, api_endpoint=None, save_dir='alerts'):
+    def __init__(self, api_endpoint=None, save_dir='alerts', save_crops=True, crop_padding=0.25, crop_max_size=256,
+                 crop_quality=85):
         """
         初始化告警系统
         Args:
             api_endpoint: 告警API端点（如果为None则只保存到本地）
             save_dir: 告警信息保存目录
+            save_crops: 是否为每个缺陷保存旋转校正后的小图（images 同级的 crops/ 目录）
+            crop_padding: 缺陷小图每侧留出的背景占框宽高的比例
+            crop_max_size: 缺陷小图最长边（像素）
+            crop_quality: 缺陷小图 JPEG 质量
         """
         self.api_endpoint = api_endpoint
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(exist_ok=True, parents=True)
+        self.save_crops = save_crops
+        self.crop_padding = crop_padding
+        self.crop_max_size = crop_max_size
+        self.crop_quality = crop_quality
 
 
         self.log_file = self.save_dir / 'alerts.log'
 
         logger.info(f"告警系统初始化完成，告警保存到: {self.save_dir}")
 
-    def send_alert(self, camera_info, frame, detections, detection_time):
+    def send_alert(self, camera_info, frame, detections, detection_time, annotated=False, crop_source=None):
         """
         发送告警
         Args:
@@ -33,6 +43,8 @@ class AlertSystem:
             frame: 原始帧
             detections: 检测结果列表
             detection_time: 检测时间
+            annotated: frame 是否已烧录检测框（否则仪表板按 detections 叠加显示）
+            crop_source: 截取缺陷小图用的未标注原图，为空时使用 frame
         """
         alert_id = f"{camera_info['camera_id']}_{detection_time.strftime('%Y%m%d_%H%M%S_%f')[:-3]}"
 
@@ -43,7 +55,10 @@ class AlertSystem:
             'camera_name': camera_info['camera_name'],
             'detection_time': detection_time.isoformat(),
             'detections': detections,
-            'detection_count': len(detections)
+            'detection_count': len(detections),
+            'image_width': int(frame.shape[1]),
+            'image_height': int(frame.shape[0]),
+            'image_annotated': bool(annotated)
         }
 
         # 保存告警图片（返回路径信息）
@@ -51,6 +66,11 @@ class AlertSystem:
         alert_info['image_path'] = str(paths['image_path'])
         alert_info['relative_path'] = paths['relative_path']
 
+        # 保存缺陷小图（仪表板缺陷视图只加载小图，不必下载整幅告警图片）
+        if self.save_crops:
+            alert_info['crops'] = self._save_crops(alert_id, crop_source if crop_source is not None else frame,
+                                                   detections, paths['crop_dir'])
+
         # 保存JSON告警信息
         json_paths = self._save_alert_json(alert_id, alert_info, camera_info['camera_id'], detection_time)
         alert_info['json_path'] = str(json_paths['json_path'])
@@ -82,6 +102,27 @@ class AlertSystem:
 
         return paths
 
+    def _save_crops(self, alert_id, frame, detections, crop_dir):
+        """
+        按检测框截取并保存缺陷小图
+        Returns:
+            与 detections 一一对应的小图信息 [{filename, width, height, box}, ...]；截取失败的项为 None
+        """
+        crops = []
+        for index, det in enumerate(detections):
+            try:
+                crop, box = crop_detection(frame, det, padding=self.crop_padding, max_size=self.crop_max_size)
+                filename = f"{alert_id}_{index}.jpg"
+                crop_dir.mkdir(parents=True, exist_ok=True)
+                if not cv2.imwrite(str(crop_dir / filename), crop, [cv2.IMWRITE_JPEG_QUALITY, self.crop_quality]):
+                    raise IOError('写入失败')
+                crops.append({'filename': filename, 'width': int(crop.shape[1]), 'height': int(crop.shape[0]),
+                              'box': box})
+            except Exception as e:
+                logger.error(f"保存缺陷小图失败 {alert_id} #{index}: {e}")
+                crops.append(None)
+        return crops
+
     def _save_alert_json(self, alert_id, alert_info, camera_id, detection_time):
         """保存JSON告警信息到分层目录"""
         paths = self._get_alert_paths(alert_id, camera_id, detection_time)
@@ -95,9 +136,14 @@ class AlertSystem:
             'detection_time': alert_info['detection_time'],
             'detections': alert_info['detections'],
             'detection_count': alert_info['detection_count'],
+            'image_width': alert_info['image_width'],
+            'image_height': alert_info['image_height'],
+            'image_annotated': alert_info['image_annotated'],
             'image_filename': f"{alert_id}.jpg",
             'relative_path': paths['relative_path']  # 添加相对路径
         }
+        if 'crops' in alert_info:
+            alert_info_for_json['crops'] = alert_info['crops']  # 缺陷小图，文件位于 relative_path/crops/
 
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(alert_info_for_json, f, ensure_ascii=False, indent=2)
@@ -131,6 +177,13 @@ class AlertSystem:
                 'image': (f"{alert_info['alert_id']}.jpg", image_data, 'image/jpeg')
             }
 
+            # 缺陷小图一并上传（字段名 crop_<序号>），仪表板保存到自己的 crops/ 目录
+            crop_dir = Path(image_path).parent.parent / 'crops'
+            for index, crop in enumerate(alert_info.get('crops') or []):
+                crop_path = crop_dir / crop['filename'] if crop else None
+                if crop_path is not None and crop_path.exists():
+                    files[f'crop_{index}'] = (crop['filename'], crop_path.read_bytes(), 'image/jpeg')
+
             data = {
                 'alert_info': json.dumps(alert_info, ensure_ascii=False)
             }
@@ -176,6 +229,7 @@ class AlertSystem:
         return {
             'image_dir': image_dir,
             'json_dir': json_dir,
+            'crop_dir': self.save_dir / date_path / 'crops',  # 有缺陷小图时才创建
             'image_path': image_dir / f"{alert_id}.jpg",
             'json_path': json_dir / f"{alert_id}.json",
             'relative_path': date_path  # 相对路径，用于前端构建URL
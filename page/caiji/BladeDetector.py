@@ -1,4 +1,5 @@
-import gc
+import threading
+import time
 
 import cv2
 import numpy as np
@@ -7,7 +8,8 @@ from page.caiji.loggermodel import logger
 class BladeDetector:
     """叶片检测器"""
 
-    def __init__(self, seg_weights, det_weights, conf_threshold=0.45, device='0'):
+    def __init__(self, seg_weights, det_weights, conf_threshold=0.45, device='0', annotate=False,
+                 session_options=None, gate_coverage=0.0, gate_size=256, gate_weights=None):
         """
         初始化检测器
         Args:
@@ -15,7 +17,19 @@ class BladeDetector:
             det_weights: 检测模型路径
             conf_threshold: 置信度阈值
             device: 设备ID
+            annotate: 是否把检测框画进返回的图像；默认不画，由仪表板按 detections 叠加显示
+            session_options: ONNX Runtime 会话配置（分片模式下设置线程数和核绑定），为空时使用模型默认配置
+            gate_coverage: 叶片存在性门限，低分辨率分割的叶片像素占比低于该值时跳过完整推理；0 表示不启用
+            gate_size: 门限判断的推理边长（分割模型输入高宽为动态时使用）
+            gate_weights: 独立的小分割模型路径；为空时复用分割模型（要求其输入高宽为动态）
         """
+        self.annotate = annotate
+        self.gate_coverage = gate_coverage
+        self.gate_model = None
+        self.gate_input = None
+        self.gate_lock = threading.Lock()
+        self.gate_stats = {}  # camera_id -> [判断次数, 拒绝次数, 判断耗时]
+
         # 导入检测模块
         try:
             from page.qzhang.BladeDet import YOLOv8OBB
@@ -23,15 +37,20 @@ class BladeDetector:
 
             self.seg_model = DeeplabV3Seg(
                 path=str(seg_weights),
-                device_id=device
+                device_id=device,
+                session_options=session_options
             )
 
             self.det_model = YOLOv8OBB(
                 path=str(det_weights),
                 conf_thres=conf_threshold,
-                device_id=device
+                device_id=device,
+                session_options=session_options
             )
 
+            if gate_coverage > 0:
+                self._init_gate(gate_size, gate_weights, device, session_options, DeeplabV3Seg)
+
             logger.info("检测模型加载成功")
 
         except ImportError as e:
@@ -41,6 +60,86 @@ class BladeDetector:
             logger.error(f"加载检测模型失败: {e}")
             raise
 
+    def _init_gate(self, gate_size, gate_weights, device, session_options, seg_class):
+        """准备门限模型和输入缓冲区；没有可用的低分辨率模型时不启用门限"""
+        if gate_weights:
+            model = seg_class(path=str(gate_weights), device_id=device, session_options=session_options)
+        else:
+            model = self.seg_model
+
+        if model.dynamic_size:
+            size = (gate_size, gate_size)
+        elif gate_weights:
+            size = model.input_size
+        else:
+            logger.warning("分割模型输入尺寸固定，无法低分辨率推理；请配置 gate_weights，叶片存在性门限未启用")
+            return
+
+        self.gate_model = model
+        self.gate_input = np.empty((1, 3, size[1], size[0]), dtype=np.float32)
+        logger.info(f"叶片存在性门限启用: {size[0]}x{size[1]}，覆盖率阈值 {self.gate_coverage}")
+
+    @property
+    def gate_enabled(self):
+        return self.gate_model is not None
+
+    def check_gate(self, image, camera_id=None):
+        """
+        低分辨率判断画面中是否有足够的叶片，记录各相机的门限统计
+        Args:
+            image: 输入图像
+            camera_id: 统计归属的相机ID
+        Returns:
+            True 表示需要完整检测；未启用门限或判断出错时总是返回 True
+        """
+        if self.gate_model is None:
+            return True
+
+        start = time.perf_counter()
+        try:
+            coverage = self.gate_model.blade_coverage(image, self.gate_input.shape[:1:-1], self.gate_input)
+        except Exception as e:
+            logger.error(f"叶片存在性判断出错: {e}")
+            return True
+        passed = coverage >= self.gate_coverage
+        elapsed = time.perf_counter() - start
+
+        with self.gate_lock:
+            stats = self.gate_stats.setdefault(camera_id, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += 0 if passed else 1
+            stats[2] += elapsed
+        return passed
+
+    def get_gate_stats(self):
+        """各相机的门限原始计数 camera_id -> [判断次数, 拒绝次数, 判断耗时]"""
+        with self.gate_lock:
+            return {camera_id: list(stats) for camera_id, stats in self.gate_stats.items()}
+
+    @staticmethod
+    def summarize_gate_stats(raw_stats):
+        """
+        门限原始计数转换为统计报告（多个检测器的计数可先按相机相加再汇总）
+        Returns:
+            {'checked', 'rejected', 'reject_rate', 'cameras': {camera_id: {...}}}
+        """
+        cameras = {}
+        for camera_id, (checked, rejected, seconds) in raw_stats.items():
+            cameras[camera_id] = {
+                'checked': checked,
+                'rejected': rejected,
+                'reject_rate': round(rejected / checked, 4) if checked else 0,
+                'avg_ms': round(seconds / checked * 1000, 2) if checked else 0
+            }
+        checked = sum(stats['checked'] for stats in cameras.values())
+        rejected = sum(stats['rejected'] for stats in cameras.values())
+        return {
+            'checked': checked,
+            'rejected': rejected,
+            'reject_rate': round(rejected / checked, 4) if checked else 0,
+            'cameras': cameras
+        }
+
     def detect(self, image):
         """
         执行叶片检测
@@ -49,65 +148,151 @@ class BladeDetector:
         Returns:
             detection_results: 检测结果列表
             seg_image: 分割后的图像
-            annotated_image: 标注后的图像
+            annotated_image: 标注后的图像（未开启 annotate 或没有检测结果时就是输入图像本身，调用方不应修改）
         """
         try:
             # 记录原始尺寸
             orig_height, orig_width = image.shape[:2]
-            rimg = image.copy()
 
             # 叶片分割提取
             seg_img = self.seg_model.predict(image)
 
             # 叶片缺陷检测
             results = self.det_model.detect(seg_img)
+            if len(results) == 0:
+                return [], seg_img, image
 
-            detections = []
-
-            if len(results) > 0:
-                for res in results:
-                    ((x_center, y_center), (width, height), r) = res['bbox']
-
-                    # 缺陷位置缩放到原图位置
-                    scale_x = orig_width / 1024.0
-                    scale_y = orig_height / 1024.0
-
-                    x_center = float(x_center) * scale_x
-                    y_center = float(y_center) * scale_y
-                    width = float(width) * scale_x
-                    height = float(height) * scale_y
-
-                    # 构建检测结果
-                    detection = {
-                        "clsId": int(res['class']),
-                        "name": res['name'],
-                        "conf": float(res['score']),
-                        "x": float(x_center),
-                        "y": float(y_center),
-                        "w": float(width),
-                        "h": float(height),
-                        "r": float(r)
-                    }
-                    detections.append(detection)
-
-                    # 在原图上绘制
-                    bbox = ((x_center, y_center), (width, height), r)
-                    points = cv2.boxPoints(bbox)
-                    points = points.astype(np.int_)
-
-                    # 绘制旋转矩形框
-                    cv2.polylines(rimg, [points], isClosed=True, color=(255, 0, 0), thickness=2)
-
-                    # 添加标签
-                    cv2.putText(rimg, '{0} {1:.2f}'.format(res['name'], res['score']), (points[0][0], points[0][1]),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-
-            return detections, seg_img, rimg
+            detections = self.to_detections(results, orig_width, orig_height)
+
+            if not self.annotate:
+                return detections, seg_img, image
+
+            return detections, seg_img, self.draw(image, detections)
         except Exception as e:
             logger.error(f"检测过程中出错: {e}")
             return [], None, image
-        finally:
-            del image
-            del seg_img
-            del results
-            gc.collect()
\ No newline at end of file
+
+    @staticmethod
+    def to_detections(results, orig_width, orig_height):
+        """
+        检测模型输出（1024 输入坐标）转换为原图坐标的检测结果
+        Args:
+            results: det_model.detect/postprocess 返回的旋转框列表
+            orig_width: 原图宽度
+            orig_height: 原图高度
+        Returns:
+            检测结果列表
+        """
+        # 缺陷位置缩放到原图位置
+        scale_x = orig_width / 1024.0
+        scale_y = orig_height / 1024.0
+
+        detections = []
+        for res in results:
+            ((x_center, y_center), (width, height), r) = res['bbox']
+
+            # 构建检测结果（旋转框几何：中心点、宽高、角度（度），与 cv2.boxPoints 约定一致）
+            detections.append({
+                "clsId": int(res['class']),
+                "name": res['name'],
+                "conf": float(res['score']),
+                "x": float(x_center) * scale_x,
+                "y": float(y_center) * scale_y,
+                "w": float(width) * scale_x,
+                "h": float(height) * scale_y,
+                "r": float(r)
+            })
+        return detections
+
+    @staticmethod
+    def draw(image, detections):
+        """
+        在原图副本上绘制旋转框和标签（烧录标注，仅在 annotate 开启时使用）
+        Args:
+            image: 原始图像
+            detections: detect 返回的检测结果列表
+        Returns:
+            标注后的图像副本
+        """
+        rimg = image.copy()
+        for det in detections:
+            bbox = ((det['x'], det['y']), (det['w'], det['h']), det['r'])
+            points = cv2.boxPoints(bbox).astype(np.int_)
+
+            # 绘制旋转矩形框
+            cv2.polylines(rimg, [points], isClosed=True, color=(255, 0, 0), thickness=2)
+
+            # 添加标签
+            cv2.putText(rimg, '{0} {1:.2f}'.format(det['name'], det['conf']), (points[0][0], points[0][1]),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        return rimg
+
+
+if __name__ == '__main__':
+    # 内存浸泡测试：预热后连续检测，比较 tracemalloc 快照，确认不调用 gc.collect() 时内存保持平稳
+    # 分别在 annotate 关闭和开启时测试；指定图片时使用真实图片（模型应能检出缺陷），
+    # 否则使用随机噪声帧并让检测模型固定返回几个框，保证坐标换算和标注绘制路径都被执行
+    # 用法: python -m page.caiji.BladeDetector [帧数] [允许增长 KB] [图片路径]
+    import json
+    import sys
+    import tracemalloc
+
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    limit_kb = float(sys.argv[2]) if len(sys.argv) > 2 else 512
+    image_path = sys.argv[3] if len(sys.argv) > 3 else None
+
+    with open('./conf/config.json', encoding='utf-8') as f:
+        config = json.load(f)
+    detector = BladeDetector(config['seg_weights'], config['det_weights'],
+                             config.get('conf_threshold', 0.45), config.get('device', '0'))
+
+    if image_path:
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"无法读取图片: {image_path}")
+            sys.exit(1)
+        frame_pool = [image]
+    else:
+        rng = np.random.default_rng(0)
+        frame_pool = [rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8) for _ in range(4)]
+
+        # 与 YOLOv8OBB.detect 返回格式相同的固定结果（1024 输入坐标），每次返回新的列表和字典
+        def fake_detect(seg_img):
+            return [{'bbox': ((300.0 + 100 * i, 400.0), (80.0, 30.0), 15.0 * i), 'class': i % 2,
+                     'name': ('crack', 'erosion')[i % 2], 'score': 0.9 - 0.1 * i} for i in range(3)]
+        detector.det_model.detect = fake_detect
+
+    def run(count):
+        found = 0
+        for i in range(count):
+            detections, _, _ = detector.detect(frame_pool[i % len(frame_pool)])
+            found += len(detections)
+        return found
+
+    failed = False
+    for annotate in (False, True):
+        detector.annotate = annotate
+        # 预热：建立缓冲区和 ONNX Runtime 内部缓存
+        run(50)
+        tracemalloc.start(10)
+        baseline = tracemalloc.take_snapshot()
+        found = run(frames)
+        current = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        stats = current.compare_to(baseline, 'lineno')
+        growth = sum(stat.size_diff for stat in stats) / 1024
+        print(f"annotate={annotate}: {frames} 帧共 {found} 个检测结果，Python 堆增长 {growth:.1f} KB（上限 {limit_kb} KB）")
+        for stat in stats[:10]:
+            print(stat)
+
+        if found == 0:
+            print("没有检测结果，检测后处理和标注路径未被测试")
+            failed = True
+        if growth > limit_kb:
+            print("内存持续增长，浸泡测试失败")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print("浸泡测试通过")
@@ -1,51 +1,199 @@
 import cv2
+import os
 import time
 import json
+import random
 import threading
 import queue
 from datetime import datetime
+from page.caiji.FFmpegCapture import FFmpegCapture
 from page.caiji.loggermodel import logger
 
+# ffmpeg 环形缓冲比帧队列多的帧数，队列中的帧不会被覆盖
+RING_EXTRA_FRAMES = 4
+
+
 class CameraManager:
     """相机管理器"""
 
-    def __init__(self, config_file='factory.json'):
+    # 运行时字段，比较配置差异时忽略
+    RUNTIME_FIELDS = ('reconnect_attempts',)
+
+    def __init__(self, config_file='factory.json', queue_size=30, max_concurrent_connects=8,
+                 startup_spread=10.0, reconnect_max_delay=120.0, open_timeout=10.0, read_timeout=10.0,
+                 overrides_file=None):
         """
         初始化相机管理器
         Args:
             config_file: 相机配置文件路径
+            queue_size: 每路相机的帧队列长度（满时丢弃最旧的帧）
+            max_concurrent_connects: 同时进行的连接尝试上限，避免重连风暴耗尽连接和CPU
+            startup_spread: 启动全部相机时把首次连接随机分散到该时间窗口内（秒）
+            reconnect_max_delay: 重连退避的最大等待时间（秒）
+            open_timeout: OpenCV 打开流的超时时间（秒）
+            read_timeout: OpenCV 读取一帧的超时时间（秒），保证停止相机时采集线程能及时退出
+            overrides_file: 含 camera_overrides（camera_id -> 覆盖字段）的配置文件，如 conf/config.json
         """
+        self.config_file = config_file
+        self.overrides_file = overrides_file
+        self.queue_size = queue_size
+        self.queue_limit = queue_size  # 当前生效的队列长度（内存紧张时由 MemoryGovernor 调小）
+        self.startup_spread = startup_spread
+        self.reconnect_max_delay = reconnect_max_delay
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+
         self.cameras = self.load_camera_config(config_file)
-        self.camera_threads = {}
+        self.camera_threads = {}   # camera_id -> (线程, 停止事件)
         self.camera_status = {}
         self.frame_queues = {}
+        self.captures = {}         # camera_id -> 当前采集对象
+        self.latest_frames = {}    # camera_id -> 最新一帧的 frame_info（实时预览读取，不占用检测的帧队列）
+        self.frame_bytes = {}      # camera_id -> 单帧字节数（内存统计用）
         self.lock = threading.Lock()
 
+        # 连接并发限制
+        self.connect_slots = threading.BoundedSemaphore(max(1, max_concurrent_connects))
+        self.connecting = 0
+        self.max_connecting = 0
+
+        # 配置热加载
+        self.started = False
+        self.reload_lock = threading.Lock()
+        self.change_listeners = []
+        self.watch_thread = None
+        self.watch_stop = threading.Event()
+
     def load_camera_config(self, config_file):
         """加载相机配置"""
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                cameras = json.load(f)
-
+            cameras = self._parse_camera_config(config_file)
             logger.info(f"成功加载 {len(cameras)} 个相机配置")
-
-            # 验证配置
-            valid_cameras = []
-            for cam in cameras:
-                required_fields = ['camera_id', 'rtsp_url', 'camera_name']
-                if all(field in cam for field in required_fields):
-                    cam['reconnect_attempts'] = 0
-                    cam['max_reconnect_attempts'] = 5
-                    cam['reconnect_delay'] = 5  # 重连延迟秒数
-                    valid_cameras.append(cam)
-                else:
-                    logger.warning(f"相机配置缺少必要字段: {cam.get('camera_id', 'unknown')}")
-
-            return valid_cameras
+            return cameras
         except Exception as e:
             logger.error(f"加载相机配置失败: {e}")
             return []
 
+    def _parse_camera_config(self, config_file):
+        """
+        读取相机列表并合并单相机覆盖配置
+        Raises:
+            OSError, ValueError: 文件无法读取或不是合法的 JSON
+        """
+        with open(config_file, 'r', encoding='utf-8') as f:
+            cameras = json.load(f)
+
+        overrides = {}
+        if self.overrides_file and os.path.exists(self.overrides_file):
+            with open(self.overrides_file, 'r', encoding='utf-8') as f:
+                overrides = json.load(f).get('camera_overrides') or {}
+
+        # 验证配置
+        valid_cameras = []
+        for cam in cameras:
+            required_fields = ['camera_id', 'rtsp_url', 'camera_name']
+            if all(field in cam for field in required_fields):
+                cam.update(overrides.get(cam['camera_id'], {}))
+                cam['reconnect_attempts'] = 0
+                cam.setdefault('max_reconnect_attempts', 5)  # 0 表示不限次数
+                cam.setdefault('reconnect_delay', 5)  # 重连基础延迟秒数，之后按指数退避
+                valid_cameras.append(cam)
+            else:
+                logger.warning(f"相机配置缺少必要字段: {cam.get('camera_id', 'unknown')}")
+
+        return valid_cameras
+
+    def add_change_listener(self, callback):
+        """注册相机列表变化回调 callback(changes)，changes 含 added/removed/changed 三个相机ID列表"""
+        self.change_listeners.append(callback)
+
+    def _config_of(self, camera):
+        return {key: value for key, value in camera.items() if key not in self.RUNTIME_FIELDS}
+
+    def reload(self):
+        """
+        重新读取相机配置并应用差异：启动新增相机、停止已删除相机、重连配置有变化的相机，
+        其余相机的采集线程和帧队列不受影响
+        Returns:
+            {'added': [...], 'removed': [...], 'changed': [...]}；配置读取失败时返回 None（保持当前配置）
+        """
+        with self.reload_lock:
+            try:
+                new_cameras = self._parse_camera_config(self.config_file)
+            except Exception as e:
+                logger.error(f"重新加载相机配置失败，保持当前配置: {e}")
+                return None
+
+            old = {cam['camera_id']: cam for cam in self.cameras}
+            new = {cam['camera_id']: cam for cam in new_cameras}
+            changes = {
+                'added': [cid for cid in new if cid not in old],
+                'removed': [cid for cid in old if cid not in new],
+                'changed': [cid for cid in new if cid in old and self._config_of(old[cid]) != self._config_of(new[cid])]
+            }
+            if not any(changes.values()):
+                return changes
+
+            # 先停掉删除和变化的相机，再整体替换相机列表（检测线程遍历的是旧列表的引用，无需加锁）
+            stopping = changes['removed'] + changes['changed']
+            self._signal_stop(stopping)
+            self._join(stopping)
+            self.cameras = [new[cid] if cid in changes['changed'] or cid not in old else old[cid] for cid in new]
+
+            for camera_id in changes['removed']:
+                self.frame_queues.pop(camera_id, None)
+                self.camera_status.pop(camera_id, None)
+
+            if self.started:
+                for camera_id in changes['added'] + changes['changed']:
+                    self.start_camera(new[camera_id], initial_delay=random.uniform(0, self.startup_spread))
+
+            logger.info(f"相机配置已更新: 新增 {changes['added']}, 删除 {changes['removed']}, 变更 {changes['changed']}")
+
+        for callback in self.change_listeners:
+            try:
+                callback(changes)
+            except Exception as e:
+                logger.error(f"相机配置变化回调出错: {e}")
+        return changes
+
+    def _config_mtimes(self):
+        mtimes = []
+        for path in (self.config_file, self.overrides_file):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def start_watching(self, interval=5.0):
+        """
+        定时检查相机配置文件和覆盖配置文件的修改时间，有变化时自动 reload
+        Args:
+            interval: 检查间隔（秒）
+        """
+        if self.watch_thread and self.watch_thread.is_alive():
+            return
+        self.watch_stop.clear()
+        self.watch_thread = threading.Thread(target=self._watch_worker, args=(interval,),
+                                             name="CameraConfigWatcher", daemon=True)
+        self.watch_thread.start()
+        logger.info(f"开始监视相机配置: {self.config_file}，间隔 {interval} 秒")
+
+    def stop_watching(self):
+        self.watch_stop.set()
+        if self.watch_thread:
+            self.watch_thread.join(timeout=2.0)
+            self.watch_thread = None
+
+    def _watch_worker(self, interval):
+        last = self._config_mtimes()
+        while not self.watch_stop.wait(interval):
+            current = self._config_mtimes()
+            if current != last:
+                last = current
+                self.reload()
+
     def get_camera_by_id(self, camera_id):
         """根据ID获取相机配置"""
         for cam in self.cameras:
@@ -54,159 +202,443 @@ class CameraManager:
         return None
 
     def start_all_cameras(self):
-        """启动所有相机"""
+        """启动所有相机（首次连接在 startup_spread 秒内随机错开）"""
+        self.started = True
         for camera in self.cameras:
-            self.start_camera(camera)
+            self.start_camera(camera, initial_delay=random.uniform(0, self.startup_spread))
 
-    def start_camera(self, camera):
-        """启动单个相机"""
+    def start_camera(self, camera, initial_delay=0.0):
+        """
+        启动单个相机
+        Args:
+            camera: 相机配置
+            initial_delay: 首次连接前的等待时间（秒）
+        """
         camera_id = camera['camera_id']
 
-        if camera_id in self.camera_threads:
-            logger.warning(f"相机 {camera_id} 已经在运行")
-            return False
-
-        # 创建帧队列
-        self.frame_queues[camera_id] = queue.Queue(maxsize=30)
-
-        # 创建并启动线程
-        thread = threading.Thread(
-            target=self._camera_worker,
-            args=(camera,),
-            name=f"Camera-{camera_id}",
-            daemon=True
-        )
-
-        self.camera_threads[camera_id] = thread
-        self.camera_status[camera_id] = 'starting'
-        thread.start()
+        with self.lock:
+            entry = self.camera_threads.get(camera_id)
+            if entry and entry[0].is_alive():
+                logger.warning(f"相机 {camera_id} 已经在运行")
+                return False
+
+            # 创建帧队列
+            self.frame_queues[camera_id] = queue.Queue(maxsize=self.queue_limit)
+
+            # 创建并启动线程
+            stop_event = threading.Event()
+            thread = threading.Thread(
+                target=self._camera_worker,
+                args=(camera, stop_event, initial_delay),
+                name=f"Camera-{camera_id}",
+                daemon=True
+            )
+
+            self.camera_threads[camera_id] = (thread, stop_event)
+            self.camera_status[camera_id] = 'starting'
+            camera['reconnect_attempts'] = 0
+            thread.start()
 
         logger.info(f"启动相机 {camera['camera_name']} ({camera_id})")
         return True
 
-    def _camera_worker(self, camera):
-        """相机工作线程"""
-        camera_id = camera['camera_id']
+    def restart_camera(self, camera_id, max_delay=None):
+        """
+        重启相机（停止并等待线程退出后重新启动）
+        Args:
+            camera_id: 相机ID
+            max_delay: 重新连接前的随机等待上限（秒），批量重启时避免同时连接
+        """
+        camera = self.get_camera_by_id(camera_id)
+        if camera is None:
+            return False
+        self.stop_camera(camera_id)
+        delay = random.uniform(0, self.startup_spread if max_delay is None else max_delay)
+        return self.start_camera(camera, initial_delay=delay)
+
+    def _open_capture(self, camera):
+        """
+        按相机配置创建采集对象
+        capture_backend 为 'ffmpeg' 时使用 ffmpeg 子进程，在解码端按 capture_fps、capture_width/capture_height
+        降帧率和缩放；否则使用 cv2.VideoCapture（原分辨率、原帧率解码）
+        """
         rtsp_url = camera['rtsp_url']
-        cap = None
+        if camera.get('capture_backend', 'opencv') == 'ffmpeg':
+            return FFmpegCapture(
+                rtsp_url,
+                fps=camera.get('capture_fps'),
+                width=camera.get('capture_width'),
+                height=camera.get('capture_height'),
+                ring_size=self.frame_queues[camera['camera_id']].maxsize + RING_EXTRA_FRAMES,
+                loop=camera.get('capture_loop', False),
+                realtime=camera.get('capture_realtime', False),
+                hwaccel=camera.get('ffmpeg_hwaccel')
+            )
+
+        # 设置OpenCV RTSP参数；打开和读取设置超时，断流时 read 不会无限阻塞
+        params = []
+        if hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):
+            params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(self.open_timeout * 1000),
+                      cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(self.read_timeout * 1000)]
+        cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG, params) if params else cv2.VideoCapture(rtsp_url)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        cap.set(cv2.CAP_PROP_FPS, 10)
+        return cap
+
+    def _connect(self, camera, stop_event):
+        """
+        在连接并发限制内打开相机并读取第一帧
+        Returns:
+            (cap, frame)；停止时返回 (None, None)
+        Raises:
+            ConnectionError: 无法打开或读取
+        """
+        camera_id = camera['camera_id']
+        while not self.connect_slots.acquire(timeout=0.5):
+            if stop_event.is_set():
+                return None, None
 
-        while True:
+        cap = None
+        try:
+            with self.lock:
+                self.connecting += 1
+                self.max_connecting = max(self.max_connecting, self.connecting)
+            if stop_event.is_set():
+                return None, None
+
+            self.camera_status[camera_id] = 'connecting'
+            logger.info(f"相机 {camera_id} 正在连接...")
+            cap = self._open_capture(camera)
+            self.captures[camera_id] = cap
+            if not cap.isOpened():
+                raise ConnectionError(f"无法打开RTSP流: {camera['rtsp_url']}")
+
+            ret, frame = cap.read()
+            if not ret:
+                raise ConnectionError(f"无法读取首帧: {camera['rtsp_url']}")
+            return cap, frame
+        except Exception:
+            if cap is not None:
+                cap.release()
+            self.captures.pop(camera_id, None)
+            raise
+        finally:
+            with self.lock:
+                self.connecting -= 1
+            self.connect_slots.release()
+
+    def _backoff_delay(self, camera):
+        """指数退避加随机抖动：base * 2^(n-1)，封顶后在 [一半, 全部] 之间随机"""
+        delay = min(self.reconnect_max_delay, camera['reconnect_delay'] * 2 ** (camera['reconnect_attempts'] - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _put_frame(self, camera, frame):
+        """帧放入队列，队列满时丢弃最旧的帧"""
+        frame_queue = self.frame_queues[camera['camera_id']]
+        if frame_queue.full():
             try:
-                # 尝试连接RTSP流
-                logger.info(f"相机 {camera_id} 正在连接...")
+                frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+        # 添加时间戳（read 每次返回新数组或未被引用的缓冲槽，无需再复制）
+        frame_info = {
+            'camera_id': camera['camera_id'],
+            'frame': frame,
+            'timestamp': datetime.now(),
+            'camera_info': camera
+        }
+        self.latest_frames[camera['camera_id']] = frame_info
+        self.frame_bytes[camera['camera_id']] = frame.nbytes
+        try:
+            frame_queue.put_nowait(frame_info)
+        except queue.Full:
+            pass
+
+    def _camera_worker(self, camera, stop_event, initial_delay=0.0):
+        """相机工作线程（stop_event 置位后在一次读帧超时内退出）"""
+        camera_id = camera['camera_id']
 
-                # 设置OpenCV RTSP参数
-                cap = cv2.VideoCapture(rtsp_url)
-                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                cap.set(cv2.CAP_PROP_FPS, 10)
+        if initial_delay and stop_event.wait(initial_delay):
+            return
 
-                if not cap.isOpened():
-                    raise ConnectionError(f"无法打开RTSP流: {rtsp_url}")
+        while not stop_event.is_set():
+            cap = None
+            try:
+                cap, frame = self._connect(camera, stop_event)
+                if cap is None:
+                    break
 
                 self.camera_status[camera_id] = 'connected'
                 camera['reconnect_attempts'] = 0
                 logger.info(f"相机 {camera_id} 连接成功")
 
                 # 主循环：读取帧
-                while True:
+                while not stop_event.is_set():
+                    self._put_frame(camera, frame)
                     ret, frame = cap.read()
-
                     if not ret:
                         logger.warning(f"相机 {camera_id} 读取帧失败")
                         break
 
-                    # 将帧放入队列
-                    try:
-                        # 如果队列满了，丢弃旧帧
-                        if self.frame_queues[camera_id].full():
-                            try:
-                                self.frame_queues[camera_id].get_nowait()
-                            except queue.Empty:
-                                pass
-
-                        # 添加时间戳
-                        frame_info = {
-                            'camera_id': camera_id,
-                            'frame': frame.copy(),
-                            'timestamp': datetime.now(),
-                            'camera_info': camera
-                        }
-
-                        self.frame_queues[camera_id].put(frame_info, timeout=0.1)
-
-                    except queue.Full:
-                        pass
-                    except Exception as e:
-                        logger.error(f"处理帧队列时出错: {e}")
-
             except Exception as e:
-                logger.error(f"相机 {camera_id} 错误: {e}")
-
-                # 更新状态
-                self.camera_status[camera_id] = 'error'
-
-                # 清理资源
-                if cap:
-                    cap.release()
-
-                # 检查重连次数
-                if camera['reconnect_attempts'] < camera['max_reconnect_attempts']:
-                    camera['reconnect_attempts'] += 1
-                    delay = camera['reconnect_delay'] * camera['reconnect_attempts']
-                    logger.info(f"相机 {camera_id} {delay}秒后尝试重连 (尝试 {camera['reconnect_attempts']}/{camera['max_reconnect_attempts']})")
-                    time.sleep(delay)
-                else:
-                    logger.error(f"相机 {camera_id} 达到最大重连次数，停止尝试")
-                    break
+                if not stop_event.is_set():
+                    logger.error(f"相机 {camera_id} 错误: {e}")
             finally:
                 if cap:
                     cap.release()
+                if self.captures.get(camera_id) is cap:
+                    self.captures.pop(camera_id, None)
+
+            if stop_event.is_set():
+                break
+
+            # 更新状态
+            self.camera_status[camera_id] = 'error'
+
+            # 检查重连次数
+            camera['reconnect_attempts'] += 1
+            max_attempts = camera['max_reconnect_attempts']
+            if max_attempts and camera['reconnect_attempts'] > max_attempts:
+                self.camera_status[camera_id] = 'failed'
+                logger.error(f"相机 {camera_id} 达到最大重连次数，停止尝试")
+                return
+
+            delay = self._backoff_delay(camera)
+            # 等待时间每次不同，按相机限流
+            logger.info(f"相机 {camera_id} {delay:.1f}秒后尝试重连 "
+                        f"(尝试 {camera['reconnect_attempts']}/{max_attempts or '∞'})",
+                        extra={'rate_key': ('reconnect', camera_id)})
+            if stop_event.wait(delay):
+                break
+
+    def stop_camera(self, camera_id, timeout=None):
+        """
+        停止相机并等待采集线程退出
+        Args:
+            camera_id: 相机ID
+            timeout: 等待线程退出的时间（秒），默认比读帧超时稍长
+        """
+        self._signal_stop([camera_id])
+        self._join([camera_id], timeout)
+
+    def _signal_stop(self, camera_ids):
+        """通知采集线程停止；ffmpeg 采集直接结束子进程，阻塞中的读帧立即返回"""
+        for camera_id in camera_ids:
+            entry = self.camera_threads.get(camera_id)
+            if entry:
+                entry[1].set()
+            cap = self.captures.get(camera_id)
+            if isinstance(cap, FFmpegCapture):
+                cap.release()
+
+    def _join(self, camera_ids, timeout=None):
+        """等待采集线程退出，清理线程登记和帧队列"""
+        deadline = time.monotonic() + (self.read_timeout + 2 if timeout is None else timeout)
+        for camera_id in camera_ids:
+            with self.lock:
+                entry = self.camera_threads.pop(camera_id, None)
+            if not entry:
+                continue
+
+            thread, _ = entry
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                logger.warning(f"相机 {camera_id} 采集线程未能按时退出")
 
-    def stop_camera(self, camera_id):
-        """停止相机"""
-        if camera_id in self.camera_threads:
             # 标记为停止
             self.camera_status[camera_id] = 'stopped'
 
             # 清空队列
-            if camera_id in self.frame_queues:
-                while not self.frame_queues[camera_id].empty():
-                    try:
-                        self.frame_queues[camera_id].get_nowait()
-                    except:
-                        break
+            self.latest_frames.pop(camera_id, None)
+            self.frame_bytes.pop(camera_id, None)
+            frame_queue = self.frame_queues.get(camera_id)
+            while frame_queue is not None:
+                try:
+                    frame_queue.get_nowait()
+                except queue.Empty:
+                    break
 
             logger.info(f"停止相机 {camera_id}")
 
     def stop_all_cameras(self):
-        """停止所有相机"""
-        for camera_id in list(self.camera_threads.keys()):
-            self.stop_camera(camera_id)
+        """停止所有相机（先全部通知再统一等待，总耗时不随相机数量增长）"""
+        self.stop_watching()
+        self.started = False
+        camera_ids = list(self.camera_threads.keys())
+        self._signal_stop(camera_ids)
+        self._join(camera_ids)
 
     def get_frame(self, camera_id, timeout=1.0):
-        """从相机获取一帧"""
+        """从相机获取一帧（timeout 为 0 时不等待）"""
         try:
-            if camera_id not in self.frame_queues:
+            frame_queue = self.frame_queues.get(camera_id)
+            if frame_queue is None:
                 return None
 
-            return self.frame_queues[camera_id].get(timeout=timeout)
+            if timeout <= 0:
+                return frame_queue.get_nowait()
+            return frame_queue.get(timeout=timeout)
         except queue.Empty:
             return None
         except Exception as e:
             logger.error(f"获取帧失败: {e}")
             return None
 
+    def set_queue_limit(self, limit):
+        """
+        调整所有帧队列的长度，超出部分丢弃最旧的帧；ffmpeg 采集的环形缓冲区同步调整
+        Args:
+            limit: 新的队列长度（不超过初始化时的 queue_size）
+        Returns:
+            丢弃的帧数
+        """
+        limit = max(1, min(int(limit), self.queue_size))
+        self.queue_limit = limit
+        dropped = 0
+        for frame_queue in list(self.frame_queues.values()):
+            # Queue 在 put/full 时读取 maxsize，运行中修改即可生效
+            frame_queue.maxsize = limit
+            while frame_queue.qsize() > limit:
+                try:
+                    frame_queue.get_nowait()
+                    dropped += 1
+                except queue.Empty:
+                    break
+        for cap in list(self.captures.values()):
+            if isinstance(cap, FFmpegCapture):
+                cap.resize_ring(limit + RING_EXTRA_FRAMES)
+        return dropped
+
+    def memory_usage(self):
+        """
+        帧缓冲占用的内存估算（字节）
+        Returns:
+            {'frame_queues': 队列中的帧, 'capture_buffers': ffmpeg 采集环形缓冲区}；
+            ffmpeg 相机队列中的帧大多就是环形缓冲槽，两项相加是偏保守的上限
+        """
+        queued = sum(frame_queue.qsize() * self.frame_bytes.get(camera_id, 0)
+                     for camera_id, frame_queue in list(self.frame_queues.items()))
+        rings = sum(len(cap.ring) * cap.frame_bytes for cap in list(self.captures.values())
+                    if isinstance(cap, FFmpegCapture))
+        return {'frame_queues': queued, 'capture_buffers': rings}
+
+    def frame_slot_bytes(self):
+        """所有相机各一帧的字节数之和（队列长度每加 1，最坏情况增加的内存）"""
+        return sum(self.frame_bytes.get(camera_id, 0) for camera_id in list(self.frame_queues))
+
+    def capture_slot_bytes(self):
+        """ffmpeg 相机各一帧的字节数之和（队列长度每加 1，环形缓冲区增加的内存）"""
+        return sum(cap.frame_bytes for cap in list(self.captures.values()) if isinstance(cap, FFmpegCapture))
+
+    def wait_for_cameras(self, timeout=30.0, poll_interval=0.5):
+        """
+        等待所有相机完成首次连接尝试（已连接、进入重连等待或已放弃）
+        Args:
+            timeout: 最长等待时间（秒）
+        Returns:
+            已连接的相机数
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = [cam for cam in self.cameras if self.camera_status.get(cam['camera_id']) in ('starting', 'connecting')]
+            if not pending:
+                break
+            time.sleep(poll_interval)
+        return sum(1 for cam in self.cameras if self.camera_status.get(cam['camera_id']) == 'connected')
+
     def get_camera_status(self):
         """获取所有相机状态"""
         status_report = []
         for camera in self.cameras:
             camera_id = camera['camera_id']
+            entry = self.camera_threads.get(camera_id)
+            frame_queue = self.frame_queues.get(camera_id)
             status = {
                 'camera_id': camera_id,
                 'camera_name': camera['camera_name'],
                 'status': self.camera_status.get(camera_id, 'unknown'),
                 'reconnect_attempts': camera['reconnect_attempts'],
-                'queue_size': self.frame_queues.get(camera_id, queue.Queue()).qsize() if camera_id in self.frame_queues else 0
+                'thread_alive': bool(entry and entry[0].is_alive()),
+                'queue_size': frame_queue.qsize() if frame_queue is not None else 0
             }
             status_report.append(status)
-        return status_report
\ No newline at end of file
+        return status_report
+
+
+if __name__ == '__main__':
+    # 规模测试：用合成视频源模拟大量相机（部分连接失败、部分运行中断流），
+    # 检查并发连接上限、退避重连、重启和停止后是否有线程泄漏
+    # 用法: python -m page.caiji.CameraManager [相机数] [运行秒数]
+    import os
+    import sys
+    import tempfile
+
+    import numpy as np
+
+    camera_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    class SyntheticCapture:
+        """合成视频源：连接耗时、连接失败、运行中断流都按概率随机发生"""
+
+        def __init__(self, fps=5, fail_rate=0.2, drop_rate=0.002):
+            time.sleep(random.uniform(0.05, 0.3))
+            self.opened = random.random() > fail_rate
+            self.interval = 1.0 / fps
+            self.drop_rate = drop_rate
+            self.frame = np.zeros((270, 480, 3), dtype=np.uint8)
+
+        def isOpened(self):
+            return self.opened
+
+        def read(self):
+            time.sleep(self.interval)
+            if random.random() < self.drop_rate:
+                return False, None
+            return True, self.frame.copy()
+
+        def set(self, prop_id, value):
+            return False
+
+        def release(self):
+            self.opened = False
+
+    class SyntheticCameraManager(CameraManager):
+        def _open_capture(self, camera):
+            return SyntheticCapture()
+
+    cameras = [{'camera_id': f'S{i:03d}', 'camera_name': f'合成相机{i}', 'rtsp_url': f'synthetic://{i}',
+                'reconnect_delay': 1, 'max_reconnect_attempts': 0} for i in range(camera_count)]
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump(cameras, f)
+
+    baseline_threads = threading.active_count()
+    manager = SyntheticCameraManager(f.name, queue_size=2, max_concurrent_connects=16, startup_spread=5,
+                                     reconnect_max_delay=8)
+    os.unlink(f.name)
+
+    start = time.monotonic()
+    manager.start_all_cameras()
+    while time.monotonic() - start < seconds:
+        time.sleep(5)
+        statuses = [s['status'] for s in manager.get_camera_status()]
+        print(f"{time.monotonic() - start:5.1f}s 已连接 {statuses.count('connected')}/{camera_count}, "
+              f"重连等待 {statuses.count('error')}, 连接中 {manager.connecting}, "
+              f"最大并发连接 {manager.max_connecting}, 线程数 {threading.active_count()}")
+
+    # 批量重启一半相机，旧线程必须退出后才会启动新线程
+    for camera in manager.cameras[::2]:
+        manager.restart_camera(camera['camera_id'], max_delay=2)
+    alive = sum(1 for s in manager.get_camera_status() if s['thread_alive'])
+    print(f"重启后存活采集线程 {alive}/{camera_count}")
+
+    stop_start = time.monotonic()
+    manager.stop_all_cameras()
+    leaked = threading.active_count() - baseline_threads
+    print(f"全部停止耗时 {time.monotonic() - stop_start:.2f}s，残留线程 {leaked}")
+    print(f"最大并发连接 {manager.max_connecting}（上限 16）")
+    if leaked > 0 or manager.max_connecting > 16 or alive > camera_count:
+        print("规模测试失败")
+        sys.exit(1)
+    print("规模测试通过")
@@ -0,0 +1,432 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from page.caiji.loggermodel import logger
+
+
+class BufferPool:
+    """固定数量的预分配数组，各阶段借用后归还，帧在流水线中流动时不再逐帧分配大数组"""
+
+    def __init__(self, shape, dtype, size):
+        self.free = queue.Queue()
+        for _ in range(size):
+            self.free.put(np.empty(shape, dtype=dtype))
+        self.nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize * size
+
+    def acquire(self, running):
+        """借出一个数组；池空时等待下游归还（running() 为假时返回 None）"""
+        while running():
+            try:
+                return self.free.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
+
+    def release(self, buffer):
+        self.free.put(buffer)
+
+
+class FrameJob:
+    """流水线中的一帧：原始帧、调用方上下文和各阶段借用的缓冲区"""
+
+    def __init__(self, frame, context):
+        self.frame = frame
+        self.context = context
+        self.submitted = time.perf_counter()
+        self.busy = 0.0           # 各阶段处理该帧的耗时之和
+        self.buffers = {}         # 名称 -> (缓冲池, 数组)
+        self.seg_outputs = None
+        self.det_outputs = None
+
+    def take(self, name, pool, running):
+        buffer = pool.acquire(running)
+        if buffer is not None:
+            self.buffers[name] = (pool, buffer)
+        return buffer
+
+    def get(self, name):
+        return self.buffers[name][1]
+
+    def drop(self, name):
+        pool, buffer = self.buffers.pop(name)
+        pool.release(buffer)
+
+    def drop_all(self):
+        for name in list(self.buffers):
+            self.drop(name)
+
+
+class PipelineStage:
+    """流水线的一个阶段：从输入队列取帧，处理后放入输出队列（队列满时阻塞，形成背压）"""
+
+    def __init__(self, name, func, input_queue, output_queue, pipeline):
+        self.name = name
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.pipeline = pipeline
+
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"{self.pipeline.name}-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        self.pipeline.bind_cpu()
+        while self.pipeline.running:
+            try:
+                job = self.input_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            start = time.perf_counter()
+            try:
+                ok = self.func(job)
+            except Exception as e:
+                logger.error(f"检测流水线 {self.name} 阶段出错: {e}")
+                ok = False
+                self.errors += 1
+            elapsed = time.perf_counter() - start
+            self.busy_time += elapsed
+            job.busy += elapsed
+
+            if not ok:
+                job.drop_all()
+                self.pipeline.finish(job, failed=True)
+                continue
+
+            self.processed += 1
+            if self.output_queue is None:
+                continue
+            while self.pipeline.running:
+                try:
+                    self.output_queue.put(job, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                job.drop_all()
+
+
+class DetectionPipeline:
+    """
+    检测流水线：预处理 -> 分割 -> 检测 -> 后处理/标注，各阶段独立线程，通过有界队列连接
+    ONNX Runtime 推理期间释放 GIL，相邻帧的各阶段可以重叠执行
+    每帧使用独立的缓冲区（来自缓冲池），各阶段不共享模型对象上的 rimg/input_buffer
+    """
+
+    STAGES = ('preprocess', 'segment', 'detect', 'postprocess')
+
+    def __init__(self, detector, on_result, queue_size=2, name='DetectionPipeline', cpu_affinity=None):
+        """
+        初始化检测流水线
+        Args:
+            detector: BladeDetector 实例（使用其分割、检测模型和 annotate 设置）
+            on_result: 结果回调 on_result(context, detections, seg_img, annotated_img, busy)，在后处理线程中调用；
+                       seg_img 在回调返回后会被复用，需要保留时请复制
+            queue_size: 各阶段之间队列的容量
+            name: 线程名前缀
+            cpu_affinity: 各阶段线程绑定的CPU核集合，为空时不绑定
+        """
+        from page.qzhang.BladeSeg import model_input_w, model_input_h
+
+        self.detector = detector
+        self.seg_model = detector.seg_model
+        self.det_model = detector.det_model
+        self.on_result = on_result
+        self.name = name
+        self.cpu_affinity = cpu_affinity
+        self.queue_size = queue_size
+
+        self.seg_size = (model_input_w, model_input_h)
+        self.det_size = (self.det_model.input_width, self.det_model.input_height)
+
+        # 缓冲池容量 = 可能同时在途的帧数（上下游队列加正在处理的阶段）
+        in_flight = queue_size + 2
+        self.rimg_pool = BufferPool((model_input_h, model_input_w, 3), np.uint8, in_flight)
+        self.seg_input_pool = BufferPool((1, 3, model_input_h, model_input_w), np.float32, in_flight)
+        self.seg_img_pool = BufferPool((model_input_h, model_input_w, 3), np.uint8, 2 * queue_size + 3)
+        self.det_input_pool = BufferPool((1, 3, self.det_size[1], self.det_size[0]), np.float32, in_flight)
+
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in self.STAGES]
+        funcs = (self._preprocess, self._segment, self._detect, self._postprocess)
+        self.stages = [
+            PipelineStage(stage, func, self.queues[i], self.queues[i + 1] if i + 1 < len(self.queues) else None, self)
+            for i, (stage, func) in enumerate(zip(self.STAGES, funcs))
+        ]
+
+        self.stats_lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.start_time = None
+        self.running = False
+
+    def bind_cpu(self):
+        """阶段线程绑定到指定核（Linux 下 pid 0 表示调用线程）"""
+        if self.cpu_affinity and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, self.cpu_affinity)
+            except OSError as e:
+                logger.warning(f"{self.name} 绑定CPU核失败: {e}")
+
+    def start(self):
+        """启动各阶段线程"""
+        self.running = True
+        self.start_time = time.time()
+        for stage in self.stages:
+            stage.start()
+        logger.info(f"检测流水线启动: {self.name}，队列容量 {self.queue_size}")
+
+    def stop(self):
+        """停止各阶段线程，丢弃未完成的帧"""
+        self.running = False
+        for stage in self.stages:
+            if stage.thread:
+                stage.thread.join(timeout=2.0)
+        for q in self.queues:
+            while True:
+                try:
+                    q.get_nowait().drop_all()
+                except queue.Empty:
+                    break
+        logger.info(f"检测流水线停止: {self.name}")
+
+    def submit(self, frame, context=None, block=False, timeout=None):
+        """
+        提交一帧
+        Args:
+            frame: 原始帧（流水线处理完成前调用方不应修改）
+            context: 调用方上下文，原样传给结果回调
+            block: 队列满时是否等待；实时流默认不等待，直接丢弃该帧
+            timeout: 等待超时（秒）
+        Returns:
+            是否已进入流水线
+        """
+        try:
+            self.queues[0].put(FrameJob(frame, context), block=block, timeout=timeout)
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+            return False
+        with self.stats_lock:
+            self.submitted += 1
+        return True
+
+    def finish(self, job, failed=False):
+        with self.stats_lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def _is_running(self):
+        return self.running
+
+    def _preprocess(self, job):
+        """缩放到分割模型输入尺寸并归一化为 NCHW"""
+        rimg = job.take('rimg', self.rimg_pool, self._is_running)
+        seg_input = job.take('seg_input', self.seg_input_pool, self._is_running)
+        if rimg is None or seg_input is None:
+            return False
+
+        cv2.resize(job.frame, self.seg_size, dst=rimg)
+        np.multiply(rimg.transpose(2, 0, 1), np.float32(0.003921568), out=seg_input[0], casting='unsafe')
+        return True
+
+    def _segment(self, job):
+        """分割推理，用掩码抠出叶片，并为检测模型准备输入"""
+        outputs = self.seg_model.session.run(None, {'x': job.get('seg_input')})
+        job.drop('seg_input')
+
+        seg_img = job.take('seg_img', self.seg_img_pool, self._is_running)
+        det_input = job.take('det_input', self.det_input_pool, self._is_running)
+        if seg_img is None or det_input is None:
+            return False
+
+        # 与 DeeplabV3Seg.predict 的 bitwise_and 抠图一致：任意非零类别（叶片各类别）保留原像素，背景置零
+        # seg_img 来自缓冲池，保留着上一帧的内容，需要先清零
+        pred = np.squeeze(outputs[0]).astype(np.uint8, copy=False)
+        seg_img.fill(0)
+        np.copyto(seg_img, job.get('rimg'), where=pred[..., None] != 0)
+        job.drop('rimg')
+
+        if seg_img.shape[1::-1] != self.det_size:
+            # 与 YOLOv8OBB.prepare_input_buffer 相同的 letterbox，postprocess 的 scale_boxes 按其填充换算坐标
+            resized = self.det_model.letterbox(seg_img, [self.det_size[1], self.det_size[0]])
+            np.multiply(resized.transpose(2, 0, 1), np.float32(1 / 255.0), out=det_input[0], casting='unsafe')
+        else:
+            np.multiply(seg_img.transpose(2, 0, 1), np.float32(1 / 255.0), out=det_input[0], casting='unsafe')
+        return True
+
+    def _detect(self, job):
+        """缺陷检测推理"""
+        job.det_outputs = self.det_model.inference(job.get('det_input'))
+        job.drop('det_input')
+        return True
+
+    def _postprocess(self, job):
+        """旋转框解码、缩放到原图坐标、按需烧录标注并回调结果"""
+        seg_img = job.get('seg_img')
+        results = self.det_model.postprocess(job.det_outputs, seg_img.shape)
+
+        orig_height, orig_width = job.frame.shape[:2]
+        detections = self.detector.to_detections(results, orig_width, orig_height) if results else []
+        annotated = job.frame
+        if detections and self.detector.annotate:
+            annotated = self.detector.draw(job.frame, detections)
+
+        try:
+            self.on_result(job.context, detections, seg_img, annotated, job.busy)
+        finally:
+            job.drop_all()
+        self.finish(job)
+        return True
+
+    def memory_usage(self):
+        """缓冲池（预分配、固定）和排队中的原始帧占用的字节数"""
+        pools = sum(pool.nbytes for pool in (self.rimg_pool, self.seg_input_pool, self.seg_img_pool,
+                                             self.det_input_pool))
+        # 队列内部的 deque 只读长度和元素引用，不加锁读取可能略有偏差
+        frames = sum(job.frame.nbytes for q in self.queues for job in list(q.queue))
+        return pools + frames
+
+    def stats(self):
+        """各阶段的处理量、利用率和队列深度；利用率最高的阶段即瓶颈"""
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        stages = []
+        for stage in self.stages:
+            stages.append({
+                'stage': stage.name,
+                'queue_depth': stage.input_queue.qsize(),
+                'queue_size': stage.input_queue.maxsize,
+                'processed': stage.processed,
+                'errors': stage.errors,
+                'busy_seconds': round(stage.busy_time, 3),
+                'utilization': round(stage.busy_time / elapsed, 4) if elapsed > 0 else 0,
+                'avg_ms': round(stage.busy_time / stage.processed * 1000, 2) if stage.processed else 0
+            })
+
+        with self.stats_lock:
+            summary = {
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+        summary['stages'] = stages
+        summary['bottleneck'] = max(stages, key=lambda s: s['utilization'])['stage'] if elapsed > 0 else None
+        return summary
+
+
+if __name__ == '__main__':
+    # 一致性检查：同一批帧分别用 BladeDetector.detect（串行）和流水线处理，比较抠图结果和检测结果
+    # 分割输出改写为 0/1/2 三类（BladeSeg.color_list 有 3 类），覆盖类别 2 的掩码路径；
+    # 同时比较送入检测模型的输入张量，检测模型输入不是方形时 letterbox 的差异也能发现
+    # 用法: python -m page.caiji.DetectionPipeline [图片路径 ...]
+    import json
+    import sys
+
+    from page.caiji.BladeDetector import BladeDetector
+
+    with open('./conf/config.json', encoding='utf-8') as f:
+        config = json.load(f)
+    detector = BladeDetector(config['seg_weights'], config['det_weights'],
+                             config.get('conf_threshold', 0.45), config.get('device', '0'))
+
+    class MultiClassSession:
+        """分割会话包装：叶片像素按列交替标为类别 1、2"""
+
+        def __init__(self, session):
+            self.session = session
+
+        def __getattr__(self, name):
+            return getattr(self.session, name)
+
+        def run(self, names, feeds):
+            outputs = self.session.run(names, feeds)
+            pred = np.asarray(outputs[0])
+            columns = np.arange(pred.shape[-1]) % 2 + 1
+            return [np.where(pred != 0, columns, 0).astype(pred.dtype)] + list(outputs[1:])
+
+    class RecordingSession:
+        """检测会话包装：按调用顺序记录输入张量"""
+
+        def __init__(self, session):
+            self.session = session
+            self.inputs = []
+
+        def __getattr__(self, name):
+            return getattr(self.session, name)
+
+        def run(self, names, feeds):
+            self.inputs.append(np.array(next(iter(feeds.values()))))
+            return self.session.run(names, feeds)
+
+    detector.seg_model.session = MultiClassSession(detector.seg_model.session)
+    detector.det_model.session = RecordingSession(detector.det_model.session)
+
+    if len(sys.argv) > 1:
+        frames = [cv2.imread(path) for path in sys.argv[1:]]
+        frames = [frame for frame in frames if frame is not None]
+    else:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8) for _ in range(6)]
+
+    serial = []
+    for frame in frames:
+        detections, seg_img, _ = detector.detect(frame)
+        serial.append((detections, seg_img.copy(), detector.det_model.session.inputs[-1]))
+
+    results = {}
+    done = threading.Event()
+    det_inputs = detector.det_model.session.inputs = []
+
+    def on_result(index, detections, seg_img, annotated_img, busy):
+        # 检测阶段串行执行、按提交顺序处理，第 index 次检测输入对应第 index 帧
+        results[index] = (detections, seg_img.copy(), det_inputs[index])
+        if len(results) == len(frames):
+            done.set()
+
+    pipeline = DetectionPipeline(detector, on_result, queue_size=2)
+    pipeline.start()
+    for index, frame in enumerate(frames):
+        pipeline.submit(frame, index, block=True)
+    done.wait(timeout=60)
+    pipeline.stop()
+
+    def same_detections(a, b):
+        if len(a) != len(b):
+            return False
+        keys = ('x', 'y', 'w', 'h', 'r', 'conf')
+        return all(da['clsId'] == db['clsId'] and all(abs(da[k] - db[k]) <= 1e-3 for k in keys)
+                   for da, db in zip(a, b))
+
+    failures = 0
+    for index, (detections, seg_img, det_input) in enumerate(serial):
+        if index not in results:
+            print(f"第 {index} 帧: 流水线没有返回结果")
+            failures += 1
+            continue
+        pipe_detections, pipe_seg, pipe_input = results[index]
+        seg_equal = np.array_equal(seg_img, pipe_seg)
+        input_equal = det_input.shape == pipe_input.shape and np.allclose(det_input, pipe_input, atol=1e-6)
+        det_equal = same_detections(detections, pipe_detections)
+        print(f"第 {index} 帧: 抠图{'一致' if seg_equal else '不一致'}，检测输入{'一致' if input_equal else '不一致'}，"
+              f"检测结果 {len(detections)}/{len(pipe_detections)} 个{'一致' if det_equal else '不一致'}")
+        failures += not (seg_equal and input_equal and det_equal)
+
+    if failures:
+        print(f"{failures} 帧串行与流水线结果不一致")
+        sys.exit(1)
+    print("串行与流水线结果一致")
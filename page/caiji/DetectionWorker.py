@@ -1,5 +1,8 @@
+import os
 import time
 import threading
+from collections import deque
+from page.caiji.DetectionPipeline import DetectionPipeline
 from page.caiji.loggermodel import logger
 
 
@@ -7,7 +10,8 @@ class DetectionWorker:
     """检测工作线程"""
 
     def __init__(self, camera_manager, blade_detector, alert_system,
-                 detection_interval=1.0, batch_size=1):
+                 detection_interval=1.0, batch_size=1, name='DetectionWorker', camera_filter=None,
+                 cpu_affinity=None, pipeline_queue_size=0):
         """
         初始化检测工作线程
         Args:
@@ -16,12 +20,22 @@ class DetectionWorker:
             alert_system: 告警系统
             detection_interval: 检测间隔（秒）
             batch_size: 批处理大小
+            name: 线程名称
+            camera_filter: 返回本线程负责的相机ID集合的函数，为空时处理全部相机（分片模式使用）
+            cpu_affinity: 线程绑定的CPU核集合，为空时不绑定
+            pipeline_queue_size: 大于 0 时启用流水线模式（预处理、分割、检测、后处理各一个线程），
+                                 值为阶段间队列容量；队列满时丢弃新帧
         """
         self.camera_manager = camera_manager
         self.detector = blade_detector
         self.alert_system = alert_system
         self.detection_interval = detection_interval
         self.batch_size = batch_size
+        self.name = name
+        self.camera_filter = camera_filter
+        self.cpu_affinity = cpu_affinity
+        self.pipeline_queue_size = pipeline_queue_size
+        self.pipeline = None
 
         self.running = False
         self.worker_thread = None
@@ -29,6 +43,16 @@ class DetectionWorker:
         self.alert_count = 0
         self.frame_skip_counter = 0
 
+        # 耗时统计：总推理时间、最近的单帧耗时、各相机累计推理时间（用于分片负载均衡）
+        self.stats_lock = threading.Lock()
+        self.start_time = None
+        self.busy_time = 0.0
+        self.latencies = deque(maxlen=256)
+        self.camera_busy = {}
+
+        # 检测结果回调（如实时预览叠加最新检测框），在检测线程中调用，需立即返回
+        self.result_listeners = []
+
     def start(self):
         """启动检测工作线程"""
         if self.running:
@@ -36,23 +60,46 @@ class DetectionWorker:
             return
 
         self.running = True
+        self.start_time = time.time()
+        if self.pipeline_queue_size > 0:
+            self.pipeline = DetectionPipeline(
+                self.detector,
+                on_result=self._on_pipeline_result,
+                queue_size=self.pipeline_queue_size,
+                name=f"{self.name}-pipeline",
+                cpu_affinity=self.cpu_affinity
+            )
+            self.pipeline.start()
         self.worker_thread = threading.Thread(
             target=self._worker_loop,
-            name="DetectionWorker",
+            name=self.name,
             daemon=True
         )
         self.worker_thread.start()
-        logger.info("检测工作线程启动")
+        logger.info(f"检测工作线程启动: {self.name}")
 
     def stop(self):
         """停止检测工作线程"""
         self.running = False
         if self.worker_thread:
             self.worker_thread.join(timeout=5.0)
-        logger.info("检测工作线程停止")
+        if self.pipeline:
+            self.pipeline.stop()
+        logger.info(f"检测工作线程停止: {self.name}")
+
+    def _bind_cpu(self):
+        """将当前线程绑定到指定核（Linux 下 pid 0 表示调用线程）"""
+        if not self.cpu_affinity or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            os.sched_setaffinity(0, self.cpu_affinity)
+            logger.info(f"{self.name} 绑定CPU核: {sorted(self.cpu_affinity)}")
+        except OSError as e:
+            logger.warning(f"{self.name} 绑定CPU核失败: {e}")
 
     def _worker_loop(self):
         """工作线程主循环"""
+        self._bind_cpu()
         last_detection_time = time.time()
 
         while self.running:
@@ -64,16 +111,19 @@ class DetectionWorker:
                     time.sleep(0.01)
                     continue
 
-                # 遍历所有相机
+                # 遍历所有相机（分片模式下只处理分配给本线程的相机）
+                assigned = self.camera_filter() if self.camera_filter else None
                 for camera in self.camera_manager.cameras:
                     camera_id = camera['camera_id']
+                    if assigned is not None and camera_id not in assigned:
+                        continue
 
                     # 跳过未连接的相机
                     if self.camera_manager.camera_status.get(camera_id) != 'connected':
                         continue
 
-                    # 获取帧
-                    frame_info = self.camera_manager.get_frame(camera_id, timeout=0.1)
+                    # 获取帧（不等待，相机数量多时单路无帧不拖慢整轮）
+                    frame_info = self.camera_manager.get_frame(camera_id, timeout=0)
                     if not frame_info:
                         continue
 
@@ -82,31 +132,26 @@ class DetectionWorker:
                     if self.frame_skip_counter % 3 != 0:  # 每3帧处理1帧
                         continue
 
+                    # 叶片存在性门限：画面中没有叶片时跳过完整推理
+                    if self.detector.gate_enabled:
+                        start = time.perf_counter()
+                        passed = self.detector.check_gate(frame_info['frame'], camera_id)
+                        if not passed:
+                            self._add_busy(camera_id, time.perf_counter() - start)
+                            continue
+
+                    # 流水线模式：提交后立即处理下一路相机，结果由后处理线程回调
+                    if self.pipeline:
+                        self.pipeline.submit(frame_info['frame'], (frame_info, time.perf_counter()))
+                        continue
+
                     # 执行检测
+                    start = time.perf_counter()
                     detections, seg_img, annotated_img = self.detector.detect(
                         frame_info['frame']
                     )
-
-                    self.detection_count += 1
-
-                    # 如果有检测结果，发送告警
-                    if detections:
-                        self.alert_count += 1
-
-                        # 发送告警
-                        self.alert_system.send_alert(
-                            camera_info=frame_info['camera_info'],
-                            frame=annotated_img,
-                            detections=detections,
-                            detection_time=frame_info['timestamp']
-                        )
-
-                    # 记录检测统计
-                    if self.detection_count % 100 == 0:
-                        logger.info(
-                            f"检测统计: 总检测次数={self.detection_count}, "
-                            f"告警次数={self.alert_count}"
-                        )
+                    elapsed = time.perf_counter() - start
+                    self._handle_result(frame_info, detections, annotated_img, elapsed, elapsed)
 
                 last_detection_time = current_time
 
@@ -114,10 +159,91 @@ class DetectionWorker:
                 logger.error(f"检测工作线程出错: {e}")
                 time.sleep(1)
 
+    def _on_pipeline_result(self, context, detections, seg_img, annotated_img, busy):
+        """流水线结果回调（后处理线程）"""
+        frame_info, submitted = context
+        self._handle_result(frame_info, detections, annotated_img, busy, time.perf_counter() - submitted)
+
+    def _handle_result(self, frame_info, detections, annotated_img, busy, latency):
+        """
+        记录统计并在有检测结果时发送告警
+        Args:
+            frame_info: 相机帧信息
+            detections: 检测结果列表
+            annotated_img: 告警图片（未开启烧录标注时为原始帧）
+            busy: 该帧的处理耗时（秒）
+            latency: 从取帧到得到结果的耗时（秒）
+        """
+        camera_id = frame_info['camera_id']
+        self.detection_count += 1
+        with self.stats_lock:
+            self.latencies.append(latency)
+        self._add_busy(camera_id, busy)
+
+        if self.result_listeners:
+            height, width = frame_info['frame'].shape[:2]
+            for callback in self.result_listeners:
+                try:
+                    callback(camera_id, detections, width, height)
+                except Exception as e:
+                    logger.error(f"检测结果回调出错: {e}")
+
+        # 如果有检测结果，发送告警
+        if detections:
+            self.alert_count += 1
+
+            # 发送告警（默认保存原始帧，标注由仪表板按检测框叠加显示）
+            self.alert_system.send_alert(
+                camera_info=frame_info['camera_info'],
+                frame=annotated_img,
+                detections=detections,
+                detection_time=frame_info['timestamp'],
+                annotated=annotated_img is not frame_info['frame'],
+                crop_source=frame_info['frame']
+            )
+
+        # 记录检测统计
+        if self.detection_count % 100 == 0:
+            logger.info(
+                f"检测统计: 总检测次数={self.detection_count}, "
+                f"告警次数={self.alert_count}"
+            )
+
+    def add_result_listener(self, callback):
+        """注册检测结果回调 callback(camera_id, detections, image_width, image_height)"""
+        self.result_listeners.append(callback)
+
+    def _add_busy(self, camera_id, busy):
+        """累计推理耗时（门限判断的耗时也计入，分片负载均衡按实际开销分配相机）"""
+        with self.stats_lock:
+            self.busy_time += busy
+            self.camera_busy[camera_id] = self.camera_busy.get(camera_id, 0.0) + busy
+
+    def memory_usage(self):
+        """检测中的帧和流水线缓冲区占用的字节数"""
+        return self.pipeline.memory_usage() if self.pipeline else 0
+
+    def get_camera_busy(self):
+        """各相机累计推理时间（秒）"""
+        with self.stats_lock:
+            return dict(self.camera_busy)
+
     def get_stats(self):
         """获取统计信息"""
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            busy_time = self.busy_time
+
+        elapsed = time.time() - self.start_time if self.start_time else 0
         return {
             'detection_count': self.detection_count,
             'alert_count': self.alert_count,
-            'frame_skip_counter': self.frame_skip_counter
+            'frame_skip_counter': self.frame_skip_counter,
+            'utilization': round(busy_time / elapsed, 4) if elapsed > 0 else 0,
+            'latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0,
+            'latency_p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2)
+            if latencies else 0,
+            'pipeline': self.pipeline.stats() if self.pipeline else None,
+            'gate': self.detector.summarize_gate_stats(self.detector.get_gate_stats())
+            if self.detector.gate_enabled else None
         }
\ No newline at end of file
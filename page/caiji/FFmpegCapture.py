@@ -0,0 +1,251 @@
+import shutil
+import subprocess
+import sys
+import threading
+from collections import deque
+
+import numpy as np
+
+from page.caiji.loggermodel import logger
+
+
+def probe_size(url, ffprobe='ffprobe', timeout=15):
+    """
+    用 ffprobe 读取视频流分辨率
+    Returns:
+        (width, height)
+    Raises:
+        ConnectionError: 探测失败
+    """
+    args = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height',
+            '-of', 'csv=p=0:s=x']
+    if url.startswith('rtsp://'):
+        args += ['-rtsp_transport', 'tcp']
+    try:
+        output = subprocess.run(args + [url], capture_output=True, timeout=timeout, check=True).stdout
+        width, height = output.decode().strip().splitlines()[0].split('x')[:2]
+        return int(width), int(height)
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError) as e:
+        raise ConnectionError(f"无法获取视频分辨率: {url} ({e})")
+
+
+class FFmpegCapture:
+    """
+    ffmpeg 子进程采集：解码端用 fps/scale 滤镜降帧率、缩分辨率，直接输出 BGR 原始帧到管道
+    接口与 cv2.VideoCapture 的常用部分一致（isOpened/read/set/release），可直接替换
+    帧读入预分配的环形缓冲区，不再逐帧分配数组
+    """
+
+    def __init__(self, url, fps=None, width=None, height=None, ring_size=4, loop=False, realtime=False,
+                 rtsp_transport='tcp', hwaccel=None, threads=None, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+        """
+        启动 ffmpeg 采集进程
+        Args:
+            url: 视频地址（RTSP 或本地文件）
+            fps: 输出帧率，为空时保持原帧率
+            width: 输出宽度，为空时保持原宽度（只给宽度时按原比例计算高度）
+            height: 输出高度
+            ring_size: 环形缓冲区的帧数
+            loop: 本地文件循环播放（测试用）
+            realtime: 按原始速率读取本地文件（-re，模拟实时流）
+            rtsp_transport: RTSP 传输协议
+            hwaccel: ffmpeg 硬件解码（如 'cuda'），为空时软解
+            threads: 解码线程数，为空时由 ffmpeg 决定
+            ffmpeg: ffmpeg 可执行文件
+            ffprobe: ffprobe 可执行文件（需要按比例计算输出尺寸时使用）
+        Raises:
+            ConnectionError: 找不到 ffmpeg 或无法获取分辨率
+        """
+        if shutil.which(ffmpeg) is None:
+            raise ConnectionError(f"找不到 ffmpeg 可执行文件: {ffmpeg}")
+
+        self.url = url
+        self.fps = fps
+        self.width, self.height = self._output_size(url, width, height, ffprobe)
+        self.frame_bytes = self.width * self.height * 3
+
+        # 环形缓冲区：每个槽是一帧 BGR 数组
+        self.ring = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(max(2, ring_size))]
+        self.ring_index = 0
+        self.replaced = 0
+
+        self.stderr_lines = deque(maxlen=20)
+        self.process = subprocess.Popen(
+            self._command(ffmpeg, loop, realtime, rtsp_transport, hwaccel, threads),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=self.frame_bytes
+        )
+        self.stderr_thread = threading.Thread(target=self._drain_stderr, name='ffmpeg-stderr', daemon=True)
+        self.stderr_thread.start()
+
+    @staticmethod
+    def _output_size(url, width, height, ffprobe):
+        """确定输出分辨率（宽高取偶数，rawvideo 的 yuv->bgr 转换要求）"""
+        if width and height:
+            return int(width) // 2 * 2, int(height) // 2 * 2
+
+        src_width, src_height = probe_size(url, ffprobe)
+        if width:
+            height = round(src_height * int(width) / src_width)
+        elif height:
+            width = round(src_width * int(height) / src_height)
+        else:
+            width, height = src_width, src_height
+        return int(width) // 2 * 2, int(height) // 2 * 2
+
+    def _command(self, ffmpeg, loop, realtime, rtsp_transport, hwaccel, threads):
+        args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        if self.url.startswith('rtsp://'):
+            args += ['-rtsp_transport', rtsp_transport]
+        if hwaccel:
+            args += ['-hwaccel', hwaccel]
+        if threads:
+            args += ['-threads', str(threads)]
+        if loop:
+            args += ['-stream_loop', '-1']
+        if realtime:
+            args += ['-re']
+        args += ['-i', self.url, '-an', '-sn', '-dn']
+
+        # 先降帧率再缩放，被丢弃的帧不做缩放
+        filters = []
+        if self.fps:
+            filters.append(f"fps={self.fps}")
+        filters.append(f"scale={self.width}:{self.height}:flags=area")
+        args += ['-vf', ','.join(filters), '-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+        return args
+
+    def _drain_stderr(self):
+        """持续读取 ffmpeg 错误输出，避免管道写满阻塞子进程"""
+        for line in iter(self.process.stderr.readline, b''):
+            self.stderr_lines.append(line.decode('utf-8', 'replace').rstrip())
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def set(self, prop_id, value):
+        """兼容 cv2.VideoCapture.set，帧率和尺寸由 ffmpeg 滤镜控制，这里不做处理"""
+        return False
+
+    def _next_slot(self):
+        """
+        取下一个环形缓冲槽
+        槽里的上一帧仍被下游（帧队列、检测线程）引用时换一个新数组，保证已交出的帧不会被覆盖
+        """
+        # 环形缓冲区可能被 resize_ring 在其他线程替换，只使用取到的这一份
+        ring = self.ring
+        index = self.ring_index % len(ring)
+        slot = ring[index]
+        # 引用计数 3 = ring 列表 + 局部变量 slot + getrefcount 的参数
+        if sys.getrefcount(slot) > 3:
+            slot = np.empty_like(slot)
+            ring[index] = slot
+            self.replaced += 1
+        self.ring_index = (index + 1) % len(ring)
+        return slot
+
+    def resize_ring(self, ring_size):
+        """
+        调整环形缓冲区的帧数（内存预算调整帧队列长度时同步调用）
+        缩小时移除的槽若仍被下游引用，在下游处理完后释放
+        """
+        ring_size = max(2, int(ring_size))
+        ring = self.ring
+        if ring_size < len(ring):
+            self.ring = ring[:ring_size]
+        elif ring_size > len(ring):
+            self.ring = ring + [np.empty((self.height, self.width, 3), dtype=np.uint8)
+                                for _ in range(ring_size - len(ring))]
+
+    def read(self):
+        """
+        读取一帧
+        Returns:
+            (ret, frame)：与 cv2.VideoCapture.read 相同；流结束或进程退出时 ret 为 False
+        """
+        if self.process is None:
+            return False, None
+
+        slot = self._next_slot()
+        view = memoryview(slot.reshape(-1))
+        stdout = self.process.stdout
+        received = 0
+        while received < self.frame_bytes:
+            count = stdout.readinto(view[received:])
+            if not count:
+                if self.stderr_lines:
+                    logger.warning(f"ffmpeg 采集结束: {self.url}: {self.stderr_lines[-1]}")
+                return False, None
+            received += count
+        return True, slot
+
+    def release(self):
+        """结束 ffmpeg 进程"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.terminate()
+            process.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        finally:
+            process.stdout.close()
+
+    def __del__(self):
+        if getattr(self, 'process', None) is not None:
+            self.release()
+
+
+if __name__ == '__main__':
+    # 采集开销对比：同一视频文件分别用 cv2.VideoCapture（原分辨率全帧率解码）和 FFmpegCapture 读取
+    # 用法: python -m page.caiji.FFmpegCapture <视频文件> [帧率] [宽度] [秒数]
+    import os
+    import time
+
+    import cv2
+
+    path = sys.argv[1]
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    width = int(sys.argv[3]) if len(sys.argv) > 3 else 1920
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+    def measure(capture):
+        """按实时速率读取 seconds 秒，返回帧数和 CPU 时间（本进程加子进程）"""
+        start_wall = time.monotonic()
+        start_cpu = os.times()
+        frames = 0
+        while time.monotonic() - start_wall < seconds:
+            ret, _ = capture.read()
+            if not ret:
+                break
+            frames += 1
+        capture.release()
+        end_cpu = os.times()
+        return frames, sum(end_cpu[:4]) - sum(start_cpu[:4])
+
+    # OpenCV 原分辨率解码：按文件帧率读取等量视频时长，与 ffmpeg 的 -re 实时读取可比
+    cap = cv2.VideoCapture(path)
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    frames, cpu = 0, 0.0
+    start_cpu = os.times()
+    for _ in range(int(src_fps * seconds)):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = frame.copy()
+        frames += 1
+    end_cpu = os.times()
+    cap.release()
+    cpu = sum(end_cpu[:4]) - sum(start_cpu[:4])
+    print(f"cv2.VideoCapture: {frames} 帧（{frame.shape[1]}x{frame.shape[0]}），CPU {cpu:.2f}s")
+
+    capture = FFmpegCapture(path, fps=fps, width=width, realtime=True)
+    ff_frames, ff_cpu = measure(capture)
+    print(f"FFmpegCapture:    {ff_frames} 帧（{capture.width}x{capture.height}@{fps}fps），CPU {ff_cpu:.2f}s，"
+          f"新分配缓冲 {capture.replaced} 次")
+    if ff_cpu > 0:
+        print(f"CPU 开销降低 {cpu / ff_cpu:.1f} 倍")
@@ -6,15 +6,17 @@ from page.caiji.loggermodel import logger
 class HealthMonitor:
     """健康监控器"""
 
-    def __init__(self, camera_manager, detection_worker):
+    def __init__(self, camera_manager, detection_worker, memory_governor=None):
         """
         初始化健康监控器
         Args:
             camera_manager: 相机管理器
             detection_worker: 检测工作线程
+            memory_governor: 内存预算管理（可选），其报告写入健康报告的 memory 项
         """
         self.camera_manager = camera_manager
         self.detection_worker = detection_worker
+        self.memory_governor = memory_governor
         self.running = False
         self.monitor_thread = None
 
@@ -69,6 +71,15 @@ class HealthMonitor:
                     'detection_count': detection_stats.get('detection_count', 0),
                     'alert_count': detection_stats.get('alert_count', 0)
                 })
+                if 'shards' in detection_stats:
+                    self.performance_stats['shards'] = detection_stats['shards']
+                if detection_stats.get('pipeline'):
+                    self.performance_stats['pipeline'] = detection_stats['pipeline']
+                if detection_stats.get('gate'):
+                    self.performance_stats['gate'] = detection_stats['gate']
+                memory = self.memory_governor.get_report() if self.memory_governor else None
+                if memory:
+                    self.performance_stats['memory'] = memory
 
                 # 记录状态
                 logger.info(
@@ -76,16 +87,38 @@ class HealthMonitor:
                     f"检测次数={detection_stats.get('detection_count', 0)}, "
                     f"告警次数={detection_stats.get('alert_count', 0)}"
                 )
+                pipeline = detection_stats.get('pipeline')
+                if pipeline:
+                    logger.info(
+                        f"检测流水线: 瓶颈={pipeline['bottleneck']}, 丢帧={pipeline['dropped']}, " +
+                        ", ".join(f"{s['stage']}(队列{s['queue_depth']}/{s['queue_size']}, 利用率{s['utilization']:.0%})"
+                                  for s in pipeline['stages'])
+                    )
+                if memory:
+                    logger.info(
+                        f"内存: 级别={memory['level']}, 已用={memory['used_mb']}MB/{memory['budget_mb']}MB, "
+                        f"帧队列长度={memory['queue_limit']}, 进程RSS={memory['process_rss_mb']}MB, " +
+                        ", ".join(f"{name}={value}MB" for name, value in memory['breakdown_mb'].items())
+                    )
+                gate = detection_stats.get('gate')
+                if gate:
+                    busiest = sorted(gate['cameras'].items(), key=lambda item: item[1]['reject_rate'])[:3]
+                    logger.info(
+                        f"叶片门限: 判断={gate['checked']}, 拒绝率={gate['reject_rate']:.0%}, 通过率最高: " +
+                        ", ".join(f"{cid}({1 - stats['reject_rate']:.0%})" for cid, stats in busiest)
+                    )
+                for shard in detection_stats.get('shards', []):
+                    logger.info(
+                        f"检测分片 {shard['shard']}: 相机={len(shard['cameras'])}, "
+                        f"利用率={shard['utilization']:.0%}, "
+                        f"平均耗时={shard['latency_avg_ms']}ms, P95={shard['latency_p95_ms']}ms"
+                    )
 
-                # 如果有离线相机，尝试重启
+                # 采集线程自身负责退避重连；只重启已放弃重连或线程意外退出的相机
                 for camera in offline_cameras:
-                    if camera['status'] == 'error':
+                    if camera['status'] == 'failed' or (camera['status'] != 'stopped' and not camera['thread_alive']):
                         logger.warning(f"相机 {camera['camera_id']} 离线，尝试重启...")
-                        cam_config = self.camera_manager.get_camera_by_id(camera['camera_id'])
-                        if cam_config:
-                            self.camera_manager.stop_camera(camera['camera_id'])
-                            time.sleep(2)
-                            self.camera_manager.start_camera(cam_config)
+                        self.camera_manager.restart_camera(camera['camera_id'])
 
                 time.sleep(check_interval)
 
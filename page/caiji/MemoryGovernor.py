@@ -0,0 +1,223 @@
+import threading
+
+from page.caiji.CameraManager import RING_EXTRA_FRAMES
+from page.caiji.loggermodel import logger
+
+
+def read_rss():
+    """
+    本进程常驻内存（字节），读取 /proc/self/status 的 VmRSS
+    Returns:
+        字节数；不支持时返回 None
+    """
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class MemoryGovernor:
+    """
+    内存预算管理：定时统计帧队列、采集缓冲、检测中的帧和预览缓存占用的内存，
+    按“所有队列都填满”的最坏情况计算队列长度，使帧缓冲不超过预算：
+        normal   —— 预算足够，队列保持配置长度，预览正常
+        pressure —— 队列缩短（丢弃最旧的帧），预览降分辨率并释放无人观看的缓存
+        critical —— 每路只保留最新一帧仍超预算，暂停预览编码
+    队列缩短立即生效，恢复时每次最多加倍，避免在预算附近来回切换
+    """
+
+    def __init__(self, budget_mb, camera_manager, detection_worker=None, preview_server=None, interval=5.0,
+                 target_ratio=0.9):
+        """
+        初始化内存预算管理
+        Args:
+            budget_mb: 可管理部分的内存预算（MB），0 表示只统计不干预
+            camera_manager: 相机管理器
+            detection_worker: 检测工作线程（DetectionWorker 或 ShardedDetectionWorker）
+            preview_server: 实时预览服务
+            interval: 检查间隔（秒）
+            target_ratio: 最坏情况占用的目标上限（预算的比例），留出余量给统计间隔内的波动
+        """
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.camera_manager = camera_manager
+        self.detection_worker = detection_worker
+        self.preview_server = preview_server
+        self.interval = interval
+        self.target_ratio = target_ratio
+
+        self.level = 'normal'
+        self.dropped_frames = 0
+        self.level_changes = 0
+        self.report = {}
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def measure(self):
+        """
+        统计各部分内存占用（字节）
+        Returns:
+            {名称: 字节数}
+        """
+        usage = dict(self.camera_manager.memory_usage())
+        if self.detection_worker is not None:
+            usage['in_flight_detections'] = self.detection_worker.memory_usage()
+        if self.preview_server is not None:
+            usage['preview_cache'] = self.preview_server.memory_usage()
+        return usage
+
+    def _queue_limit(self, usage):
+        """
+        队列全部填满时仍不超过目标占用的最大队列长度
+        Returns:
+            (队列长度, 每路只保留一帧是否仍超预算)
+        """
+        base = self.camera_manager.queue_size
+        # ffmpeg 环形缓冲区随队列长度调整（队列长度 + RING_EXTRA_FRAMES 帧），按队列长度计入每帧开销
+        ring_slot_bytes = self.camera_manager.capture_slot_bytes()
+        slot_bytes = self.camera_manager.frame_slot_bytes() + ring_slot_bytes
+        if not slot_bytes:
+            return base, False
+
+        # 队列和采集缓冲以外的部分（检测中的帧、预览缓存）视为固定开销
+        fixed = sum(value for name, value in usage.items() if name not in ('frame_queues', 'capture_buffers'))
+        fixed += RING_EXTRA_FRAMES * ring_slot_bytes
+        available = self.budget * self.target_ratio - fixed
+        fitting = int(available // slot_bytes)
+        limit = max(1, min(base, fitting))
+
+        # 恢复时每次最多加倍
+        current = self.camera_manager.queue_limit
+        if limit > current:
+            limit = min(limit, current * 2)
+        return limit, fitting < 1
+
+    def check(self):
+        """统计一次并按需调整，返回报告"""
+        usage = self.measure()
+        used = sum(usage.values())
+
+        if self.budget:
+            limit, over_budget = self._queue_limit(usage)
+            if over_budget:
+                level = 'critical'
+            elif limit < self.camera_manager.queue_size:
+                level = 'pressure'
+            else:
+                level = 'normal'
+
+            if limit != self.camera_manager.queue_limit or level != self.level:
+                logger.warning(f"内存预算: 级别 {self.level} -> {level}，帧队列长度 "
+                               f"{self.camera_manager.queue_limit} -> {limit}（已用 {used / 2**20:.0f}MB / "
+                               f"预算 {self.budget / 2**20:.0f}MB）")
+                if level != self.level:
+                    self.level_changes += 1
+                self.level = level
+
+            # 每次都按当前长度裁剪：新连接的相机、热加载的相机也受限
+            self.dropped_frames += self.camera_manager.set_queue_limit(limit)
+            if self.preview_server is not None:
+                self.preview_server.set_mode({'normal': 'normal', 'pressure': 'reduced', 'critical': 'paused'}[level])
+
+        rss = read_rss()
+        self.report = {
+            'level': self.level,
+            'budget_mb': round(self.budget / 2**20, 1),
+            'used_mb': round(used / 2**20, 1),
+            'usage_ratio': round(used / self.budget, 4) if self.budget else 0,
+            'breakdown_mb': {name: round(value / 2**20, 1) for name, value in usage.items()},
+            'queue_limit': self.camera_manager.queue_limit,
+            'dropped_frames': self.dropped_frames,
+            'level_changes': self.level_changes,
+            'process_rss_mb': round(rss / 2**20, 1) if rss is not None else None
+        }
+        return self.report
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"内存预算检查出错: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """启动后台检查线程"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name="MemoryGovernor", daemon=True)
+        self.thread.start()
+        if self.budget:
+            logger.info(f"内存预算管理启动: 预算 {self.budget / 2**20:.0f}MB，检查间隔 {self.interval} 秒")
+        else:
+            logger.info("内存统计启动（未设置预算，不做调整）")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=3.0)
+
+    def get_report(self):
+        """最近一次统计报告"""
+        return self.report
+
+
+if __name__ == '__main__':
+    # 演示：模拟 40 路 4K 相机持续写入帧队列，预算 4GB，观察队列长度随相机数变化
+    # 用法: python -m page.caiji.MemoryGovernor [相机数] [预算MB]
+    import queue
+    import sys
+
+    import numpy as np
+
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    budget_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 4096
+
+    class SimulatedCameras:
+        """只实现 MemoryGovernor 用到的接口；帧共享同一块内存，统计按 4K 帧大小计算"""
+
+        def __init__(self):
+            self.queue_size = 30
+            self.queue_limit = 30
+            self.frame = np.zeros((2160, 3840, 3), dtype=np.uint8)
+            self.queues = [queue.Queue(maxsize=30) for _ in range(cameras)]
+
+        def fill(self, count):
+            for frame_queue in self.queues:
+                for _ in range(count):
+                    if frame_queue.full():
+                        frame_queue.get_nowait()
+                    frame_queue.put_nowait(self.frame)
+
+        def set_queue_limit(self, limit):
+            self.queue_limit = limit
+            dropped = 0
+            for frame_queue in self.queues:
+                frame_queue.maxsize = limit
+                while frame_queue.qsize() > limit:
+                    frame_queue.get_nowait()
+                    dropped += 1
+            return dropped
+
+        def memory_usage(self):
+            return {'frame_queues': sum(q.qsize() for q in self.queues) * self.frame.nbytes, 'capture_buffers': 0}
+
+        def frame_slot_bytes(self):
+            return len(self.queues) * self.frame.nbytes
+
+        def capture_slot_bytes(self):
+            return 0
+
+    simulated = SimulatedCameras()
+    governor = MemoryGovernor(budget_mb, simulated)
+    for step in range(12):
+        # 前半段 cameras 路相机持续写入；第 6 轮起只剩 1/4 的相机，队列长度逐步恢复
+        if step == 6:
+            simulated.queues = simulated.queues[:max(1, cameras // 4)]
+        simulated.fill(5)
+        report = governor.check()
+        print(f"第 {step:2d} 轮: 相机 {len(simulated.queues):>3} 级别 {report['level']:<8} 已用 {report['used_mb']:>8.0f}MB "
+              f"队列上限 {report['queue_limit']:>2} 丢弃 {report['dropped_frames']}")
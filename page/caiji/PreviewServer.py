@@ -0,0 +1,314 @@
+import threading
+import time
+
+import cv2
+import flask
+from werkzeug.serving import make_server
+
+from page.caiji.loggermodel import logger
+from page.dashboard.AlertAnnotate import draw_detections
+
+
+class PreviewChannel:
+    """一路预览（相机 + 是否叠加检测框）：最新编码的 JPEG 由所有观看者共享"""
+
+    def __init__(self, camera_id, overlay):
+        self.camera_id = camera_id
+        self.overlay = overlay
+        self.condition = threading.Condition()
+        self.viewers = 0
+        self.jpeg = None
+        self.seq = 0
+        self.source = None         # 最近一次编码所用的 frame_info，帧未更新时不重复编码
+        self.encode_lock = threading.Lock()  # 编码线程和单帧请求不同时编码同一通道
+        self.encoded = 0
+        self.encode_time = 0.0
+
+    def add_viewer(self):
+        with self.condition:
+            self.viewers += 1
+
+    def remove_viewer(self):
+        with self.condition:
+            self.viewers -= 1
+
+    def publish(self, jpeg):
+        with self.condition:
+            self.jpeg = jpeg
+            self.seq += 1
+            self.condition.notify_all()
+
+    def wait(self, last_seq, timeout):
+        """
+        等待比 last_seq 更新的一帧
+        Returns:
+            (jpeg, seq)；超时时 jpeg 为 None
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != last_seq, timeout=timeout)
+            if self.seq == last_seq:
+                return None, last_seq
+            return self.jpeg, self.seq
+
+
+class PreviewServer:
+    """
+    实时预览服务：每路相机以 MJPEG 推送最新画面
+    只有有人观看的相机才编码；每帧只编码一次，所有观看者共享同一份 JPEG
+    画面取自 CameraManager.latest_frames，不从检测使用的帧队列取帧
+    """
+
+    BOUNDARY = 'frame'
+
+    def __init__(self, camera_manager, host='0.0.0.0', port=8081, fps=5, max_width=960, quality=70,
+                 overlay=True, overlay_ttl=3.0, status_provider=None, profiler=None, allow_remote_admin=False):
+        """
+        初始化预览服务
+        Args:
+            camera_manager: 相机管理器
+            host: 监听地址
+            port: 监听端口（仪表板默认占用 8080）
+            fps: 预览帧率上限
+            max_width: 预览图最大宽度，超过时等比缩小
+            quality: JPEG 质量
+            overlay: 未指定 overlay 参数时是否叠加最新检测框
+            overlay_ttl: 检测结果超过该时间（秒）未更新时不再叠加
+            status_provider: 返回系统状态字典的函数，用于 /api/status
+            profiler: SamplingProfiler 实例，用于 /api/profile
+            allow_remote_admin: 是否允许非本机地址调用管理接口（/api/profile）
+        """
+        self.camera_manager = camera_manager
+        self.host = host
+        self.port = port
+        self.interval = 1.0 / fps
+        self.base_max_width = max_width
+        self.max_width = max_width
+        self.mode = 'normal'       # normal / reduced（降分辨率）/ paused（暂停编码），由 MemoryGovernor 设置
+        self.quality = quality
+        self.overlay = overlay
+        self.overlay_ttl = overlay_ttl
+        self.status_provider = status_provider
+        self.profiler = profiler
+        self.allow_remote_admin = allow_remote_admin
+
+        self.channels = {}         # (camera_id, overlay) -> PreviewChannel
+        self.channels_lock = threading.Lock()
+        self.detections = {}       # camera_id -> (检测时间, 检测结果, 原图宽, 原图高)
+
+        self.running = False
+        self.server = None
+        self.server_thread = None
+        self.encoder_thread = None
+        self.app = self._create_app()
+
+    def update_detections(self, camera_id, detections, image_width, image_height):
+        """检测结果回调（检测线程中调用，只保存引用）"""
+        self.detections[camera_id] = (time.monotonic(), detections, image_width, image_height)
+
+    def _channel(self, camera_id, overlay):
+        key = (camera_id, overlay)
+        with self.channels_lock:
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.channels[key] = PreviewChannel(camera_id, overlay)
+            return channel
+
+    def _create_app(self):
+        app = flask.Flask(__name__)
+
+        @app.route('/preview/<camera_id>')
+        def preview_stream(camera_id):
+            """MJPEG 实时预览；overlay=0/1 控制是否叠加检测框"""
+            if self.camera_manager.get_camera_by_id(camera_id) is None:
+                return flask.jsonify({'status': 'error', 'message': f'相机 {camera_id} 不存在'}), 404
+            channel = self._channel(camera_id, self._overlay_arg())
+            return flask.Response(self._stream(channel),
+                                  mimetype=f'multipart/x-mixed-replace; boundary={self.BOUNDARY}',
+                                  headers={'Cache-Control': 'no-cache'})
+
+        @app.route('/preview/<camera_id>/snapshot')
+        def preview_snapshot(camera_id):
+            """单帧预览（有人观看时直接返回共享的最新 JPEG）"""
+            if self.camera_manager.get_camera_by_id(camera_id) is None:
+                return flask.jsonify({'status': 'error', 'message': f'相机 {camera_id} 不存在'}), 404
+            channel = self._channel(camera_id, self._overlay_arg())
+            if self.mode == 'paused':
+                return flask.jsonify({'status': 'error', 'message': '内存紧张，实时预览已暂停'}), 503
+            jpeg = self._snapshot(channel)
+            if jpeg is None:
+                return flask.jsonify({'status': 'error', 'message': f'相机 {camera_id} 暂无画面'}), 503
+            return flask.Response(jpeg, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
+
+        @app.route('/api/preview')
+        def preview_stats():
+            return flask.jsonify({'status': 'success', 'channels': self.stats()})
+
+        @app.route('/api/status')
+        def system_status():
+            status = self.status_provider() if self.status_provider else {}
+            return flask.jsonify({'status': 'success', 'data': status,
+                                  'cameras': self.camera_manager.get_camera_status()})
+
+        @app.route('/api/profile', methods=['GET', 'POST'])
+        def profile():
+            """GET 查询采样分析状态；POST 开始一次采样（duration 参数，秒）"""
+            if self.profiler is None:
+                return flask.jsonify({'status': 'error', 'message': '采样分析未启用'}), 404
+            if not self.allow_remote_admin and flask.request.remote_addr not in ('127.0.0.1', '::1'):
+                return flask.jsonify({'status': 'error', 'message': '管理接口只允许本机访问'}), 403
+            if flask.request.method == 'GET':
+                return flask.jsonify({'status': 'success', 'data': self.profiler.status()})
+
+            try:
+                duration = float(flask.request.args.get('duration', 30))
+            except ValueError:
+                return flask.jsonify({'status': 'error', 'message': 'duration 必须是数字'}), 400
+            if not self.profiler.start(duration):
+                return flask.jsonify({'status': 'error', 'message': '采样分析正在运行'}), 409
+            return flask.jsonify({'status': 'success', 'message': '采样分析已开始'}), 202
+
+        return app
+
+    def _overlay_arg(self):
+        value = flask.request.args.get('overlay')
+        return self.overlay if value is None else value not in ('0', 'false', 'no')
+
+    def _stream(self, channel):
+        """观看者生成器：等待共享 JPEG 更新后推送；客户端断开时生成器关闭，观看者数减一"""
+        channel.add_viewer()
+        try:
+            seq = -1
+            while self.running:
+                jpeg, seq = channel.wait(seq, timeout=5.0)
+                if jpeg is None:
+                    continue
+                yield (f'--{self.BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                       f'Content-Length: {len(jpeg)}\r\n\r\n').encode() + jpeg + b'\r\n'
+        finally:
+            channel.remove_viewer()
+
+    def _encode(self, channel):
+        """把相机最新一帧缩放、按需叠加检测框并编码为 JPEG；帧没有更新时返回 None"""
+        frame_info = self.camera_manager.latest_frames.get(channel.camera_id)
+        if frame_info is None or frame_info is channel.source:
+            return None
+        channel.source = frame_info
+
+        start = time.perf_counter()
+        frame = frame_info['frame']
+        height, width = frame.shape[:2]
+        if width > self.max_width:
+            # 缩放生成新数组，后续绘制不会改动采集帧
+            image = cv2.resize(frame, (self.max_width, round(height * self.max_width / width)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            image = frame.copy() if channel.overlay else frame
+
+        if channel.overlay:
+            latest = self.detections.get(channel.camera_id)
+            if latest and time.monotonic() - latest[0] <= self.overlay_ttl and latest[1]:
+                draw_detections(image, latest[1], latest[2], latest[3])
+
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        channel.encode_time += time.perf_counter() - start
+        if not ok:
+            return None
+        channel.encoded += 1
+        return buffer.tobytes()
+
+    def _snapshot(self, channel):
+        """
+        单帧预览的 JPEG：无人观看时按需编码并保存在通道上，帧没有更新时复用上次的结果
+        Returns:
+            JPEG 字节；相机还没有画面时返回 None
+        """
+        if not channel.viewers:
+            with channel.encode_lock:
+                jpeg = self._encode(channel)
+                if jpeg is not None:
+                    channel.publish(jpeg)
+        return channel.jpeg
+
+    def _encoder_loop(self):
+        """按预览帧率轮询有观看者的通道，每帧编码一次后通知所有观看者"""
+        next_tick = time.monotonic()
+        while self.running:
+            with self.channels_lock:
+                watched = [channel for channel in self.channels.values() if channel.viewers > 0]
+            if self.mode == 'paused':
+                watched = []
+            for channel in watched:
+                try:
+                    with channel.encode_lock:
+                        jpeg = self._encode(channel)
+                        if jpeg is not None:
+                            channel.publish(jpeg)
+                except Exception as e:
+                    logger.error(f"预览编码出错 {channel.camera_id}: {e}")
+
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # 编码跟不上时不补帧
+                next_tick = time.monotonic()
+
+    def set_mode(self, mode):
+        """
+        内存紧张时降级预览
+        Args:
+            mode: 'normal' 正常；'reduced' 宽度减半并释放无人观看通道的缓存；'paused' 停止编码并释放全部缓存
+        """
+        if mode == self.mode:
+            return
+        self.mode = mode
+        self.max_width = self.base_max_width // 2 if mode == 'reduced' else self.base_max_width
+        with self.channels_lock:
+            channels = list(self.channels.values())
+        for channel in channels:
+            if mode == 'paused' or (mode == 'reduced' and channel.viewers == 0):
+                channel.jpeg = None
+                channel.source = None
+        logger.info(f"实时预览模式: {mode}")
+
+    def memory_usage(self):
+        """各通道缓存的 JPEG 字节数"""
+        with self.channels_lock:
+            return sum(len(channel.jpeg) for channel in self.channels.values() if channel.jpeg)
+
+    def stats(self):
+        """各预览通道的观看者数、编码次数和平均编码耗时"""
+        with self.channels_lock:
+            channels = list(self.channels.values())
+        return [{
+            'camera_id': channel.camera_id,
+            'overlay': channel.overlay,
+            'viewers': channel.viewers,
+            'encoded': channel.encoded,
+            'encode_avg_ms': round(channel.encode_time / channel.encoded * 1000, 2) if channel.encoded else 0
+        } for channel in channels]
+
+    def start(self):
+        """启动 HTTP 服务和编码线程"""
+        self.running = True
+        self.server = make_server(self.host, self.port, self.app, threaded=True)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name="PreviewServer", daemon=True)
+        self.server_thread.start()
+        self.encoder_thread = threading.Thread(target=self._encoder_loop, name="PreviewEncoder", daemon=True)
+        self.encoder_thread.start()
+        logger.info(f"实时预览服务启动: http://{self.host}:{self.port}/preview/<camera_id>")
+
+    def stop(self):
+        """停止服务（观看者的推流在下一次等待超时前结束）"""
+        self.running = False
+        with self.channels_lock:
+            channels = list(self.channels.values())
+        for channel in channels:
+            with channel.condition:
+                channel.condition.notify_all()
+        if self.server:
+            self.server.shutdown()
+        if self.encoder_thread:
+            self.encoder_thread.join(timeout=2.0)
+        logger.info("实时预览服务停止")
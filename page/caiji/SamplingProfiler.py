@@ -0,0 +1,257 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from page.caiji.loggermodel import logger
+
+
+def read_thread_cpu():
+    """
+    读取本进程各线程的 CPU 时间（Linux /proc/self/task）
+    Returns:
+        {native_id: CPU 秒数}；不支持时返回空字典
+    """
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    result = {}
+    try:
+        task_ids = os.listdir('/proc/self/task')
+    except OSError:
+        return result
+
+    for tid in task_ids:
+        try:
+            with open(f'/proc/self/task/{tid}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 线程名（第2列）可能含空格，从最后一个 ')' 之后开始按空格拆分；utime、stime 为第14、15列
+        fields = stat[stat.rfind(b')') + 2:].split()
+        result[int(tid)] = (int(fields[11]) + int(fields[12])) / ticks
+    return result
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按固定间隔用 sys._current_frames 采集所有线程的调用栈，
+    输出火焰图工具可读的折叠栈文件（每行“线程;函数;函数... 次数”）和各线程 CPU 占用
+    不修改被分析线程、不设置 trace 钩子，不运行时没有任何开销；同一时间只运行一次
+    """
+
+    def __init__(self, output_dir='profiles', interval=0.02, max_duration=300):
+        """
+        初始化采样分析器
+        Args:
+            output_dir: 结果输出目录
+            interval: 采样间隔（秒）
+            max_duration: 单次采样的最长时间（秒）
+        """
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.max_duration = max_duration
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.requested = None  # request() 提交、监听线程处理的采样时长
+        self.last_result = None
+        self.labels = {}  # code 对象 -> 栈帧标签，避免每次采样重复拼接字符串
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration=30):
+        """
+        开始一次采样（非阻塞；会加锁和写日志，信号处理函数中使用 request）
+        Args:
+            duration: 采样时长（秒），超过 max_duration 时截断
+        Returns:
+            是否已启动；已有采样在运行时返回 False
+        """
+        with self.lock:
+            if self.running:
+                return False
+            duration = max(0.1, min(float(duration), self.max_duration))
+            self.thread = threading.Thread(target=self._run, args=(duration,), name="SamplingProfiler", daemon=True)
+            self.thread.start()
+        logger.info(f"采样分析开始: {duration:.0f} 秒，间隔 {self.interval * 1000:.0f} 毫秒")
+        return True
+
+    def request(self, duration=30):
+        """
+        请求一次采样（供信号处理函数调用）
+        只记录请求，不加锁、不写日志、不创建线程，由 listen() 启动的监听线程开始采样
+        """
+        self.requested = duration
+
+    def listen(self, poll_interval=0.5):
+        """启动监听线程，处理 request() 提交的采样请求"""
+        thread = threading.Thread(target=self._listen, args=(poll_interval,), name="SamplingProfiler-listen",
+                                  daemon=True)
+        thread.start()
+
+    def _listen(self, poll_interval):
+        while True:
+            time.sleep(poll_interval)
+            duration = self.requested
+            if duration is None:
+                continue
+            self.requested = None
+            if not self.start(duration):
+                logger.warning("采样分析正在运行，忽略本次请求")
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            label = self.labels[code] = f"{module}:{code.co_name}"
+        return label
+
+    def _sample(self, stacks, samples_per_thread):
+        own_ident = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            name = names.get(ident, f"thread-{ident}")
+            labels.append(name)
+            labels.reverse()
+            stacks[';'.join(labels)] += 1
+            samples_per_thread[name] += 1
+
+    def _run(self, duration):
+        stacks = Counter()
+        samples_per_thread = Counter()
+        started_at = datetime.now()
+        cpu_start = read_thread_cpu()
+        own_cpu_start = time.thread_time()
+        wall_start = time.monotonic()
+        deadline = wall_start + duration
+        samples = 0
+
+        try:
+            next_tick = wall_start
+            while time.monotonic() < deadline:
+                self._sample(stacks, samples_per_thread)
+                samples += 1
+                next_tick += self.interval
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.monotonic()
+        except Exception as e:
+            logger.error(f"采样分析出错: {e}")
+
+        wall = time.monotonic() - wall_start
+        result = self._report(started_at, wall, samples, stacks, samples_per_thread,
+                              cpu_start, read_thread_cpu(), time.thread_time() - own_cpu_start)
+        self.last_result = result
+
+        top = ", ".join(f"{t['thread']}={t['cpu_percent']}%" for t in result['threads'][:5])
+        logger.info(f"采样分析完成: {samples} 次采样，结果 {result['collapsed_file']}；CPU 占用最高的线程: {top}")
+
+    def _report(self, started_at, wall, samples, stacks, samples_per_thread, cpu_start, cpu_end, overhead):
+        """写出折叠栈文件和 JSON 汇总"""
+        # 线程 CPU 按 native_id 对应到线程名，找不到的（如 ONNX Runtime 内部线程）使用系统线程名
+        names = {thread.native_id: thread.name for thread in threading.enumerate()}
+        threads = []
+        for tid, cpu in cpu_end.items():
+            used = cpu - cpu_start.get(tid, 0.0)
+            name = names.get(tid) or self._task_name(tid)
+            threads.append({
+                'thread': name,
+                'native_id': tid,
+                'cpu_seconds': round(used, 3),
+                'cpu_percent': round(used / wall * 100, 1) if wall > 0 else 0,
+                'samples': samples_per_thread.get(name, 0)
+            })
+        threads.sort(key=lambda t: t['cpu_seconds'], reverse=True)
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.output_dir / f"profile-{started_at:%Y%m%d-%H%M%S}"
+        collapsed_file = stem.with_suffix('.collapsed')
+        with open(collapsed_file, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        result = {
+            'started_at': started_at.isoformat(),
+            'duration': round(wall, 3),
+            'interval': self.interval,
+            'samples': samples,
+            'overhead_cpu_seconds': round(overhead, 3),
+            'collapsed_file': str(collapsed_file),
+            'threads': threads,
+            'top_stacks': [{'stack': stack, 'samples': count} for stack, count in stacks.most_common(20)]
+        }
+        with open(stem.with_suffix('.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return result
+
+    @staticmethod
+    def _task_name(tid):
+        try:
+            with open(f'/proc/self/task/{tid}/comm', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return f"tid-{tid}"
+
+    def status(self):
+        """当前状态和最近一次结果的摘要"""
+        last = self.last_result
+        return {
+            'running': self.running,
+            'last': None if last is None else {key: last[key] for key in
+                                               ('started_at', 'duration', 'samples', 'overhead_cpu_seconds',
+                                                'collapsed_file', 'threads')}
+        }
+
+
+if __name__ == '__main__':
+    # 演示：两个计算线程和一个等待线程运行时采样，打印各线程 CPU 和最热的调用栈
+    # 用法: python -m page.caiji.SamplingProfiler [秒数]
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    def busy_python():
+        end = time.monotonic() + seconds + 1
+        while time.monotonic() < end:
+            sum(i * i for i in range(10000))
+
+    def busy_numpy():
+        import numpy as np
+        data = np.random.rand(512, 512)
+        end = time.monotonic() + seconds + 1
+        while time.monotonic() < end:
+            data @ data
+
+    def idle():
+        time.sleep(seconds + 1)
+
+    workers = [threading.Thread(target=busy_python, name='Camera-demo'),
+               threading.Thread(target=busy_numpy, name='DetectionWorker-demo'),
+               threading.Thread(target=idle, name='HealthMonitor-demo')]
+    for worker in workers:
+        worker.start()
+
+    profiler = SamplingProfiler(output_dir='profiles')
+    profiler.start(seconds)
+    profiler.thread.join()
+    for worker in workers:
+        worker.join()
+
+    result = profiler.last_result
+    print(f"采样 {result['samples']} 次，分析器自身 CPU {result['overhead_cpu_seconds']}s")
+    for thread in result['threads']:
+        print(f"  {thread['thread']:<24} CPU {thread['cpu_percent']:>6}%  采样 {thread['samples']}")
+    for stack in result['top_stacks'][:5]:
+        print(f"  {stack['samples']:>5}  {stack['stack']}")
+    print(f"折叠栈文件: {result['collapsed_file']}")
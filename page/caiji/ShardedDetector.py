@@ -0,0 +1,391 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from page.caiji.BladeDetector import BladeDetector
+from page.caiji.DetectionWorker import DetectionWorker
+from page.caiji.loggermodel import logger
+
+
+def parse_cpu_list(text):
+    """解析 CPU 列表字符串（如 "0-3,8,10-11"）"""
+    cpus = []
+    for part in text.strip().split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    """当前进程允许使用的 CPU 核"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_cpu_sets(cpus):
+    """按 NUMA 节点分组的可用 CPU 核（非 Linux 或单节点时返回一组）"""
+    nodes = []
+    for node in sorted(Path('/sys/devices/system/node').glob('node[0-9]*'),
+                       key=lambda p: int(p.name[4:])):
+        try:
+            node_cpus = [cpu for cpu in parse_cpu_list((node / 'cpulist').read_text()) if cpu in cpus]
+        except (OSError, ValueError):
+            continue
+        if node_cpus:
+            nodes.append(node_cpus)
+    return nodes or [list(cpus)]
+
+
+def split_evenly(items, parts):
+    """把列表按顺序切成 parts 段，长度相差不超过 1"""
+    size, extra = divmod(len(items), parts)
+    result, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        result.append(items[start:end])
+        start = end
+    return result
+
+
+def plan_core_sets(shards, spec=None):
+    """
+    为每个分片分配 CPU 核
+    Args:
+        shards: 分片数
+        spec: 手工指定的核列表，分号分隔各分片（如 "0-15;16-31"），为空时自动分配
+    Returns:
+        每个分片的核列表
+    Raises:
+        ValueError: 指定的分片数与核列表不一致，或核数少于分片数
+    """
+    if spec:
+        core_sets = [parse_cpu_list(part) for part in spec.split(';') if part.strip()]
+        if len(core_sets) != shards or not all(core_sets):
+            raise ValueError(f"shard_cores 需要为 {shards} 个分片各指定核列表: {spec}")
+        return core_sets
+
+    cpus = available_cpus()
+    if len(cpus) < shards:
+        raise ValueError(f"可用CPU核 {len(cpus)} 个，少于分片数 {shards}")
+
+    # 分片数是 NUMA 节点数的整数倍时，每个分片的核都在同一节点内，避免跨节点访存
+    nodes = numa_cpu_sets(cpus)
+    if len(nodes) > 1 and shards % len(nodes) == 0 and all(len(n) >= shards // len(nodes) for n in nodes):
+        return [cores for node in nodes for cores in split_evenly(node, shards // len(nodes))]
+    return split_evenly(cpus, shards)
+
+
+def make_session_options(cores):
+    """
+    分片的 ONNX Runtime 会话配置：线程数等于核数，每个线程绑定一个核
+    调用线程（检测线程）本身算作第一个线程，由 DetectionWorker 绑定到整个核集合
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = len(cores)
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    if len(cores) > 1:
+        # 其余 n-1 个线程依次绑定到各核（ONNX Runtime 的逻辑核编号从 1 开始）
+        options.add_session_config_entry('session.intra_op_thread_affinities',
+                                         ';'.join(str(cpu + 1) for cpu in cores[1:]))
+    return options
+
+
+class DetectorShard:
+    """一个检测分片：独立的检测器实例、绑定的核集合和检测线程"""
+
+    def __init__(self, index, cores, detector, worker):
+        self.index = index
+        self.cores = cores
+        self.detector = detector
+        self.worker = worker
+        self.cameras = frozenset()  # 整体替换，检测线程无需加锁读取
+
+
+class ShardedDetectionWorker:
+    """
+    分片检测：创建 K 个检测器实例，各自绑定一组CPU核并由独立线程运行
+    相机按负载（各相机实测推理耗时）分配到分片，定期重新均衡
+    对外接口与 DetectionWorker 一致（start/stop/get_stats）
+    """
+
+    def __init__(self, camera_manager, alert_system, seg_weights, det_weights, conf_threshold=0.45,
+                 device='cpu', annotate=False, shards=2, core_spec=None, detection_interval=1.0,
+                 batch_size=1, rebalance_interval=60, rebalance_threshold=0.2, pipeline_queue_size=0,
+                 gate_coverage=0.0, gate_size=256, gate_weights=None):
+        """
+        初始化分片检测
+        Args:
+            camera_manager: 相机管理器
+            alert_system: 告警系统
+            seg_weights: 分割模型路径
+            det_weights: 检测模型路径
+            conf_threshold: 置信度阈值
+            device: 设备ID（'cpu' 时按核数设置 ONNX Runtime 线程和核绑定）
+            annotate: 是否把检测框画进告警图片
+            shards: 分片数
+            core_spec: 各分片的核列表（如 "0-15;16-31"），为空时按 NUMA 节点自动分配
+            detection_interval: 检测间隔（秒）
+            batch_size: 批处理大小
+            rebalance_interval: 负载均衡检查间隔（秒）
+            rebalance_threshold: 分片负载差超过最大负载的该比例时重新分配相机
+            pipeline_queue_size: 大于 0 时各分片使用流水线模式（见 DetectionWorker）
+            gate_coverage: 叶片存在性门限（见 BladeDetector），0 表示不启用
+            gate_size: 门限判断的推理边长
+            gate_weights: 门限使用的独立小分割模型路径
+        """
+        self.camera_manager = camera_manager
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_threshold = rebalance_threshold
+
+        self.lock = threading.Lock()
+        self.assignment = {}        # camera_id -> 分片序号
+        self.camera_load = {}       # camera_id -> 最近一个周期的推理耗时占比
+        self.last_busy = {}         # camera_id -> 上次统计时的累计推理时间
+        self.last_rebalance = time.time()
+        self.moves = 0
+
+        self.stop_event = threading.Event()
+        self.rebalance_thread = None
+
+        self.shards = []
+        for index, cores in enumerate(plan_core_sets(shards, core_spec)):
+            options = make_session_options(cores) if device == 'cpu' else None
+            detector = BladeDetector(seg_weights, det_weights, conf_threshold, device,
+                                     annotate=annotate, session_options=options, gate_coverage=gate_coverage,
+                                     gate_size=gate_size, gate_weights=gate_weights)
+            worker = DetectionWorker(
+                camera_manager=camera_manager,
+                blade_detector=detector,
+                alert_system=alert_system,
+                detection_interval=detection_interval,
+                batch_size=batch_size,
+                name=f"DetectionWorker-{index}",
+                camera_filter=self._camera_filter(index),
+                cpu_affinity=set(cores),
+                pipeline_queue_size=pipeline_queue_size
+            )
+            self.shards.append(DetectorShard(index, cores, detector, worker))
+            logger.info(f"检测分片 {index} 创建完成，CPU核: {cores}")
+
+        self._assign_new_cameras()
+        # 相机配置热加载后立即分配新相机，不等下一次负载均衡
+        camera_manager.add_change_listener(lambda changes: self._assign_new_cameras())
+
+    def _camera_filter(self, index):
+        return lambda: self.shards[index].cameras
+
+    def _shard_loads(self, assignment):
+        """各分片的负载（所分配相机的负载之和）"""
+        loads = [0.0] * len(self.shards)
+        default = self._default_load()
+        for camera_id, index in assignment.items():
+            loads[index] += self.camera_load.get(camera_id, default)
+        return loads
+
+    def _default_load(self):
+        """尚无实测数据的相机按已知相机的平均负载估算"""
+        measured = [load for load in self.camera_load.values() if load > 0]
+        return sum(measured) / len(measured) if measured else 1.0
+
+    def _publish(self):
+        """把分配结果发布给各分片（调用方持有锁）"""
+        for shard in self.shards:
+            shard.cameras = frozenset(cid for cid, index in self.assignment.items() if index == shard.index)
+
+    def _assign_new_cameras(self):
+        """新出现的相机分配给当前负载最低的分片，已移除的相机取消分配"""
+        camera_ids = [camera['camera_id'] for camera in self.camera_manager.cameras]
+        with self.lock:
+            changed = False
+            for camera_id in list(self.assignment):
+                if camera_id not in camera_ids:
+                    del self.assignment[camera_id]
+                    changed = True
+            for camera_id in camera_ids:
+                if camera_id in self.assignment:
+                    continue
+                loads = self._shard_loads(self.assignment)
+                self.assignment[camera_id] = loads.index(min(loads))
+                changed = True
+            if changed:
+                self._publish()
+
+    def _measure(self):
+        """用各相机在上个周期内的推理耗时更新负载估计"""
+        now = time.time()
+        elapsed = max(now - self.last_rebalance, 1e-6)
+        self.last_rebalance = now
+
+        busy = {}
+        for shard in self.shards:
+            for camera_id, seconds in shard.worker.get_camera_busy().items():
+                busy[camera_id] = busy.get(camera_id, 0.0) + seconds
+
+        with self.lock:
+            for camera_id, total in busy.items():
+                self.camera_load[camera_id] = (total - self.last_busy.get(camera_id, 0.0)) / elapsed
+            self.last_busy = busy
+
+    def rebalance(self):
+        """
+        负载不均时按最长处理时间优先（LPT）重新分配相机：负载大的相机依次放到当前最轻的分片
+        Returns:
+            迁移的相机数
+        """
+        self._assign_new_cameras()
+        self._measure()
+
+        with self.lock:
+            loads = self._shard_loads(self.assignment)
+            if max(loads) <= 0 or (max(loads) - min(loads)) <= self.rebalance_threshold * max(loads):
+                return 0
+
+            default = self._default_load()
+            planned = {}
+            planned_loads = [0.0] * len(self.shards)
+            for camera_id in sorted(self.assignment, key=lambda cid: self.camera_load.get(cid, default),
+                                    reverse=True):
+                # 负载相同时优先留在原分片，减少迁移
+                current = self.assignment[camera_id]
+                index = min(range(len(self.shards)), key=lambda i: (planned_loads[i], i != current))
+                planned[camera_id] = index
+                planned_loads[index] += self.camera_load.get(camera_id, default)
+
+            # 新方案带来的改善不明显时保持现状
+            if max(planned_loads) >= max(loads) * (1 - self.rebalance_threshold / 2):
+                return 0
+
+            moved = [cid for cid in planned if planned[cid] != self.assignment[cid]]
+            self.assignment = planned
+            self.moves += len(moved)
+            self._publish()
+
+        logger.info(
+            f"检测分片负载均衡: 迁移相机 {len(moved)} 个, "
+            f"负载 {[round(l, 3) for l in loads]} -> {[round(l, 3) for l in planned_loads]}"
+        )
+        return len(moved)
+
+    def _rebalance_loop(self):
+        while not self.stop_event.wait(self.rebalance_interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                logger.error(f"检测分片负载均衡出错: {e}")
+
+    def start(self):
+        """启动所有分片的检测线程和负载均衡线程"""
+        self.stop_event.clear()
+        self.last_rebalance = time.time()
+        for shard in self.shards:
+            shard.worker.start()
+
+        self.rebalance_thread = threading.Thread(target=self._rebalance_loop, name="ShardRebalancer",
+                                                 daemon=True)
+        self.rebalance_thread.start()
+        logger.info(f"分片检测启动，共 {len(self.shards)} 个分片")
+
+    def stop(self):
+        """停止所有分片"""
+        self.stop_event.set()
+        if self.rebalance_thread:
+            self.rebalance_thread.join(timeout=3.0)
+        for shard in self.shards:
+            shard.worker.stop()
+        logger.info("分片检测停止")
+
+    def memory_usage(self):
+        """各分片检测中的帧和流水线缓冲区占用的字节数之和"""
+        return sum(shard.worker.memory_usage() for shard in self.shards)
+
+    def add_result_listener(self, callback):
+        """注册检测结果回调（见 DetectionWorker.add_result_listener），所有分片共用"""
+        for shard in self.shards:
+            shard.worker.add_result_listener(callback)
+
+    def get_stats(self):
+        """获取统计信息（汇总值与 DetectionWorker 一致，另附各分片的利用率和耗时）"""
+        with self.lock:
+            loads = self._shard_loads(self.assignment)
+
+        shards = []
+        for shard in self.shards:
+            stats = shard.worker.get_stats()
+            stats.update({
+                'shard': shard.index,
+                'cores': shard.cores,
+                'cameras': sorted(shard.cameras),
+                'load': round(loads[shard.index], 4)
+            })
+            shards.append(stats)
+
+        # 相机可能在分片间迁移过，门限计数按相机相加后再汇总
+        gate = None
+        if any(shard.detector.gate_enabled for shard in self.shards):
+            raw = {}
+            for shard in self.shards:
+                for camera_id, counts in shard.detector.get_gate_stats().items():
+                    raw[camera_id] = [a + b for a, b in zip(raw.get(camera_id, [0, 0, 0.0]), counts)]
+            gate = BladeDetector.summarize_gate_stats(raw)
+
+        return {
+            'detection_count': sum(s['detection_count'] for s in shards),
+            'alert_count': sum(s['alert_count'] for s in shards),
+            'frame_skip_counter': sum(s['frame_skip_counter'] for s in shards),
+            'rebalance_moves': self.moves,
+            'gate': gate,
+            'shards': shards
+        }
+
+
+if __name__ == '__main__':
+    # 吞吐量扩展测试：分别用 1..K 个分片对合成帧连续检测，比较总吞吐量是否随分片数近似线性增长
+    # 用法: python -m page.caiji.ShardedDetector [最大分片数] [每轮秒数]
+    import json
+    import sys
+
+    import numpy as np
+
+    max_shards = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with open('./conf/config.json', encoding='utf-8') as f:
+        config = json.load(f)
+
+    frame = np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    baseline = None
+    for shards in range(1, max_shards + 1):
+        core_sets = plan_core_sets(shards, None)
+        detectors = [BladeDetector(config['seg_weights'], config['det_weights'], config.get('conf_threshold', 0.45),
+                                   'cpu', session_options=make_session_options(cores)) for cores in core_sets]
+        for detector in detectors:
+            detector.detect(frame)  # 预热
+        counts = [0] * shards
+        deadline = time.monotonic() + seconds
+
+        def run(index):
+            os.sched_setaffinity(0, set(core_sets[index]))
+            while time.monotonic() < deadline:
+                detectors[index].detect(frame)
+                counts[index] += 1
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(shards)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        fps = sum(counts) / seconds
+        baseline = baseline or fps
+        print(f"{shards} 个分片: {fps:.2f} 帧/秒, 扩展效率 {fps / (baseline * shards):.0%}, 各分片 {counts}")
@@ -1,37 +1,279 @@
+"""
+配置日志系统
+采集、检测等热点线程只把日志记录放入内存队列，格式化和写文件/终端由后台线程完成；
+同一条消息短时间内重复出现时限流，窗口结束后输出“抑制 N 条”汇总
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-# 配置日志
-"""配置日志系统"""
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+DEFAULT_LOG_CONFIG = {
+    'log_dir': 'logs',
+    'log_level': 'INFO',
+    'log_json': False,                # True 时日志文件每行一个 JSON 对象，控制台仍为文本
+    'log_queue_size': 10000,          # 日志队列容量，满时丢弃新记录（不阻塞调用线程）
+    'log_rate_limit_window': 60.0,    # 限流窗口（秒），0 表示不限流
+    'log_rate_limit_burst': 5,        # 每个窗口内同一条消息最多输出的次数
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化日志：每条记录一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        rate_key = getattr(record, 'rate_key', None)
+        if rate_key is not None:
+            entry['key'] = str(rate_key)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimiter:
+    """
+    按消息键限流：每个键在窗口内最多放行 burst 条，其余计数，
+    窗口结束后生成一条汇总记录
+    消息键默认为级别加消息文本；文本里含变化的数字（如重连等待秒数）时，
+    调用方可以用 extra={'rate_key': ...} 指定键
+    """
+
+    def __init__(self, window=60.0, burst=5, max_keys=10000):
+        self.window = window
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.entries = {}  # 键 -> [窗口开始时间, 本窗口条数, 被抑制的最后一条记录]
+        self.last_sweep = time.monotonic()
+
+    def _key(self, record):
+        rate_key = getattr(record, 'rate_key', None)
+        if rate_key is not None:
+            return record.levelno, rate_key
+        return record.levelno, record.getMessage()
+
+    def check(self, record):
+        """
+        Returns:
+            (是否放行, 需要先输出的汇总记录列表)
+        """
+        now = time.monotonic()
+        key = self._key(record)
+        with self.lock:
+            summaries = []
+            # 每秒最多扫描一次，输出已经结束的窗口的汇总（消息不再出现时也能看到抑制数量）
+            if now - self.last_sweep >= 1.0:
+                self.last_sweep = now
+                summaries.extend(self._sweep(now))
+
+            entry = self.entries.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is not None and entry[1] > self.burst:
+                    summaries.append(self._summary(entry))
+                if entry is None and len(self.entries) >= self.max_keys:
+                    # 键过多时不再跟踪新键，直接放行
+                    return True, summaries
+                self.entries[key] = [now, 1, None]
+                return True, summaries
+
+            entry[1] += 1
+            if entry[1] <= self.burst:
+                return True, summaries
+            entry[2] = record
+            return False, summaries
+
+    def _sweep(self, now):
+        summaries = []
+        for key, entry in list(self.entries.items()):
+            if now - entry[0] >= self.window:
+                if entry[1] > self.burst:
+                    summaries.append(self._summary(entry))
+                del self.entries[key]
+        return summaries
+
+    def flush(self):
+        """输出所有窗口的汇总（关闭日志前调用）"""
+        with self.lock:
+            summaries = [self._summary(entry) for entry in self.entries.values() if entry[1] > self.burst]
+            self.entries.clear()
+        return summaries
+
+    def _summary(self, entry):
+        started, count, last = entry
+        suppressed = count - self.burst
+        record = logging.makeLogRecord(last.__dict__)
+        record.msg = f"{last.getMessage()}（{time.monotonic() - started:.0f} 秒内抑制 {suppressed} 条相同消息）"
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.created = time.time()
+        record.msecs = (record.created - int(record.created)) * 1000
+        return record
+
+
+class RateLimitedQueueHandler(QueueHandler):
+    """放入日志队列前先限流；队列满时丢弃并计数，调用线程不会阻塞"""
+
+    def __init__(self, log_queue, limiter=None):
+        super().__init__(log_queue)
+        self.limiter = limiter
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        if self.limiter is None:
+            super().emit(record)
+            return
+
+        allowed, summaries = self.limiter.check(record)
+        for summary in summaries:
+            super().emit(summary)
+        if allowed:
+            super().emit(record)
+
+    def flush_summaries(self):
+        if self.limiter is not None:
+            for summary in self.limiter.flush():
+                super().emit(summary)
+        if self.dropped:
+            record = logging.makeLogRecord({
+                'name': logger.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"日志队列已满，共丢弃 {self.dropped} 条日志"
+            })
+            self.dropped = 0
+            super().emit(record)
+
+
 logger = logging.getLogger('blade_monitoring')
-logger.setLevel(logging.INFO)
-
-# 创建日志目录
-log_dir = Path('logs')
-log_dir.mkdir(exist_ok=True)
-
-# 文件处理器
-file_handler = RotatingFileHandler(
-    log_dir / 'blade_monitoring.log',
-    maxBytes=10 * 1024 * 1024,  # 10MB
-    backupCount=5,
-    encoding='utf-8'
-)
-file_handler.setLevel(logging.INFO)
-
-# 控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-
-# 格式化
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-
-logger = logging.getLogger(__name__)  # 创建 logger 对象
\ No newline at end of file
+
+_queue_handler = None
+_listener = None
+_config_lock = threading.Lock()
+
+
+def configure_logging(config=None):
+    """
+    按配置（重新）建立日志处理链：logger -> 限流队列处理器 -> 后台线程 -> 文件/控制台
+    Args:
+        config: 配置字典，使用 DEFAULT_LOG_CONFIG 中的键，缺省项取默认值
+    Returns:
+        配置好的 logger
+    """
+    global _queue_handler, _listener
+
+    settings = dict(DEFAULT_LOG_CONFIG)
+    settings.update({key: value for key, value in (config or {}).items() if key in DEFAULT_LOG_CONFIG})
+    level = logging.getLevelName(str(settings['log_level']).upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+
+    # 创建日志目录
+    log_dir = Path(settings['log_dir'])
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    # 文件处理器
+    file_handler = RotatingFileHandler(
+        log_dir / 'blade_monitoring.log',
+        maxBytes=10 * 1024 * 1024,  # 10MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter() if settings['log_json'] else logging.Formatter(LOG_FORMAT))
+
+    # 控制台处理器
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    limiter = None
+    if settings['log_rate_limit_window'] and settings['log_rate_limit_window'] > 0:
+        limiter = RateLimiter(settings['log_rate_limit_window'], int(settings['log_rate_limit_burst']))
+
+    log_queue = queue.Queue(maxsize=int(settings['log_queue_size']))
+    queue_handler = RateLimitedQueueHandler(log_queue, limiter)
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+
+    with _config_lock:
+        old_handler, old_listener = _queue_handler, _listener
+        logger.setLevel(level)
+        logger.propagate = False
+        logger.addHandler(queue_handler)
+        if old_handler is not None:
+            logger.removeHandler(old_handler)
+        listener.start()
+        _queue_handler, _listener = queue_handler, listener
+
+    # 旧处理链把已排队的日志写完后关闭
+    if old_handler is not None:
+        old_handler.flush_summaries()
+        old_listener.stop()
+        for handler in old_listener.handlers:
+            handler.close()
+    return logger
+
+
+def shutdown_logging():
+    """输出限流汇总，等待后台线程写完队列中的日志"""
+    global _queue_handler, _listener
+    with _config_lock:
+        handler, listener = _queue_handler, _listener
+        _queue_handler, _listener = None, None
+    if handler is None:
+        return
+    handler.flush_summaries()
+    logger.removeHandler(handler)
+    # 关闭后的日志交给 logging 的默认处理（警告及以上输出到 stderr）
+    logger.propagate = True
+    listener.stop()
+    for target in listener.handlers:
+        target.close()
+
+
+configure_logging()
+atexit.register(shutdown_logging)
+
+
+if __name__ == '__main__':
+    # 压力测试：多个线程高频写日志，比较调用线程的耗时，并检查限流汇总
+    # 用法: python -m page.caiji.loggermodel [每线程条数]
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    configure_logging({'log_dir': 'logs', 'log_rate_limit_window': 1.0, 'log_rate_limit_burst': 3})
+
+    def flood(camera_id, durations):
+        start = time.perf_counter()
+        for i in range(count):
+            logger.warning(f"相机 {camera_id} 读取帧失败")
+            logger.info(f"相机 {camera_id} {i % 7 + 0.5:.1f}秒后尝试重连", extra={'rate_key': ('reconnect', camera_id)})
+        durations.append(time.perf_counter() - start)
+
+    durations = []
+    threads = [threading.Thread(target=flood, args=(f"T{i}", durations)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"8 线程各写 {count * 2} 条，单条平均 {max(durations) / (count * 2) * 1e6:.1f} 微秒（调用线程）")
+    time.sleep(1.2)
+    logger.info("限流窗口结束，输出汇总")
+    shutdown_logging()
@@ -0,0 +1,129 @@
+import math
+
+import cv2
+import numpy as np
+
+# 按缺陷类别 ID 取色（BGR），与前端叠加层的配色一致
+CLASS_COLORS = (
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+    (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+    (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255)
+)
+
+
+def class_color(cls_id):
+    """类别 ID 对应的绘制颜色"""
+    return CLASS_COLORS[int(cls_id) % len(CLASS_COLORS)]
+
+
+def filter_detections(detections, classes=None, min_conf=0.0):
+    """
+    按类别和置信度筛选检测框
+    Args:
+        detections: 告警 JSON 中的检测结果列表
+        classes: 需要保留的缺陷名称集合，为 None 时保留全部
+        min_conf: 最低置信度
+    """
+    return [
+        det for det in detections
+        if (classes is None or det.get('name') in classes) and float(det.get('conf', 0)) >= min_conf
+    ]
+
+
+def draw_detections(image, detections, image_width=None, image_height=None):
+    """
+    在图像上绘制旋转框和标签（原地修改）
+    Args:
+        image: BGR 图像
+        detections: 检测结果列表（x, y, w, h 为原图像素坐标，r 为角度）
+        image_width: 检测时的原图宽度；图片被压缩过时按实际尺寸缩放坐标
+        image_height: 检测时的原图高度
+    Returns:
+        绘制后的图像
+    """
+    height, width = image.shape[:2]
+    scale_x = width / image_width if image_width else 1.0
+    scale_y = height / image_height if image_height else 1.0
+
+    # 线宽和字号随图像尺寸变化，压缩后的小图也能看清
+    thickness = max(1, round(max(width, height) / 800))
+    font_scale = max(0.4, max(width, height) / 2400)
+
+    for det in detections:
+        color = class_color(det.get('clsId', 0))
+        bbox = ((det['x'] * scale_x, det['y'] * scale_y),
+                (det['w'] * scale_x, det['h'] * scale_y),
+                det.get('r', 0))
+        points = cv2.boxPoints(bbox).astype(np.int32)
+        cv2.polylines(image, [points], isClosed=True, color=color, thickness=thickness)
+
+        # cv2 无法绘制中文，标签使用英文缺陷名称
+        text = f"{det['name']} {float(det.get('conf', 0)):.2f}"
+        (text_w, text_h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+
+        # 标签放在旋转框最上方的顶点处，底色与框同色
+        top = points[np.argmin(points[:, 1])]
+        x = int(min(max(top[0], 0), max(width - text_w, 0)))
+        y = int(max(top[1], text_h + baseline))
+        cv2.rectangle(image, (x, y - text_h - baseline), (x + text_w, y), color, -1)
+        cv2.putText(image, text, (x, y - baseline), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    (255, 255, 255), thickness, cv2.LINE_AA)
+
+    return image
+
+
+def crop_detection(image, det, image_width=None, image_height=None, padding=0.25, min_size=48, max_size=256):
+    """
+    按旋转框截取缺陷小图：旋转到框的宽边水平，四周留出 padding 比例的背景
+    只计算输出小图的像素（warpAffine 的输出尺寸即小图尺寸），不旋转整幅图像
+    Args:
+        image: BGR 图像
+        det: 检测结果（x, y, w, h 为原图像素坐标，r 为角度）
+        image_width: 检测时的原图宽度；图片被压缩过时按实际尺寸缩放坐标
+        image_height: 检测时的原图高度
+        padding: 每侧留出的背景占框宽高的比例
+        min_size: 小图最短边（细长裂纹也保留足够的上下文）
+        max_size: 小图最长边，超过时整体缩小
+    Returns:
+        (小图, 缺陷框在小图中的位置 [x0, y0, x1, y1])
+    """
+    height, width = image.shape[:2]
+    scale_x = width / image_width if image_width else 1.0
+    scale_y = height / image_height if image_height else 1.0
+    center = (det['x'] * scale_x, det['y'] * scale_y)
+    box_w = max(det['w'] * scale_x, 1.0)
+    box_h = max(det['h'] * scale_y, 1.0)
+
+    padded_w = box_w * (1 + 2 * padding)
+    padded_h = box_h * (1 + 2 * padding)
+    zoom = min(1.0, max_size / max(padded_w, padded_h))
+    out_w = min(max(round(padded_w * zoom), min_size), max_size)
+    out_h = min(max(round(padded_h * zoom), min_size), max_size)
+
+    # 绕框中心旋转 r 度（与 cv2.boxPoints 约定一致，旋转后框的宽边水平），再把框中心平移到小图中心
+    matrix = cv2.getRotationMatrix2D(center, det.get('r', 0), zoom)
+    matrix[0, 2] += out_w / 2 - center[0]
+    matrix[1, 2] += out_h / 2 - center[1]
+    crop = cv2.warpAffine(image, matrix, (out_w, out_h), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+
+    half_w, half_h = box_w * zoom / 2, box_h * zoom / 2
+    box = [max(0, math.floor(out_w / 2 - half_w)), max(0, math.floor(out_h / 2 - half_h)),
+           min(out_w, math.ceil(out_w / 2 + half_w)), min(out_h, math.ceil(out_h / 2 + half_h))]
+    return crop, box
+
+
+def render_annotated(image_path, detections, image_width=None, image_height=None, quality=90):
+    """
+    读取告警原图并烧录检测框，返回 JPEG 字节
+    Returns:
+        JPEG 数据；图片不存在或无法解码时返回 None
+    """
+    image = cv2.imread(str(image_path))
+    if image is None:
+        return None
+
+    draw_detections(image, detections, image_width, image_height)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ok else None
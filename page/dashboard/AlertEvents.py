@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class AlertBroker:
+    """告警事件广播：保存最近的告警事件，供 SSE 连接等待和断线续传"""
+
+    def __init__(self, history=500):
+        """
+        初始化事件广播
+        Args:
+            history: 保留用于断线续传的事件数量
+        """
+        self.events = deque(maxlen=history)
+        self.last_seq = 0
+        self.condition = threading.Condition()
+
+        # 进程重启后序号从头开始，用启动标记区分旧连接带回的事件ID
+        self.boot_id = format(int(time.time() * 1000), 'x')
+
+    def publish(self, alert):
+        """发布一条新告警，唤醒所有等待中的连接"""
+        with self.condition:
+            self.last_seq += 1
+            self.events.append((self.last_seq, alert))
+            self.condition.notify_all()
+            return self.last_seq
+
+    def bounds(self):
+        """返回 (最早保留的事件序号, 最新事件序号)"""
+        with self.condition:
+            oldest = self.events[0][0] if self.events else None
+            return oldest, self.last_seq
+
+    def wait(self, seq, timeout=15.0):
+        """等待序号 seq 之后的新事件，超时返回空列表"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_seq > seq, timeout=timeout)
+            return [(s, alert) for s, alert in self.events if s > seq]
+
+    def event_id(self, seq):
+        """事件序号转换为 SSE 事件ID"""
+        return f"{self.boot_id}-{seq}"
+
+    def resolve(self, last_event_id):
+        """
+        解析客户端带回的 Last-Event-ID
+        Returns:
+            (seq, reset): 续传起点；reset 为 True 表示缺失的事件已无法补发，客户端需重新加载
+        """
+        oldest, newest = self.bounds()
+        if not last_event_id:
+            return newest, False
+
+        boot_id, _, seq = last_event_id.partition('-')
+        if boot_id != self.boot_id or not seq.isdigit() or int(seq) > newest:
+            return newest, True
+
+        seq = int(seq)
+        if seq + 1 < (oldest if oldest is not None else newest + 1):
+            return newest, True
+        return seq, False
+
+    def stream(self, last_event_id=None, keepalive=15.0):
+        """生成 SSE 文本流"""
+        seq, reset = self.resolve(last_event_id)
+
+        yield 'retry: 5000\n\n'
+        if reset:
+            yield f"id: {self.event_id(seq)}\nevent: reset\ndata: {{}}\n\n"
+
+        while True:
+            events = self.wait(seq, timeout=keepalive)
+            if not events:
+                # 注释行保持连接，防止代理超时断开
+                yield ': keepalive\n\n'
+                continue
+
+            for seq, alert in events:
+                data = json.dumps(alert, ensure_ascii=False)
+                yield f"id: {self.event_id(seq)}\nevent: alert\ndata: {data}\n\n"
+
+
+class SharedAlertBroker(AlertBroker):
+    """多进程共享的事件广播：事件写入 SQLite 索引库，各工作进程轮询读取"""
+
+    def __init__(self, index, history=500, poll_interval=0.5):
+        """
+        初始化共享事件广播
+        Args:
+            index: AlertIndex 实例（共享存储）
+            history: 保留用于断线续传的事件数量
+            poll_interval: 等待新事件时的轮询间隔（秒）
+        """
+        self.index = index
+        self.history = history
+        self.poll_interval = poll_interval
+
+        # 事件序号持久化在数据库中，重启后旧的事件ID仍然有效
+        self.boot_id = index.boot_id
+
+    def publish(self, alert):
+        return self.index.add_event(alert, keep=self.history)
+
+    def bounds(self):
+        return self.index.event_bounds()
+
+    def wait(self, seq, timeout=15.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.index.events_after(seq)
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(self.poll_interval)
@@ -0,0 +1,626 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    alert_id        TEXT PRIMARY KEY,
+    camera_id       TEXT,
+    camera_name     TEXT,
+    detection_ts    REAL NOT NULL,
+    detection_time  TEXT,
+    image_filename  TEXT,
+    json_path       TEXT,
+    max_conf        REAL,
+    detection_count INTEGER,
+    payload         TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts(detection_ts, alert_id);
+CREATE INDEX IF NOT EXISTS idx_alerts_camera_ts ON alerts(camera_id, detection_ts);
+
+CREATE TABLE IF NOT EXISTS detections (
+    alert_id     TEXT NOT NULL,
+    name         TEXT,
+    conf         REAL,
+    detection_ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_alert ON detections(alert_id);
+CREATE INDEX IF NOT EXISTS idx_detections_name_ts ON detections(name, detection_ts);
+
+-- 多进程共享状态：计数器（缓存版本等）和新告警事件
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_ts REAL,
+    payload    TEXT
+);
+
+-- 风机注册表和统计汇总：入库时增量更新，查询时不再扫描告警
+CREATE TABLE IF NOT EXISTS camera_stats (
+    camera_id       TEXT PRIMARY KEY,
+    camera_name     TEXT,
+    alert_count     INTEGER NOT NULL DEFAULT 0,
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    first_ts        REAL,
+    last_ts         REAL,
+    last_alert_id   TEXT
+);
+CREATE TABLE IF NOT EXISTS camera_daily (
+    camera_id       TEXT NOT NULL,
+    day             TEXT NOT NULL,
+    alert_count     INTEGER NOT NULL DEFAULT 0,
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (camera_id, day)
+);
+CREATE TABLE IF NOT EXISTS camera_defects (
+    camera_id TEXT NOT NULL,
+    day       TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    count     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (camera_id, day, name)
+);
+"""
+
+# 归档后的告警 JSON：每天的 jsons/ 目录压缩为同级的 jsons.zip，成员名保持不变
+ARCHIVE_NAME = 'jsons.zip'
+
+# 汇总表结构版本，旧数据库升级时从 alerts/detections 重新汇总
+STATS_VERSION = '1'
+
+
+def to_timestamp(detection_time):
+    """将 ISO 格式时间转换为时间戳（无时区信息时按本地时间处理）"""
+    if isinstance(detection_time, datetime):
+        return detection_time.timestamp()
+    return datetime.fromisoformat(str(detection_time).replace('Z', '+00:00')).timestamp()
+
+
+def to_day(detection_time):
+    """告警所属日期 YYYY-MM-DD（与告警目录 年/月/日 的划分一致）"""
+    return str(detection_time)[:10]
+
+
+def read_archive(zip_path):
+    """
+    读取归档中的告警
+    Yields:
+        (成员路径, alert)：成员路径形如 .../jsons.zip/<alert_id>.json
+    """
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for name in archive.namelist():
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    yield f"{zip_path}/{name}", json.loads(archive.read(name).decode('utf-8'))
+                except Exception as e:
+                    logger.error(f"读取归档告警失败 {zip_path}/{name}: {e}")
+    except (OSError, zipfile.BadZipFile) as e:
+        logger.error(f"读取告警归档失败 {zip_path}: {e}")
+
+
+def iter_alert_files(alert_dir):
+    """
+    遍历告警目录下的所有告警（JSON 文件和归档）
+    Yields:
+        (json_path, alert)
+    """
+    alert_dir = Path(alert_dir)
+    for json_file in alert_dir.rglob('*.json'):
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                yield json_file, json.load(f)
+        except Exception as e:
+            logger.error(f"读取告警文件失败 {json_file}: {e}")
+
+    for zip_path in alert_dir.rglob(ARCHIVE_NAME):
+        yield from read_archive(zip_path)
+
+
+class AlertIndex:
+    """告警元数据索引：SQLite（WAL 模式），入库时增量更新，可从磁盘重建"""
+
+    def __init__(self, db_path):
+        """
+        初始化告警索引
+        Args:
+            db_path: SQLite 数据库文件路径
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # sqlite3 连接不能跨线程共享，每个线程一个连接；写操作串行化
+        self._local = threading.local()
+        self.write_lock = threading.Lock()
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        # 数据库标记：区分不同数据库生成的 ETag 和事件ID
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('boot_id', ?)",
+            (format(int(time.time() * 1000), 'x'),)
+        )
+        conn.commit()
+        self.boot_id = self.get_meta('boot_id')
+
+        # 旧版本数据库没有汇总表，升级时从已有索引汇总一次
+        if self.get_meta('stats_version') != STATS_VERSION:
+            with self.write_lock:
+                with conn:
+                    self._rebuild_stats(conn)
+
+        logger.info(f"告警索引初始化完成: {self.db_path.absolute()}")
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, conn, alert, json_path=None, account=True):
+        """
+        写入单条告警（同一 alert_id 重复写入时覆盖旧记录）
+        Args:
+            account: 是否同时更新风机统计（重建时最后统一汇总）
+        """
+        alert_id = alert.get('alert_id')
+        detection_time = alert.get('detection_time')
+        if not alert_id or not detection_time:
+            return False
+
+        try:
+            detection_ts = to_timestamp(detection_time)
+        except ValueError:
+            logger.warning(f"告警 {alert_id} 检测时间格式不正确: {detection_time}")
+            return False
+
+        detections = alert.get('detections') or []
+        confs = [float(det.get('conf', 0)) for det in detections]
+
+        # 覆盖已有告警时先扣除旧记录的统计，保证每条告警只计一次
+        if account:
+            self._unaccount(conn, alert_id)
+
+        conn.execute('DELETE FROM detections WHERE alert_id = ?', (alert_id,))
+        conn.execute(
+            'INSERT OR REPLACE INTO alerts (alert_id, camera_id, camera_name, detection_ts, detection_time, '
+            'image_filename, json_path, max_conf, detection_count, payload) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                alert_id,
+                alert.get('camera_id'),
+                alert.get('camera_name'),
+                detection_ts,
+                detection_time,
+                alert.get('image_filename'),
+                str(json_path) if json_path else alert.get('json_path'),
+                max(confs) if confs else None,
+                len(detections),
+                json.dumps(alert, ensure_ascii=False)
+            )
+        )
+        conn.executemany(
+            'INSERT INTO detections (alert_id, name, conf, detection_ts) VALUES (?, ?, ?, ?)',
+            [(alert_id, det.get('name'), float(det.get('conf', 0)), detection_ts) for det in detections]
+        )
+
+        if account:
+            self._account(conn, alert, detection_ts)
+        return True
+
+    def _account(self, conn, alert, detection_ts):
+        """新告警计入风机、日期、缺陷类别统计"""
+        camera_id = alert.get('camera_id')
+        if not camera_id:
+            return
+
+        detections = alert.get('detections') or []
+        day = to_day(alert.get('detection_time'))
+
+        conn.execute(
+            'INSERT INTO camera_stats (camera_id, camera_name, alert_count, detection_count, '
+            'first_ts, last_ts, last_alert_id) VALUES (?, ?, 1, ?, ?, ?, ?) '
+            'ON CONFLICT(camera_id) DO UPDATE SET '
+            'alert_count = alert_count + 1, '
+            'detection_count = detection_count + excluded.detection_count, '
+            'camera_name = COALESCE(excluded.camera_name, camera_name), '
+            'first_ts = MIN(COALESCE(first_ts, excluded.first_ts), excluded.first_ts), '
+            'last_alert_id = CASE WHEN last_ts IS NULL OR excluded.last_ts >= last_ts '
+            'THEN excluded.last_alert_id ELSE last_alert_id END, '
+            'last_ts = MAX(COALESCE(last_ts, excluded.last_ts), excluded.last_ts)',
+            (camera_id, alert.get('camera_name'), len(detections), detection_ts, detection_ts,
+             alert.get('alert_id'))
+        )
+        conn.execute(
+            'INSERT INTO camera_daily (camera_id, day, alert_count, detection_count) VALUES (?, ?, 1, ?) '
+            'ON CONFLICT(camera_id, day) DO UPDATE SET '
+            'alert_count = alert_count + 1, detection_count = detection_count + excluded.detection_count',
+            (camera_id, day, len(detections))
+        )
+        conn.executemany(
+            'INSERT INTO camera_defects (camera_id, day, name, count) VALUES (?, ?, ?, 1) '
+            'ON CONFLICT(camera_id, day, name) DO UPDATE SET count = count + 1',
+            [(camera_id, day, det.get('name') or '') for det in detections]
+        )
+
+    def _unaccount(self, conn, alert_id):
+        """从统计中扣除索引里已有的告警（覆盖或删除前调用）"""
+        row = conn.execute(
+            'SELECT camera_id, detection_time FROM alerts WHERE alert_id = ?', (alert_id,)
+        ).fetchone()
+        if row is None or not row[0]:
+            return
+
+        camera_id, day = row[0], to_day(row[1])
+        names = [r[0] or '' for r in conn.execute(
+            'SELECT name FROM detections WHERE alert_id = ?', (alert_id,)
+        )]
+
+        conn.execute(
+            'UPDATE camera_stats SET alert_count = alert_count - 1, detection_count = detection_count - ? '
+            'WHERE camera_id = ?',
+            (len(names), camera_id)
+        )
+        conn.execute(
+            'UPDATE camera_daily SET alert_count = alert_count - 1, detection_count = detection_count - ? '
+            'WHERE camera_id = ? AND day = ?',
+            (len(names), camera_id, day)
+        )
+        conn.executemany(
+            'UPDATE camera_defects SET count = count - 1 WHERE camera_id = ? AND day = ? AND name = ?',
+            [(camera_id, day, name) for name in names]
+        )
+        conn.execute('DELETE FROM camera_daily WHERE camera_id = ? AND day = ? AND alert_count <= 0',
+                     (camera_id, day))
+        conn.execute('DELETE FROM camera_defects WHERE camera_id = ? AND day = ? AND count <= 0',
+                     (camera_id, day))
+
+    def _refresh_camera_bounds(self, conn, camera_ids):
+        """告警删除后重新确定风机的首末告警，没有告警的风机移出注册表"""
+        for camera_id in camera_ids:
+            row = conn.execute(
+                'SELECT alert_id, detection_ts FROM alerts WHERE camera_id = ? '
+                'ORDER BY detection_ts DESC, alert_id DESC LIMIT 1',
+                (camera_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute('DELETE FROM camera_stats WHERE camera_id = ?', (camera_id,))
+                continue
+
+            first_ts = conn.execute(
+                'SELECT MIN(detection_ts) FROM alerts WHERE camera_id = ?', (camera_id,)
+            ).fetchone()[0]
+            conn.execute(
+                'UPDATE camera_stats SET first_ts = ?, last_ts = ?, last_alert_id = ? WHERE camera_id = ?',
+                (first_ts, row[1], row[0], camera_id)
+            )
+
+    def _rebuild_stats(self, conn):
+        """由 alerts/detections 重新汇总全部统计"""
+        conn.execute('DELETE FROM camera_stats')
+        conn.execute('DELETE FROM camera_daily')
+        conn.execute('DELETE FROM camera_defects')
+
+        conn.execute(
+            'INSERT INTO camera_stats (camera_id, alert_count, detection_count, first_ts, last_ts) '
+            'SELECT camera_id, COUNT(*), COALESCE(SUM(detection_count), 0), MIN(detection_ts), MAX(detection_ts) '
+            'FROM alerts WHERE camera_id IS NOT NULL AND camera_id != \'\' GROUP BY camera_id'
+        )
+        conn.execute(
+            'UPDATE camera_stats SET '
+            'camera_name = (SELECT a.camera_name FROM alerts a WHERE a.camera_id = camera_stats.camera_id '
+            'ORDER BY a.detection_ts DESC, a.alert_id DESC LIMIT 1), '
+            'last_alert_id = (SELECT a.alert_id FROM alerts a WHERE a.camera_id = camera_stats.camera_id '
+            'ORDER BY a.detection_ts DESC, a.alert_id DESC LIMIT 1)'
+        )
+        conn.execute(
+            'INSERT INTO camera_daily (camera_id, day, alert_count, detection_count) '
+            'SELECT camera_id, substr(detection_time, 1, 10), COUNT(*), COALESCE(SUM(detection_count), 0) '
+            'FROM alerts WHERE camera_id IS NOT NULL AND camera_id != \'\' '
+            'GROUP BY camera_id, substr(detection_time, 1, 10)'
+        )
+        conn.execute(
+            'INSERT INTO camera_defects (camera_id, day, name, count) '
+            'SELECT a.camera_id, substr(a.detection_time, 1, 10), COALESCE(d.name, \'\'), COUNT(*) '
+            'FROM detections d JOIN alerts a ON a.alert_id = d.alert_id '
+            'WHERE a.camera_id IS NOT NULL AND a.camera_id != \'\' '
+            'GROUP BY a.camera_id, substr(a.detection_time, 1, 10), COALESCE(d.name, \'\')'
+        )
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats_version', ?)", (STATS_VERSION,))
+
+    def add(self, alert, json_path=None):
+        """入库时写入单条告警"""
+        with self.write_lock:
+            conn = self._connect()
+            with conn:
+                return self._insert(conn, alert, json_path)
+
+    def add_many(self, alerts):
+        """批量写入告警（单个事务）"""
+        if not alerts:
+            return 0
+        with self.write_lock:
+            conn = self._connect()
+            with conn:
+                return sum(1 for alert in alerts if self._insert(conn, alert))
+
+    def remove(self, alert_ids):
+        """删除告警（保留策略清理磁盘后调用），返回实际删除的数量"""
+        if not alert_ids:
+            return 0
+
+        removed = 0
+        with self.write_lock:
+            conn = self._connect()
+            with conn:
+                cameras = set()
+                for alert_id in alert_ids:
+                    row = conn.execute('SELECT camera_id FROM alerts WHERE alert_id = ?', (alert_id,)).fetchone()
+                    if row is None:
+                        continue
+                    self._unaccount(conn, alert_id)
+                    conn.execute('DELETE FROM detections WHERE alert_id = ?', (alert_id,))
+                    conn.execute('DELETE FROM alerts WHERE alert_id = ?', (alert_id,))
+                    if row[0]:
+                        cameras.add(row[0])
+                    removed += 1
+                self._refresh_camera_bounds(conn, cameras)
+        return removed
+
+    def missing(self, alert_ids):
+        """返回尚未写入索引的告警ID"""
+        conn = self._connect()
+        return {
+            alert_id for alert_id in alert_ids
+            if conn.execute('SELECT 1 FROM alerts WHERE alert_id = ?', (alert_id,)).fetchone() is None
+        }
+
+    def count(self):
+        """索引中的告警总数"""
+        return self._connect().execute('SELECT COUNT(*) FROM alerts').fetchone()[0]
+
+    def search(self, start_ts, end_ts, camera_id=None, defect_name=None, min_confidence=None,
+               after=None, limit=100, offset=0):
+        """
+        按时间范围、风机号、缺陷名称和最低置信度查询告警
+        Args:
+            after: 键集分页位置 (detection_ts, alert_id)，只返回比它更早的告警
+        Returns:
+            (items, total): 当前页 [(detection_ts, alert), ...]（按检测时间倒序）和匹配总数
+        """
+        where = ['a.detection_ts >= ?', 'a.detection_ts <= ?']
+        params = [start_ts, end_ts]
+
+        if camera_id:
+            where.append('a.camera_id = ?')
+            params.append(camera_id)
+
+        if defect_name:
+            where.append(
+                'EXISTS (SELECT 1 FROM detections d WHERE d.alert_id = a.alert_id AND d.name = ?)'
+            )
+            params.append(defect_name)
+
+        # 与文件搜索保持一致：没有检测结果的告警不参与置信度筛选
+        if min_confidence:
+            where.append('(a.max_conf IS NULL OR a.max_conf >= ?)')
+            params.append(float(min_confidence))
+
+        where_sql = ' AND '.join(where)
+        conn = self._connect()
+
+        total = conn.execute(f'SELECT COUNT(*) FROM alerts a WHERE {where_sql}', params).fetchone()[0]
+
+        if after:
+            where_sql += ' AND (a.detection_ts < ? OR (a.detection_ts = ? AND a.alert_id < ?))'
+            params = params + [after[0], after[0], after[1]]
+            offset = 0
+
+        rows = conn.execute(
+            f'SELECT a.detection_ts, a.payload FROM alerts a WHERE {where_sql} '
+            f'ORDER BY a.detection_ts DESC, a.alert_id DESC LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        ).fetchall()
+
+        return [(row[0], json.loads(row[1])) for row in rows], total
+
+    def recent(self, limit=100, offset=0):
+        """按检测时间倒序获取最近的告警"""
+        rows = self._connect().execute(
+            'SELECT payload FROM alerts ORDER BY detection_ts DESC, alert_id DESC LIMIT ? OFFSET ?',
+            (limit, offset)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, alert_id):
+        """按告警 ID 获取告警，不存在时返回 None"""
+        row = self._connect().execute(
+            'SELECT payload FROM alerts WHERE alert_id = ?', (alert_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def camera_ids(self):
+        """风机注册表中的所有风机号"""
+        rows = self._connect().execute('SELECT camera_id FROM camera_stats').fetchall()
+        return {row[0] for row in rows}
+
+    def camera_stats(self, camera_id=None):
+        """
+        风机汇总统计
+        Args:
+            camera_id: 指定风机；为空时返回所有风机
+        Returns:
+            [{camera_id, camera_name, alert_count, detection_count, first_ts, last_ts, last_alert_id}, ...]
+        """
+        sql = ('SELECT camera_id, camera_name, alert_count, detection_count, first_ts, last_ts, last_alert_id '
+               'FROM camera_stats')
+        params = ()
+        if camera_id:
+            sql += ' WHERE camera_id = ?'
+            params = (camera_id,)
+
+        keys = ('camera_id', 'camera_name', 'alert_count', 'detection_count', 'first_ts', 'last_ts',
+                'last_alert_id')
+        return [dict(zip(keys, row)) for row in self._connect().execute(sql, params)]
+
+    def daily_stats(self, start_day, end_day, camera_id=None):
+        """
+        按日期汇总告警数和缺陷数
+        Returns:
+            [{day, alert_count, detection_count}, ...]（按日期升序）
+        """
+        where, params = 'day >= ? AND day <= ?', [start_day, end_day]
+        if camera_id:
+            where += ' AND camera_id = ?'
+            params.append(camera_id)
+
+        rows = self._connect().execute(
+            f'SELECT day, SUM(alert_count), SUM(detection_count) FROM camera_daily '
+            f'WHERE {where} GROUP BY day ORDER BY day',
+            params
+        )
+        return [{'day': row[0], 'alert_count': row[1], 'detection_count': row[2]} for row in rows]
+
+    def defect_stats(self, start_day, end_day, camera_id=None):
+        """
+        按缺陷类别汇总检测数
+        Returns:
+            [{name, count}, ...]（按数量降序）
+        """
+        where, params = 'day >= ? AND day <= ?', [start_day, end_day]
+        if camera_id:
+            where += ' AND camera_id = ?'
+            params.append(camera_id)
+
+        rows = self._connect().execute(
+            f'SELECT name, SUM(count) AS total FROM camera_defects '
+            f'WHERE {where} GROUP BY name ORDER BY total DESC, name',
+            params
+        )
+        return [{'name': row[0], 'count': row[1]} for row in rows]
+
+    def get_meta(self, key, default=None):
+        """读取共享状态"""
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        """写入共享状态"""
+        with self.write_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def increment(self, key):
+        """共享计数器加一（跨进程原子操作），返回新值"""
+        with self.write_lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, '1') "
+                    "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                    (key,)
+                )
+                return int(conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()[0])
+
+    def add_event(self, alert, keep=500):
+        """写入一条新告警事件，只保留最近 keep 条，返回事件序号"""
+        with self.write_lock:
+            conn = self._connect()
+            with conn:
+                seq = conn.execute(
+                    'INSERT INTO events (created_ts, payload) VALUES (?, ?)',
+                    (time.time(), json.dumps(alert, ensure_ascii=False))
+                ).lastrowid
+                conn.execute('DELETE FROM events WHERE seq <= ?', (seq - keep,))
+                return seq
+
+    def events_after(self, seq):
+        """序号 seq 之后的事件"""
+        rows = self._connect().execute(
+            'SELECT seq, payload FROM events WHERE seq > ? ORDER BY seq', (seq,)
+        ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def event_bounds(self):
+        """返回 (最早保留的事件序号, 最新事件序号)，没有事件时为 (None, 0)"""
+        conn = self._connect()
+        oldest, newest = conn.execute('SELECT MIN(seq), MAX(seq) FROM events').fetchone()
+        if newest is None:
+            # 事件全部被清理时，从自增序列读取最新序号
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+            newest = row[0] if row else 0
+        return oldest, newest
+
+    def rebuild(self, alert_dir, batch_size=500):
+        """
+        从磁盘上的 JSON 文件和归档重建索引
+        分批提交，每批只短暂占用写锁，其他线程/进程的写入不会因重建而超时；
+        重建期间旧记录保留可查，全部写完后再删除磁盘上已不存在的告警并重新汇总统计
+        Args:
+            batch_size: 每个事务写入的告警数
+        """
+        alert_dir = Path(alert_dir)
+        start = datetime.now()
+        indexed = 0
+
+        # 重建开始前的最大 rowid：重建和并发写入都会生成更大的 rowid（INSERT OR REPLACE 分配新行），
+        # 最后仍不超过它的行就是磁盘上已不存在的告警
+        conn = self._connect()
+        watermark = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM alerts').fetchone()[0]
+
+        def flush(batch):
+            with self.write_lock:
+                with conn:
+                    count = 0
+                    for json_path, alert in batch:
+                        try:
+                            if self._insert(conn, alert, json_path, account=False):
+                                count += 1
+                        except Exception as e:
+                            logger.error(f"索引告警文件失败 {json_path}: {e}")
+                    return count
+
+        batch = []
+        for item in iter_alert_files(alert_dir):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                indexed += flush(batch)
+                batch = []
+        indexed += flush(batch)
+
+        with self.write_lock:
+            with conn:
+                conn.execute('DELETE FROM detections WHERE alert_id IN (SELECT alert_id FROM alerts WHERE rowid <= ?)',
+                             (watermark,))
+                removed = conn.execute('DELETE FROM alerts WHERE rowid <= ?', (watermark,)).rowcount
+                self._rebuild_stats(conn)
+                # 与清理和汇总在同一事务中提交：标记存在即表示索引完整
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('index_ready', '1')")
+
+        logger.info(
+            f"告警索引重建完成，共 {indexed} 条，移除失效记录 {removed} 条，"
+            f"耗时 {(datetime.now() - start).total_seconds():.1f} 秒"
+        )
+        return indexed
+
+    def close(self):
+        """关闭当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,461 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zipfile
+from datetime import datetime, date, timedelta
+from pathlib import Path
+
+import cv2
+
+from page.dashboard.AlertIndex import ARCHIVE_NAME
+from page.dashboard.AlertSearch import iter_day_dirs
+
+logger = logging.getLogger(__name__)
+
+# 图片已降级为缩略图的日期目录标记
+COMPACTED_MARKER = '.compacted'
+
+
+class IoThrottle:
+    """磁盘读写限速（令牌桶），保证清理任务不挤占告警写入的 IO"""
+
+    def __init__(self, bytes_per_sec, stop_event=None):
+        """
+        Args:
+            bytes_per_sec: 每秒允许的读写字节数；为 0 或 None 时不限速
+            stop_event: 停止事件，限速等待期间收到停止信号立即返回
+        """
+        self.bytes_per_sec = bytes_per_sec
+        self.stop_event = stop_event or threading.Event()
+        self.allowance = bytes_per_sec or 0
+        self.last_time = time.monotonic()
+
+    def consume(self, nbytes):
+        """记录一次读写，超出速率时等待"""
+        if not self.bytes_per_sec:
+            return
+
+        now = time.monotonic()
+        # 最多积攒 1 秒的额度，空闲后不会突发大量 IO
+        self.allowance = min(self.bytes_per_sec, self.allowance + (now - self.last_time) * self.bytes_per_sec)
+        self.last_time = now
+
+        self.allowance -= nbytes
+        if self.allowance < 0:
+            self.stop_event.wait(-self.allowance / self.bytes_per_sec)
+
+
+class RetentionManager:
+    """
+    告警目录保留策略：按 风机/年/月/日 目录执行
+    1. 超过 max_age_days 的日期目录删除
+    2. 超过 compact_after_days 的图片降级为压缩缩略图
+    3. 超过 archive_after_days 的 jsons/ 目录压缩为 jsons.zip（历史搜索和索引重建仍可读取）
+    4. 单个风机超过 camera_quota_mb 或总量超过 disk_budget_gb 时，从最早的日期开始删除
+    当天的目录不做任何处理
+    """
+
+    def __init__(self, alert_dir, index=None, max_age_days=None, compact_after_days=None,
+                 archive_after_days=None, camera_quota_mb=None, disk_budget_gb=None,
+                 compact_width=640, compact_quality=60, io_limit_mb=10, interval=3600,
+                 on_removed=None):
+        """
+        初始化保留策略
+        Args:
+            alert_dir: 告警根目录
+            index: AlertIndex 实例，删除的告警同步移出索引
+            max_age_days: 最长保留天数
+            compact_after_days: 图片降级为缩略图的天数
+            archive_after_days: JSON 归档的天数
+            camera_quota_mb: 单个风机的磁盘配额（MB）
+            disk_budget_gb: 告警目录的总磁盘预算（GB）
+            compact_width: 降级后的图片最大宽度
+            compact_quality: 降级后的 JPEG 质量
+            io_limit_mb: 清理任务的读写速率上限（MB/s），0 表示不限速
+            interval: 后台执行间隔（秒）
+            on_removed: 告警被删除后的回调，参数为告警ID列表
+        """
+        self.alert_dir = Path(alert_dir)
+        self.index = index
+        self.max_age_days = max_age_days
+        self.compact_after_days = compact_after_days
+        self.archive_after_days = archive_after_days
+        self.camera_quota = int(camera_quota_mb * 1024 ** 2) if camera_quota_mb else None
+        self.disk_budget = int(disk_budget_gb * 1024 ** 3) if disk_budget_gb else None
+        self.compact_width = compact_width
+        self.compact_quality = compact_quality
+        self.io_limit = int(io_limit_mb * 1024 ** 2) if io_limit_mb else 0
+        self.interval = interval
+        self.on_removed = on_removed
+
+        self.stop_event = threading.Event()
+        self.run_lock = threading.Lock()
+        self.thread = None
+        self.last_report = None
+
+        # 子目录大小缓存：{路径: (目录修改时间, 字节数)}，目录内容未变化时不再逐个 stat
+        self.size_cache = {}
+        self.previous_sizes = {}
+
+    @property
+    def enabled(self):
+        """是否配置了任一保留策略"""
+        return any(value for value in (self.max_age_days, self.compact_after_days, self.archive_after_days,
+                                       self.camera_quota, self.disk_budget))
+
+    def policy(self):
+        """当前保留策略（用于接口展示）"""
+        return {
+            'max_age_days': self.max_age_days,
+            'compact_after_days': self.compact_after_days,
+            'archive_after_days': self.archive_after_days,
+            'camera_quota_mb': self.camera_quota // 1024 ** 2 if self.camera_quota else None,
+            'disk_budget_gb': round(self.disk_budget / 1024 ** 3, 2) if self.disk_budget else None,
+            'io_limit_mb': self.io_limit / 1024 ** 2 if self.io_limit else 0,
+            'interval': self.interval
+        }
+
+    def start(self):
+        """启动后台清理线程"""
+        if not self.enabled:
+            logger.info("未配置告警保留策略，不启动清理线程")
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run_loop, name="AlertRetention", daemon=True)
+        self.thread.start()
+        logger.info(f"告警保留策略已启动: {self.policy()}")
+
+    def stop(self):
+        """停止后台清理线程"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=10.0)
+
+    def _run_loop(self):
+        # 清理线程降低调度优先级（Linux 下可按线程设置 nice 值）
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+        while not self.stop_event.is_set():
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f"执行告警保留策略出错: {e}")
+            self.stop_event.wait(self.interval)
+
+    def _dir_size(self, path):
+        """目录下文件的总字节数（不递归）"""
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return 0
+
+        cached = self.previous_sizes.get(path)
+        if cached and cached[0] == mtime:
+            total = cached[1]
+        else:
+            total = 0
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        self.size_cache[path] = (mtime, total)
+        return total
+
+    def _day_bytes(self, day_dir):
+        """日期目录占用的字节数（images、jsons、crops、thumbs/<宽度> 和归档）"""
+        total = self._dir_size(day_dir)
+        for sub in ('images', 'jsons', 'crops'):
+            if (day_dir / sub).is_dir():
+                total += self._dir_size(day_dir / sub)
+        thumbs = day_dir / 'thumbs'
+        if thumbs.is_dir():
+            total += sum(self._dir_size(width_dir) for width_dir in thumbs.iterdir() if width_dir.is_dir())
+        return total
+
+    def collect_days(self):
+        """
+        列出所有日期目录
+        Returns:
+            [{camera_id, date, path, bytes, compacted, archived}, ...]（按日期升序）
+        """
+        days = []
+        if not self.alert_dir.exists():
+            return days
+
+        # 只保留本轮仍存在的目录的缓存
+        self.previous_sizes, self.size_cache = self.size_cache, {}
+
+        for day_date, day_dirs in iter_day_dirs(self.alert_dir, datetime.min, datetime.max):
+            for day_dir in day_dirs:
+                days.append({
+                    'camera_id': day_dir.parent.parent.parent.name,
+                    'date': day_date,
+                    'path': day_dir,
+                    'bytes': self._day_bytes(day_dir),
+                    'compacted': (day_dir / COMPACTED_MARKER).exists(),
+                    'archived': not (day_dir / 'jsons').is_dir() and (day_dir / ARCHIVE_NAME).exists()
+                })
+
+        days.sort(key=lambda x: (x['date'], x['camera_id']))
+        self.previous_sizes = {}
+        return days
+
+    def plan(self, days=None, today=None):
+        """
+        根据保留策略生成清理计划（不修改磁盘）
+        Returns:
+            [{action, camera_id, date, path, bytes, reason}, ...]；action 为 delete、compact、archive
+        """
+        days = self.collect_days() if days is None else days
+        today = today or date.today()
+        actions = []
+        deleted = set()
+
+        def add(action, day, reason):
+            actions.append({
+                'action': action,
+                'camera_id': day['camera_id'],
+                'date': day['date'].isoformat(),
+                'path': day['path'],
+                'bytes': day['bytes'],
+                'reason': reason
+            })
+            if action == 'delete':
+                deleted.add(day['path'])
+
+        candidates = [day for day in days if day['date'] < today]
+
+        if self.max_age_days:
+            cutoff = today - timedelta(days=self.max_age_days)
+            for day in candidates:
+                if day['date'] < cutoff:
+                    add('delete', day, f"超过保留天数 {self.max_age_days}")
+
+        # 配额按当前占用计算：降级和归档释放的空间在下一轮才会体现
+        if self.camera_quota:
+            usage = {}
+            for day in days:
+                if day['path'] not in deleted:
+                    usage[day['camera_id']] = usage.get(day['camera_id'], 0) + day['bytes']
+            for day in candidates:
+                camera_id = day['camera_id']
+                if day['path'] in deleted or usage.get(camera_id, 0) <= self.camera_quota:
+                    continue
+                add('delete', day, f"风机 {camera_id} 超过配额")
+                usage[camera_id] -= day['bytes']
+
+        if self.disk_budget:
+            total = sum(day['bytes'] for day in days if day['path'] not in deleted)
+            for day in candidates:
+                if total <= self.disk_budget:
+                    break
+                if day['path'] in deleted:
+                    continue
+                add('delete', day, "超过磁盘总预算")
+                total -= day['bytes']
+
+        for day in candidates:
+            if day['path'] in deleted:
+                continue
+            age = (today - day['date']).days
+            if self.compact_after_days and age >= self.compact_after_days and not day['compacted']:
+                add('compact', day, f"超过 {self.compact_after_days} 天，图片降级为缩略图")
+            if self.archive_after_days and age >= self.archive_after_days and (day['path'] / 'jsons').is_dir():
+                add('archive', day, f"超过 {self.archive_after_days} 天，JSON 归档")
+
+        return actions
+
+    def report(self, actions, dry_run, started=None, total_bytes=None):
+        """清理计划/结果报告"""
+        summary = {}
+        for action in actions:
+            item = summary.setdefault(action['action'], {'days': 0, 'bytes': 0})
+            item['days'] += 1
+            item['bytes'] += action['bytes']
+
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'dry_run': dry_run,
+            'duration': round(time.monotonic() - started, 2) if started else None,
+            'total_bytes': total_bytes,
+            'policy': self.policy(),
+            'summary': summary,
+            'actions': [dict(action, path=str(action['path'])) for action in actions]
+        }
+
+    def run(self, dry_run=False):
+        """
+        执行一轮清理
+        Args:
+            dry_run: 只生成报告，不修改磁盘
+        Returns:
+            报告字典；dry_run 时如果正在执行清理则返回 None
+        """
+        if not self.run_lock.acquire(blocking=not dry_run):
+            return None
+
+        try:
+            started = time.monotonic()
+            days = self.collect_days()
+            actions = self.plan(days)
+            total_bytes = sum(day['bytes'] for day in days)
+
+            if dry_run:
+                return self.report(actions, True, started, total_bytes)
+
+            throttle = IoThrottle(self.io_limit, self.stop_event)
+            removed_ids = []
+            for action in actions:
+                if self.stop_event.is_set():
+                    break
+                try:
+                    if action['action'] == 'delete':
+                        removed_ids.extend(self._delete_day(action['path'], throttle))
+                    elif action['action'] == 'compact':
+                        self._compact_day(action['path'], throttle)
+                    elif action['action'] == 'archive':
+                        self._archive_day(action['path'], throttle)
+                except Exception as e:
+                    action['error'] = str(e)
+                    logger.error(f"保留策略处理 {action['path']} 失败: {e}")
+
+            if removed_ids:
+                if self.index is not None:
+                    self.index.remove(removed_ids)
+                if self.on_removed:
+                    self.on_removed(removed_ids)
+
+            self.last_report = self.report(actions, False, started, total_bytes)
+            self.last_report['removed_alerts'] = len(removed_ids)
+            if self.index is not None:
+                # 多进程模式下各工作进程从索引库读取最近一次报告
+                self.index.set_meta('retention_report', json.dumps(self.last_report, ensure_ascii=False))
+
+            if actions:
+                logger.info(f"告警保留策略执行完成: {self.last_report['summary']}，"
+                            f"移除 {len(removed_ids)} 条告警")
+            return self.last_report
+        finally:
+            self.run_lock.release()
+
+    def latest_report(self):
+        """最近一次实际执行的报告"""
+        if self.last_report is None and self.index is not None:
+            raw = self.index.get_meta('retention_report')
+            return json.loads(raw) if raw else None
+        return self.last_report
+
+    def _day_alert_ids(self, day_dir):
+        """日期目录中的告警ID（图片、JSON 和归档成员）"""
+        alert_ids = set()
+        for sub, suffix in (('images', '.jpg'), ('jsons', '.json')):
+            if (day_dir / sub).is_dir():
+                alert_ids.update(p.stem for p in (day_dir / sub).glob(f'*{suffix}'))
+
+        archive = day_dir / ARCHIVE_NAME
+        if archive.exists():
+            try:
+                with zipfile.ZipFile(archive) as zf:
+                    alert_ids.update(Path(name).stem for name in zf.namelist() if name.endswith('.json'))
+            except (OSError, zipfile.BadZipFile) as e:
+                logger.warning(f"读取告警归档失败 {archive}: {e}")
+        return alert_ids
+
+    def _delete_day(self, day_dir, throttle):
+        """删除日期目录，并清理空的 月/年 目录"""
+        alert_ids = self._day_alert_ids(day_dir)
+        file_count = sum(len(files) for _, _, files in os.walk(day_dir))
+
+        shutil.rmtree(day_dir)
+        # 删除以元数据操作为主，按每个文件 4KB 计入限速
+        throttle.consume(file_count * 4096)
+
+        for parent in (day_dir.parent, day_dir.parent.parent):
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+        return list(alert_ids)
+
+    def _compact_day(self, day_dir, throttle):
+        """
+        将日期目录中的告警图片替换为压缩缩略图（文件名不变，原有链接仍然有效）
+        缺陷小图（crops/）本身很小，保留原样，降级后仍能看清缺陷细节
+        """
+        image_dir = day_dir / 'images'
+        if image_dir.is_dir():
+            for image_path in image_dir.glob('*.jpg'):
+                if self.stop_event.is_set():
+                    return
+
+                original_size = image_path.stat().st_size
+                image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+
+                height, width = image.shape[:2]
+                if width > self.compact_width:
+                    image = cv2.resize(image, (self.compact_width, max(1, round(height * self.compact_width / width))),
+                                       interpolation=cv2.INTER_AREA)
+
+                ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.compact_quality])
+                throttle.consume(original_size + (len(buffer) if ok else 0))
+                if not ok or len(buffer) >= original_size:
+                    continue
+
+                tmp_path = image_path.with_name(image_path.name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(buffer.tobytes())
+                os.replace(tmp_path, image_path)
+
+        # 旧的缩略图可能比降级后的原图还大，删除后按需重新生成
+        thumbs = day_dir / 'thumbs'
+        if thumbs.is_dir():
+            shutil.rmtree(thumbs)
+
+        (day_dir / COMPACTED_MARKER).touch()
+
+    def _archive_day(self, day_dir, throttle):
+        """将 jsons/ 目录压缩为 jsons.zip（已有归档时追加），校验后删除原文件"""
+        json_dir = day_dir / 'jsons'
+        archive = day_dir / ARCHIVE_NAME
+        json_files = sorted(json_dir.glob('*.json'))
+        archived_files = []
+
+        with zipfile.ZipFile(archive, 'a', compression=zipfile.ZIP_DEFLATED) as zf:
+            existing = set(zf.namelist())
+            for json_file in json_files:
+                data = json_file.read_bytes()
+                throttle.consume(len(data))
+                if json_file.name in existing:
+                    # 归档后重新写入的文件：内容相同时直接删除，不同时保留在目录中
+                    if zf.read(json_file.name) != data:
+                        logger.warning(f"告警文件与归档内容不一致，保留原文件: {json_file}")
+                        continue
+                else:
+                    zf.writestr(json_file.name, data)
+                existing.add(json_file.name)
+                archived_files.append(json_file)
+
+        # 写入完成后再次打开校验，确认可读再删除原文件
+        with zipfile.ZipFile(archive) as zf:
+            if zf.testzip() is not None:
+                raise zipfile.BadZipFile(f"归档校验失败: {archive}")
+            archived = set(zf.namelist())
+
+        for json_file in archived_files:
+            if json_file.name in archived:
+                json_file.unlink()
+        try:
+            json_dir.rmdir()
+        except OSError:
+            pass
+
@@ -0,0 +1,170 @@
+import base64
+import json
+import logging
+from datetime import date, datetime
+from itertools import islice
+
+from page.dashboard.AlertIndex import ARCHIVE_NAME, read_archive, to_timestamp
+
+logger = logging.getLogger(__name__)
+
+# 告警目录下不是风机号的一级目录
+EXCLUDE_DIRS = {'images', 'jsons', 'temp', 'backup', 'log', 'logs', '.git'}
+
+
+def encode_cursor(detection_ts, alert_id):
+    """生成翻页游标（对前端不透明）"""
+    raw = json.dumps([detection_ts, alert_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析翻页游标，返回 (detection_ts, alert_id)"""
+    try:
+        detection_ts, alert_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(detection_ts), str(alert_id)
+    except Exception:
+        raise ValueError('翻页游标不正确')
+
+
+def _int_dirs(parent, lower, upper):
+    """列出名称为数字且在 [lower, upper] 范围内的子目录"""
+    result = []
+    try:
+        for item in parent.iterdir():
+            if item.is_dir() and item.name.isdigit() and lower <= int(item.name) <= upper:
+                result.append((int(item.name), item))
+    except OSError as e:
+        logger.warning(f"读取目录失败 {parent}: {e}")
+    return result
+
+
+def iter_day_dirs(alert_dir, start_dt, end_dt, camera_id=None):
+    """
+    按日期倒序列出 风机号/年/月/日 目录，跳过时间范围之外的年、月、日
+    Returns:
+        [(date, [day_dir, ...]), ...]：同一天所有风机的目录归为一组
+    """
+    start_date, end_date = start_dt.date(), end_dt.date()
+
+    if camera_id:
+        camera_dirs = [alert_dir / camera_id]
+    else:
+        camera_dirs = [
+            item for item in alert_dir.iterdir()
+            if item.is_dir() and item.name not in EXCLUDE_DIRS
+        ]
+
+    days = {}
+    for camera_dir in camera_dirs:
+        if not camera_dir.is_dir():
+            continue
+        for year, year_dir in _int_dirs(camera_dir, start_date.year, end_date.year):
+            first_month = start_date.month if year == start_date.year else 1
+            last_month = end_date.month if year == end_date.year else 12
+            for month, month_dir in _int_dirs(year_dir, first_month, last_month):
+                for day, day_dir in _int_dirs(month_dir, 1, 31):
+                    try:
+                        day_date = date(year, month, day)
+                    except ValueError:
+                        continue
+                    if start_date <= day_date <= end_date:
+                        days.setdefault(day_date, []).append(day_dir)
+
+    return sorted(days.items(), key=lambda x: x[0], reverse=True)
+
+
+def _load_day(day_dirs):
+    """读取一天内所有风机的告警 JSON（包括已归档的 jsons.zip）"""
+    alerts = []
+    for day_dir in day_dirs:
+        seen = set()
+        for json_file in (day_dir / 'jsons').glob('*.json'):
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    alerts.append(json.load(f))
+                seen.add(json_file.name)
+            except Exception as e:
+                logger.error(f"读取告警文件失败 {json_file}: {e}")
+
+        archive = day_dir / ARCHIVE_NAME
+        if archive.exists():
+            for member_path, alert in read_archive(archive):
+                # 归档后又写入的同名文件以目录中的为准
+                if member_path.rsplit('/', 1)[-1] not in seen:
+                    alerts.append(alert)
+    return alerts
+
+
+def _match(alert, camera_id, defect_name, min_confidence):
+    """风机、缺陷、置信度筛选（与索引查询语义一致）"""
+    if camera_id and alert.get('camera_id') != camera_id:
+        return False
+
+    detections = alert.get('detections') or []
+    if defect_name and not any(det.get('name') == defect_name for det in detections):
+        return False
+
+    if min_confidence and detections:
+        if max(det.get('conf', 0) for det in detections) < float(min_confidence):
+            return False
+
+    return True
+
+
+def walk_alerts(alert_dir, start_dt, end_dt, camera_id=None, defect_name=None, min_confidence=None,
+                cursor=None):
+    """
+    按检测时间倒序逐天产出匹配的告警，调用方停止迭代后不再读取更早的目录
+    Yields:
+        (detection_ts, alert)
+    """
+    start_ts, end_ts = to_timestamp(start_dt), to_timestamp(end_dt)
+    after = decode_cursor(cursor) if cursor else None
+
+    # 游标之后的告警都不晚于游标时间，直接从游标所在的日期开始遍历
+    if after and after[0] < end_ts:
+        end_dt = datetime.fromtimestamp(after[0], tz=end_dt.tzinfo)
+
+    for day_date, day_dirs in iter_day_dirs(alert_dir, start_dt, end_dt, camera_id):
+        matched = []
+        for alert in _load_day(day_dirs):
+            try:
+                detection_ts = to_timestamp(alert.get('detection_time', ''))
+            except ValueError:
+                continue
+
+            if detection_ts < start_ts or detection_ts > end_ts:
+                continue
+
+            # 游标之前（更新）的告警已在前面的页中返回
+            if after and (detection_ts, alert.get('alert_id', '')) >= after:
+                continue
+
+            if _match(alert, camera_id, defect_name, min_confidence):
+                matched.append((detection_ts, alert))
+
+        matched.sort(key=lambda x: (x[0], x[1].get('alert_id', '')), reverse=True)
+        yield from matched
+
+
+def search_page(alert_dir, start_dt, end_dt, camera_id=None, defect_name=None, min_confidence=None,
+                cursor=None, offset=0, limit=100):
+    """
+    流式分页：页满即停止遍历
+    Returns:
+        (alerts, next_cursor)：没有下一页时 next_cursor 为 None
+    """
+    walker = walk_alerts(alert_dir, start_dt, end_dt, camera_id, defect_name, min_confidence, cursor)
+
+    # 多取一条用于判断是否还有下一页
+    items = list(islice(walker, offset, offset + limit + 1))
+    walker.close()
+
+    page_items = items[:limit]
+    next_cursor = None
+    if len(items) > limit:
+        last_ts, last_alert = page_items[-1]
+        next_cursor = encode_cursor(last_ts, last_alert.get('alert_id', ''))
+
+    return [alert for _, alert in page_items], next_cursor
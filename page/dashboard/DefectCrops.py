@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+from pathlib import Path
+
+import cv2
+
+from page.dashboard.AlertAnnotate import crop_detection
+
+logger = logging.getLogger(__name__)
+
+
+class CropStore:
+    """缺陷小图：告警系统保存的 crops/<告警ID>_<序号>.jpg；旧告警没有小图时从告警图片截取并缓存"""
+
+    def __init__(self, alert_dir, padding=0.25, max_size=256, quality=85):
+        """
+        初始化缺陷小图存储
+        Args:
+            alert_dir: 告警根目录
+            padding: 补生成小图时每侧留出的背景比例（与 AlertSystem 一致）
+            max_size: 补生成小图的最长边
+            quality: JPEG 压缩质量
+        """
+        self.alert_dir = Path(alert_dir)
+        self.padding = padding
+        self.max_size = max_size
+        self.quality = quality
+
+        # 同一小图并发请求时只生成一次
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def crop_path(self, alert, index):
+        """告警第 index 个缺陷的小图路径"""
+        crops = alert.get('crops') or []
+        crop = crops[index] if index < len(crops) else None
+        filename = Path(crop['filename']).name if crop else f"{alert['alert_id']}_{index}.jpg"
+        if alert.get('relative_path'):
+            return self.alert_dir / alert['relative_path'] / 'crops' / filename
+        return self.alert_dir / 'crops' / filename
+
+    def image_path(self, alert):
+        """告警图片路径"""
+        if alert.get('relative_path'):
+            return self.alert_dir / alert['relative_path'] / 'images' / f"{alert['alert_id']}.jpg"
+        return self.alert_dir / alert.get('image_filename', f"{alert['alert_id']}.jpg")
+
+    def _lock_for(self, key):
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get(self, alert, index):
+        """
+        获取缺陷小图路径，不存在时从告警图片截取
+        Returns:
+            小图路径；缺陷序号无效或告警图片不存在时返回 None
+        """
+        detections = alert.get('detections') or []
+        if not 0 <= index < len(detections):
+            return None
+
+        path = self.crop_path(alert, index)
+        if path.exists():
+            return path
+
+        try:
+            with self._lock_for(str(path)):
+                if not path.exists() and not self._generate(alert, detections[index], path):
+                    return None
+            return path
+        finally:
+            with self.locks_lock:
+                self.locks.pop(str(path), None)
+
+    def _generate(self, alert, det, path):
+        """从告警图片截取小图（先写临时文件再替换，避免读到半个文件）"""
+        source = self.image_path(alert)
+        image = cv2.imread(str(source), cv2.IMREAD_COLOR)
+        if image is None:
+            logger.warning(f"无法读取告警图片: {source}")
+            return False
+
+        # 告警图片可能已被保留策略压缩，按检测时的原图尺寸换算坐标
+        crop, _ = crop_detection(image, det, alert.get('image_width'), alert.get('image_height'),
+                                 padding=self.padding, max_size=self.max_size)
+        ok, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return False
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.tobytes())
+        os.replace(tmp_path, path)
+        return True
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from flask import request, make_response
+
+# brotli 为可选依赖，未安装时只使用 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+
+
+class CacheVersion:
+    """缓存版本号：告警缓存或风机集合变化时递增，用于生成 ETag"""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+        # 进程重启后版本号从 0 开始，加上启动标记避免与旧 ETag 相同
+        self.boot_id = format(int(time.time() * 1000), 'x')
+
+    def bump(self):
+        """数据发生变化"""
+        with self.lock:
+            self.value += 1
+            return self.value
+
+    def current(self):
+        """当前版本标记"""
+        return f"{self.boot_id}-{self.value}"
+
+
+class SharedCacheVersion:
+    """多进程共享的缓存版本号：保存在 SQLite 索引库中"""
+
+    def __init__(self, index):
+        """
+        Args:
+            index: AlertIndex 实例（共享存储）
+        """
+        self.index = index
+
+    def bump(self):
+        return self.index.increment('cache_version')
+
+    def current(self):
+        return f"{self.index.boot_id}-{self.index.get_meta('cache_version', '0')}"
+
+
+def make_etag(version):
+    """由版本号和请求路径（含查询参数）生成 ETag"""
+    raw = f"{version}|{request.full_path}".encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def compress_response(response):
+    """按 Accept-Encoding 压缩较大的响应体（优先 brotli，其次 gzip）"""
+    response.vary.add('Accept-Encoding')
+
+    if response.direct_passthrough or response.content_encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.content_encoding = 'br'
+    elif accept['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.content_encoding = 'gzip'
+
+    return response
+
+
+def conditional_json(version_getter):
+    """
+    JSON 接口的条件请求与压缩
+    Args:
+        version_getter: 返回当前数据版本的函数；返回 None 表示无法判断，跳过 304 预检
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_getter()
+
+            # 数据未变化时直接返回 304，不再查询和序列化
+            if version is not None:
+                etag = make_etag(version)
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response('', 304)
+                    response.set_etag(etag, weak=True)
+                    response.headers['Cache-Control'] = 'no-cache'
+                    return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            # 优先使用执行前读取的版本：响应数据不会比它旧，数据再变化时 ETag 必然不同
+            if version is None:
+                version = version_getter()
+            if version is not None:
+                # 压缩前后内容等价，使用弱 ETag
+                response.set_etag(make_etag(version), weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+
+            return compress_response(response)
+        return wrapper
+    return decorator
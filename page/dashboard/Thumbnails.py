@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+from pathlib import Path
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# 固定的缩略图宽度，请求的宽度向上取到最近的一档
+THUMBNAIL_WIDTHS = (160, 320, 640)
+
+
+class ThumbnailStore:
+    """告警缩略图：首次请求时生成并缓存到磁盘（images 同级的 thumbs/<宽度>/ 目录）"""
+
+    def __init__(self, alert_dir, widths=THUMBNAIL_WIDTHS, quality=80):
+        """
+        初始化缩略图存储
+        Args:
+            alert_dir: 告警根目录
+            widths: 允许的缩略图宽度
+            quality: JPEG 压缩质量
+        """
+        self.alert_dir = Path(alert_dir)
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+
+        # 同一缩略图并发请求时只生成一次
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def snap_width(self, width):
+        """将请求宽度对齐到固定档位"""
+        for w in self.widths:
+            if width <= w:
+                return w
+        return self.widths[-1]
+
+    def thumbnail_path(self, filename, width):
+        """原图相对路径对应的缩略图路径"""
+        source = Path(filename)
+        if source.parent.name == 'images':
+            return self.alert_dir / source.parent.parent / 'thumbs' / str(width) / source.name
+        return self.alert_dir / 'thumbs' / str(width) / source
+
+    def _lock_for(self, key):
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get(self, filename, width):
+        """
+        获取缩略图路径，不存在或比原图旧时生成
+        Returns:
+            缩略图路径；原图不存在时返回 None
+        """
+        source = self.alert_dir / filename
+        width = self.snap_width(width)
+        thumb = self.thumbnail_path(filename, width)
+
+        try:
+            with self._lock_for(str(thumb)):
+                try:
+                    source_mtime = source.stat().st_mtime
+                except FileNotFoundError:
+                    return None
+
+                if thumb.exists() and thumb.stat().st_mtime >= source_mtime:
+                    return thumb
+
+                if not self._generate(source, thumb, width):
+                    return None
+            return thumb
+        finally:
+            # 每个返回路径都移除锁，locks 不随请求过的缩略图增长
+            with self.locks_lock:
+                self.locks.pop(str(thumb), None)
+
+    def _generate(self, source, thumb, width):
+        """生成缩略图（先写临时文件再替换，避免读到半个文件）"""
+        # 解码时直接按 1/2、1/4、1/8 缩小，大图只解码需要的分辨率
+        header = cv2.imread(str(source), cv2.IMREAD_REDUCED_COLOR_8)
+        if header is None:
+            logger.warning(f"无法读取告警图片: {source}")
+            return False
+
+        reduced_width = header.shape[1]
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                             (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2),
+                             (1, cv2.IMREAD_COLOR)):
+            if reduced_width * 8 // factor >= width or factor == 1:
+                image = header if factor == 8 else cv2.imread(str(source), flag)
+                break
+
+        if image is None:
+            logger.warning(f"无法读取告警图片: {source}")
+            return False
+
+        height, orig_width = image.shape[:2]
+        if orig_width > width:
+            image = cv2.resize(image, (width, max(1, round(height * width / orig_width))),
+                               interpolation=cv2.INTER_AREA)
+
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return False
+
+        thumb.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = thumb.with_name(thumb.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.tobytes())
+        os.replace(tmp_path, thumb)
+        return True
@@ -6,28 +6,34 @@ import math
 from page.qzhang.utils import xywh2xyxy, multiclass_nms,detections_dog,class_names
 
 class YOLOv8OBB:
-    def __init__(self, path, conf_thres=0.7, iou_thres=0.5,device_id=0):
+    def __init__(self, path, conf_thres=0.7, iou_thres=0.5,device_id=0,session_options=None):
         self.conf_threshold = conf_thres
         self.iou_threshold = iou_thres
 
         # Initialize model
-        self.initialize_model(path,device_id)
+        self.initialize_model(path,device_id,session_options)
 
     def __call__(self, image):
         return self.detect_objects(image)
 
-    def initialize_model(self, path,device_id=0):
+    def initialize_model(self, path,device_id=0,session_options=None):
+        """session_options 为空时使用默认配置；传入时（如分片模式的线程数和核绑定）CPU 推理也使用它"""
         # 指定GPU设备索引，例如使用第0块GPU
         print(onnxruntime.get_available_providers())
 
-        session_options = onnxruntime.SessionOptions()
-        # 设置线程数为 1
-        session_options.intra_op_num_threads = 1
+        custom_options = session_options is not None
+        if session_options is None:
+            session_options = onnxruntime.SessionOptions()
+            # 设置线程数为 1
+            session_options.intra_op_num_threads = 1
         gpu_device_id = device_id
         provider_options = [{'device_id': gpu_device_id}]
         if device_id == 'cpu':
             providers = ['CPUExecutionProvider']
-            self.session = onnxruntime.InferenceSession(path,providers=providers)
+            if custom_options:
+                self.session = onnxruntime.InferenceSession(path,session_options,providers=providers)
+            else:
+                self.session = onnxruntime.InferenceSession(path,providers=providers)
         else:
             providers = ['CUDAExecutionProvider']
             self.session = onnxruntime.InferenceSession(path,session_options,providers=providers, provider_options=provider_options)
@@ -47,15 +53,42 @@ class YOLOv8OBB:
         return self.boxes, self.scores, self.class_ids
     
     def detect(self, image):
-        input_tensor = self.prepare_input(image)
+        input_tensor = self.prepare_input_buffer(image)
 
         # Perform inference on the image
         outputs = self.inference(input_tensor)
+        return self.postprocess(outputs, image.shape)
+
+    def prepare_input_buffer(self, image):
+        """
+        单张推理的预处理：letterbox 后归一化写入复用的 NCHW 缓冲区
+        返回的数组在下一次调用时会被覆盖
+        """
+        input = self.letterbox(image, [self.input_height, self.input_width])
+        if getattr(self, 'input_buffer', None) is None or self.input_buffer.shape[1] != input.shape[2]:
+            self.input_buffer = np.empty((1, input.shape[2], self.input_height, self.input_width), dtype=np.float32)
+        np.multiply(input.transpose(2, 0, 1), np.float32(1 / 255.0), out=self.input_buffer[0], casting='unsafe')
+        return self.input_buffer
+
+    def detect_batch(self, images):
+        """
+        批量检测，返回每张图片与 detect 相同格式的结果列表
+        模型 batch 维度固定时逐张推理
+        """
+        if not self.dynamic_batch or len(images) == 1:
+            return [self.detect(image) for image in images]
+
+        input_tensor = [self.prepare_input(image)[0] for image in images]
+        outputs = self.inference(input_tensor)
+        return [self.postprocess(outputs[i:i + 1], image.shape) for i, image in enumerate(images)]
+
+    def postprocess(self, outputs, shape):
+        """单张图片的模型输出转换为旋转框列表"""
         results = self.filter_box(outputs)
         # print(results.shape)
         if results.size == 0:
             return []
-        results = self.scale_boxes(results, image.shape)
+        results = self.scale_boxes(results, shape)
         boxes = results[...,:4]
         scores = results[...,4]
         classes = results[...,5].astype(np.int32)
@@ -117,9 +150,12 @@ class YOLOv8OBB:
     def inference(self, input_tensor):
         start = time.perf_counter()
 
+        # 已是 NCHW 数组时直接使用，不再复制
+        if not isinstance(input_tensor, np.ndarray):
+            input_tensor = np.array(input_tensor)
         inputs = {}
         for name in self.input_names:
-            inputs[name] =  np.array(input_tensor)
+            inputs[name] = input_tensor
     
         outputs = self.session.run(None, inputs)[0]
         # outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor})
@@ -246,6 +282,9 @@ class YOLOv8OBB:
         self.input_shape = model_inputs[0].shape
         self.input_height = self.input_shape[2]
         self.input_width = self.input_shape[3]
+        # 输入的 batch 维度为符号或 -1 时支持批量推理
+        batch_dim = self.input_shape[0]
+        self.dynamic_batch = not isinstance(batch_dim, int) or batch_dim <= 0
     def get_output_details(self):
         model_outputs = self.session.get_outputs()
         self.output_names = [model_outputs[i].name for i in range(len(model_outputs))]
@@ -14,29 +14,43 @@ color_list = [[0, 0, 0], [128, 0, 0],[ 0, 128, 0]]
 
 class DeeplabV3Seg:
 
-    def __init__(self, path,device_id=0):
+    def __init__(self, path,device_id=0,session_options=None):
         # self.conf_threshold = conf_thres
         # self.iou_threshold = iou_thres
 
         # Initialize model
-        self.initialize_model(path,device_id)
+        self.initialize_model(path,device_id,session_options)
 
     # def __call__(self, image):
     #     return self.detect_objects(image)
 
-    def initialize_model(self, path,device_id=0):
+    def initialize_model(self, path,device_id=0,session_options=None):
+        """session_options 为空时使用默认配置；传入时（如分片模式的线程数和核绑定）CPU 推理也使用它"""
         print(ort.get_available_providers())
-        session_options = ort.SessionOptions()
-        # 设置线程数为 1
-        session_options.intra_op_num_threads = 1
+        custom_options = session_options is not None
+        if session_options is None:
+            session_options = ort.SessionOptions()
+            # 设置线程数为 1
+            session_options.intra_op_num_threads = 1
         gpu_device_id = device_id
         provider_options = [{'device_id': gpu_device_id}]
         if device_id == 'cpu':
             providers = ['CPUExecutionProvider']
-            self.session = ort.InferenceSession(path,providers=providers)
+            if custom_options:
+                self.session = ort.InferenceSession(path,session_options,providers=providers)
+            else:
+                self.session = ort.InferenceSession(path,providers=providers)
         else:
             providers = ['CUDAExecutionProvider']
             self.session = ort.InferenceSession(path,session_options,providers=providers, provider_options=provider_options)
+        # 输入的 batch 维度为符号或 -1 时支持批量推理
+        input_shape = self.session.get_inputs()[0].shape
+        batch_dim = input_shape[0]
+        self.dynamic_batch = not isinstance(batch_dim, int) or batch_dim <= 0
+        # 输入的高宽为符号或 -1 时可以用低分辨率做叶片存在性判断；固定时记录模型的输入尺寸
+        spatial = list(input_shape[2:4])
+        self.dynamic_size = any(not isinstance(dim, int) or dim <= 0 for dim in spatial)
+        self.input_size = None if self.dynamic_size else (spatial[1], spatial[0])
         # Get model info
         # self.get_input_details()
         # self.get_output_details()
@@ -53,16 +67,20 @@ class DeeplabV3Seg:
     #     return self.boxes, self.scores, self.class_ids
     
     def prepare_input(self,img):
-
+        """
+        缩放和归一化写入复用的缓冲区（每帧不再分配新的输入数组）
+        返回的输入数组和 self.rimg 在下一次调用时会被覆盖
+        """
         # img = cv2.cvtColor(src_img, cv2.COLOR_BGR2RGB)
-        self.rimg = cv2.resize(img, (model_input_w, model_input_h))
-
-        img = self.rimg.astype(np.float32)
-        img = img * 0.003921568
-        img = img.transpose(2, 0, 1)
-        img = np.ascontiguousarray(img, dtype=np.float32)
-        img_data = np.expand_dims(img, axis=0)
-        return img_data
+        resized = cv2.resize(img, (model_input_w, model_input_h), dst=getattr(self, 'rimg', None))
+        if getattr(self, 'input_buffer', None) is None or self.input_buffer.shape[1] != resized.shape[2]:
+            self.input_buffer = np.empty((1, resized.shape[2], model_input_h, model_input_w), dtype=np.float32)
+        self.rimg = resized
+
+        # HWC(uint8) -> NCHW(float32)，乘法结果直接写入缓冲区
+        np.multiply(resized.transpose(2, 0, 1), np.float32(0.003921568), out=self.input_buffer[0],
+                    casting='unsafe')
+        return self.input_buffer
     def softmax(self,x):
         e_x = np.exp(x - np.max(x))      # 避免指数爆炸
         return e_x / e_x.sum()
@@ -85,6 +103,44 @@ class DeeplabV3Seg:
         result = cv2.bitwise_and(self.rimg, self.rimg, mask=pred*255)
         # result = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
         return result
+    def blade_coverage(self, img, size, input_buffer=None):
+        """
+        低分辨率分割，返回叶片像素占比（用于在完整推理前快速判断画面中是否有叶片）
+        Args:
+            img: BGR 图像
+            size: 推理尺寸 (宽, 高)，需为模型支持的输入尺寸
+            input_buffer: 复用的 (1, 3, 高, 宽) float32 输入缓冲区，为空时新分配
+        Returns:
+            叶片像素占比 0~1
+        """
+        width, height = size
+        if input_buffer is None:
+            input_buffer = np.empty((1, 3, height, width), dtype=np.float32)
+        # 缩小比例大时 INTER_AREA 抗混叠，细长叶片不易丢失
+        small = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        np.multiply(small.transpose(2, 0, 1), np.float32(0.003921568), out=input_buffer[0], casting='unsafe')
+        pred = self.session.run(None, {'x': input_buffer})[0]
+        return np.count_nonzero(pred) / pred.size
+    def predict_batch(self, imgs):
+        """
+        批量分割，返回与 predict 相同的抠图结果列表
+        模型 batch 维度固定时逐张推理
+        """
+        if not self.dynamic_batch or len(imgs) == 1:
+            return [self.predict(img) for img in imgs]
+
+        rimgs = [cv2.resize(img, (model_input_w, model_input_h)) for img in imgs]
+        batch = np.stack(rimgs).astype(np.float32)
+        batch *= 0.003921568
+        batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        preds = self.session.run(None, {'x': batch})[0]
+
+        results = []
+        for rimg, pred in zip(rimgs, preds):
+            pred = np.squeeze(pred).astype('uint8')
+            results.append(cv2.bitwise_and(rimg, rimg, mask=pred*255))
+        return results
+
     def seg_image(self,img):
         # img = cv2.imread(img_path)
         img_h, img_w = img.shape[:2]
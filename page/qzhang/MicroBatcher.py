@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+
+class QueueFullError(Exception):
+    """请求队列已满（服务端过载），调用方应返回 503"""
+
+
+class MicroBatcher:
+    """
+    动态批处理：并发请求先进入队列，推理线程将同时到达的请求合并为一批执行，再把结果分发回各请求
+    攒批条件：达到 max_batch_size，或第一条请求已等待 max_delay 秒
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_delay=0.01, max_queue=256, name='MicroBatcher'):
+        """
+        初始化批处理器
+        Args:
+            process_batch: 批处理函数，输入为请求列表，返回等长的结果列表
+            max_batch_size: 单批最大请求数
+            max_delay: 攒批最长等待时间（秒）
+            max_queue: 排队请求上限，超过时拒绝新请求
+            name: 推理线程名称
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max_delay
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        self.stats_lock = threading.Lock()
+        self.batches = 0
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.batch_sizes = {}
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item, timeout=None):
+        """
+        提交一条请求并等待结果
+        Args:
+            item: 请求数据（传给 process_batch）
+            timeout: 等待结果的超时时间（秒）
+        Returns:
+            该请求的处理结果
+        Raises:
+            QueueFullError: 队列已满
+            TimeoutError: 超时未完成
+        """
+        future = self.enqueue(item)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # 尚未开始推理的请求直接取消
+            future.cancel()
+            raise
+
+    def enqueue(self, item):
+        """
+        提交一条请求，不等待结果
+        Returns:
+            Future：完成后得到该请求的处理结果
+        Raises:
+            QueueFullError: 队列已满
+        """
+        future = Future()
+        try:
+            self.queue.put_nowait((item, future))
+        except queue.Full:
+            with self.stats_lock:
+                self.rejected += 1
+            raise QueueFullError(f"推理队列已满（{self.queue.maxsize}）")
+        return future
+
+    def _collect(self):
+        """取出一批请求：阻塞等待第一条，之后在 max_delay 内尽量凑满"""
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            # 等待期间已超时放弃的请求不再推理
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.process_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"批处理结果数量不一致: {len(results)} != {len(batch)}")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                with self.stats_lock:
+                    self.failed += len(batch)
+                continue
+            finally:
+                with self.stats_lock:
+                    self.busy_time += time.perf_counter() - start
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+            with self.stats_lock:
+                self.batches += 1
+                self.processed += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+    def stop(self):
+        """停止推理线程"""
+        self.running = False
+        self.thread.join(timeout=2.0)
+
+    def stats(self):
+        """批处理统计"""
+        with self.stats_lock:
+            return {
+                'queue_size': self.queue.qsize(),
+                'max_queue': self.queue.maxsize,
+                'max_batch_size': self.max_batch_size,
+                'max_delay_ms': self.max_delay * 1000,
+                'batches': self.batches,
+                'processed': self.processed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'avg_batch_size': round(self.processed / self.batches, 2) if self.batches else 0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'busy_seconds': round(self.busy_time, 3)
+            }
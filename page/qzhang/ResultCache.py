@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+def model_version(*paths, **params):
+    """
+    模型版本标记：模型文件（路径、大小、修改时间）和阈值等参数的摘要
+    模型文件替换或阈值调整后，缓存的旧结果自动失效
+    """
+    raw = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            raw.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            raw.append(str(path))
+    raw.extend(f"{key}={params[key]}" for key in sorted(params))
+    return hashlib.sha1('|'.join(raw).encode('utf-8')).hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    推理结果缓存：以图片字节的 SHA-256 加模型版本为键，LRU 淘汰
+    内存层按条目数和字节数限制；可选磁盘层（每条结果一个 JSON 文件），内存淘汰后仍可命中
+    """
+
+    def __init__(self, version, max_entries=2048, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=1024 * 1024 * 1024):
+        """
+        初始化结果缓存
+        Args:
+            version: 模型版本标记（见 model_version）
+            max_entries: 内存中最多缓存的结果数
+            max_bytes: 内存中缓存结果的总字节数上限（按 JSON 序列化长度计算）
+            disk_dir: 磁盘缓存目录，为空时不使用磁盘层
+            disk_max_bytes: 磁盘缓存的总字节数上限
+        """
+        self.version = version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # 磁盘层索引：按访问顺序记录文件大小，启动时按修改时间恢复顺序
+        self.disk_entries = OrderedDict()
+        self.disk_bytes = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(self.disk_dir.glob('*/*.json'), key=lambda p: p.stat().st_mtime)
+            for path in files:
+                size = path.stat().st_size
+                self.disk_entries[path.stem] = size
+                self.disk_bytes += size
+
+    def key(self, data):
+        """图片字节对应的缓存键"""
+        return f"{self.version}-{hashlib.sha256(data).hexdigest()}"
+
+    def _disk_path(self, key):
+        return self.disk_dir / key[-2:] / f"{key}.json"
+
+    def get(self, key):
+        """查询缓存，未命中返回 None"""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return item[0]
+
+            if not self.disk_dir or key not in self.disk_entries:
+                self.misses += 1
+                return None
+
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                raw = f.read()
+            value = json.loads(raw)
+        except (OSError, ValueError):
+            with self.lock:
+                self.disk_bytes -= self.disk_entries.pop(key, 0)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+            if key in self.disk_entries:
+                self.disk_entries.move_to_end(key)
+            self._put_memory(key, value, len(raw))
+        return value
+
+    def put(self, key, value):
+        """写入缓存（value 需可 JSON 序列化）"""
+        raw = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        with self.lock:
+            self._put_memory(key, value, len(raw))
+
+        if self.disk_dir:
+            self._put_disk(key, raw)
+
+    def _put_memory(self, key, value, size):
+        """写入内存层并按条目数、字节数淘汰最久未使用的结果（调用方持有锁）"""
+        if size > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def _put_disk(self, key, raw):
+        """写入磁盘层（先写临时文件再替换），超出上限时删除最久未使用的文件"""
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        evicted = []
+        with self.lock:
+            self.disk_bytes -= self.disk_entries.pop(key, 0)
+            self.disk_entries[key] = len(raw)
+            self.disk_bytes += len(raw)
+            while self.disk_bytes > self.disk_max_bytes and len(self.disk_entries) > 1:
+                old_key, size = self.disk_entries.popitem(last=False)
+                self.disk_bytes -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                self._disk_path(old_key).unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        """清空内存层（磁盘层保留）"""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """缓存统计"""
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'disk_entries': len(self.disk_entries) if self.disk_dir else None,
+                'disk_bytes': self.disk_bytes if self.disk_dir else None
+            }
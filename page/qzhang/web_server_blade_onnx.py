@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import argparse
+import itertools
 import sys
 import cv2
 import numpy as np
@@ -20,13 +21,20 @@ from PIL import Image
 import io
 from page.qzhang.BladeDet import YOLOv8OBB
 from page.qzhang.BladeSeg import DeeplabV3Seg
+from page.qzhang.MicroBatcher import MicroBatcher, QueueFullError
+from page.qzhang.ResultCache import ResultCache, model_version
+from concurrent.futures import TimeoutError, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import flask
 from flask_cors import CORS
 from pathlib import Path
 import os
 import json
-import gc
+import time
+import base64
+import tarfile
+import zipfile
+import tempfile
 from urllib.parse import quote
 import urllib.request
 
@@ -38,13 +46,81 @@ if str(ROOT) not in sys.path:
 seg_model = None
 yolov8_model = None
 yolo_opt = None
+batcher = None
+# 批量接口的图片解码线程池
+decode_pool = None
+# 推理结果缓存（按图片内容哈希），为空时不缓存
+result_cache = None
 CORS(app, resources=r'/*')
-id = 0
+# 多个请求线程并发保存结果，序号用线程安全的计数器生成
+id_counter = itertools.count()
+
+
+def infer_batch(images):
+    """一批图片依次执行批量分割和批量检测，返回 [(seg_img, results), ...]"""
+    seg_imgs = seg_model.predict_batch(images)
+    results = yolov8_model.detect_batch(seg_imgs)
+    return list(zip(seg_imgs, results))
+
+
+def format_results(results, orig_width, orig_height):
+    """检测结果（1024x1024 分割图坐标）缩放到原图，转换为接口返回格式"""
+    rets = []
+    # 缺陷位置缩放到原图位置
+    scale_x = orig_width / 1024.0
+    scale_y = orig_height / 1024.0
+    for res in results:
+        ((x_center, y_center), (width, height), r) = res['bbox']
+        rets.append({
+            "clsId": int(res['class']),
+            "name": res['name'],
+            "conf": float(res['score']),
+            "x": float(x_center) * scale_x,
+            "y": float(y_center) * scale_y,
+            "w": float(width) * scale_x,
+            "h": float(height) * scale_y,
+            "r": float(r)})
+    return rets
+
+
+def draw_results(canvas, rets):
+    """在原图上绘制旋转框（rets 为 format_results 的返回值）"""
+    for ret in rets:
+        bbox = ((ret['x'], ret['y']), (ret['w'], ret['h']), ret['r'])
+        points = cv2.boxPoints(bbox)
+        points = points.astype(np.int_)
+        cv2.polylines(canvas, [points], isClosed=True, color=(255, 0, 0), thickness=1)
+        cv2.putText(canvas, '{0} {1:.2f}'.format(ret['name'], ret['conf']), (points[0][0], points[0][1]),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+
+def lookup_cache(data):
+    """
+    按图片内容查询结果缓存
+    Returns:
+        (cache_key, cached)：未启用缓存时 cache_key 为 None，未命中时 cached 为 None
+    """
+    if result_cache is None:
+        return None, None
+    cache_key = result_cache.key(data)
+    return cache_key, result_cache.get(cache_key)
+
+
+def store_cache(cache_key, width, height, rets):
+    """写入结果缓存"""
+    if result_cache is not None and cache_key is not None:
+        result_cache.put(cache_key, {'width': width, 'height': height, 'detections': rets})
+
+
+def overloaded_response(message):
+    """队列已满或等待超时：返回 503，客户端稍后重试"""
+    return flask.Response(json.dumps({'error': message}, ensure_ascii=False), status=503,
+                          mimetype='application/json', headers={'Retry-After': '1'})
 
 
 @app.route("/yolo-predict", methods=["GET", "POST"])
 def predict_post():
-    global yolov8_model, yolo_opt, seg_model, id
+    global yolov8_model, yolo_opt, seg_model
 
     # if flask.request.method != "POST":
     #     return
@@ -57,6 +133,10 @@ def predict_post():
             imagefile = flask.request.files["image"]
             # print(type(image))
             imagebts = imagefile.read()
+            # 相同图片直接返回缓存的结果，不解码也不推理
+            cache_key, cached = lookup_cache(imagebts)
+            if cached is not None:
+                return json.dumps(cached['detections'])
             image = Image.open(io.BytesIO(imagebts))
             # image = cv2.cvtColor((np.asarray(image)), cv2.COLOR_RGB2BGR)
             image = np.asarray(image)
@@ -65,59 +145,37 @@ def predict_post():
             print(path)
             path = quote(path, '/:?_.')
             res = urllib.request.urlopen(path)
-            image = np.asarray(bytearray(res.read()), dtype="uint8")
+            imagebts = res.read()
+            cache_key, cached = lookup_cache(imagebts)
+            if cached is not None:
+                return json.dumps(cached['detections'])
+            image = np.asarray(bytearray(imagebts), dtype="uint8")
             image = cv2.imdecode(image, cv2.IMREAD_COLOR)
             image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
             image = np.asarray(image)
         orig_height, orig_width = image.shape[:2]
-        rimg = image.copy()
         try:
-            # 叶片分割提取
-            seg_img = seg_model.predict(image)
+            # 叶片分割提取 + 缺陷检测：与同时到达的其他请求合并为一批推理
+            try:
+                seg_img, results = batcher.submit(image, timeout=yolo_opt.request_timeout)
+            except QueueFullError as e:
+                return overloaded_response(str(e))
+            except TimeoutError:
+                return overloaded_response('推理等待超时')
+
+            id = next(id_counter)
             segname = os.path.join('../../result', str(id) + '_seg.jpg')
             # rimg = cv2.cvtColor(rimg, cv2.COLOR_RGB2BGR)
             cv2.imwrite(segname, seg_img)
-            # 叶片缺陷检测
-            results = yolov8_model.detect(seg_img)
-            rets = []
+            rets = format_results(results, orig_width, orig_height)
+            store_cache(cache_key, orig_width, orig_height, rets)
             if len(results) > 0:
-                for i, res in enumerate(results):
-                    ((x_center, y_center), (width, height), r) = res['bbox']
-
-                    # 缺陷位置缩放到原图位置
-                    scale_x = orig_width / 1024.0
-                    scale_y = orig_height / 1024.0
-
-                    x_center = float(x_center) * scale_x
-                    y_center = float(y_center) * scale_y
-                    width = float(width) * scale_x
-                    height = float(height) * scale_y
-                    # 绘制矩形框
-                    re = {
-                        "clsId": int(res['class']),
-                        "name": res['name'],
-                        "conf": float(res['score']),
-                        "x": float(x_center),
-                        "y": float(y_center),
-                        "w": float(width),
-                        "h": float(height),
-                        "r": float(r)}
-                    rets.append(re)
-                    bbox = ((x_center, y_center), (width, height), r)
-                    points = cv2.boxPoints(bbox)
-                    points = points.astype(np.int_)
-                    cv2.polylines(rimg, [points], isClosed=True, color=(255, 0, 0), thickness=1)
-                    cv2.putText(rimg, '{0} {1:.2f}'.format(res['name'], res['score']), (points[0][0], points[0][1]),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-
+                # 只有检测到缺陷时才复制原图用于标注，颜色转换原地完成
+                rimg = image.copy()
+                draw_results(rimg, rets)
                 filename = os.path.join('../../result', str(id) + '.jpg')
-                rimg = cv2.cvtColor(rimg, cv2.COLOR_RGB2BGR)
+                cv2.cvtColor(rimg, cv2.COLOR_RGB2BGR, dst=rimg)
                 cv2.imwrite(filename, rimg)
-                id += 1
-            del image
-            del seg_img
-            del results
-            gc.collect()
 
             return json.dumps(rets)
         except Exception as e1:
@@ -133,6 +191,202 @@ def predict_post():
         # return json.dumps(results)
 
 
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+ZIP_TYPES = ('application/zip', 'application/x-zip-compressed')
+TAR_TYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip', 'application/x-gtar')
+
+
+def iter_zip_images(fileobj):
+    """逐个读取 zip 中的图片 (name, bytes)"""
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_SUFFIXES):
+                yield info.filename, archive.read(info)
+
+
+def iter_tar_images(fileobj):
+    """流式读取 tar（可带 gzip 压缩）中的图片 (name, bytes)，不需要先收完整个请求体"""
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(IMAGE_SUFFIXES):
+                yield member.name, archive.extractfile(member).read()
+
+
+def iter_upload_images(request):
+    """
+    批量请求中的所有图片：请求体为 zip/tar，或 multipart 中的多个文件（文件本身也可以是 zip/tar）
+    Yields:
+        (name, bytes)
+    """
+    if request.mimetype in TAR_TYPES:
+        yield from iter_tar_images(request.stream)
+        return
+
+    if request.mimetype in ZIP_TYPES:
+        # zip 需要随机访问，请求体先写入临时文件（较小时保留在内存）
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spool:
+            while True:
+                chunk = request.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                spool.write(chunk)
+            spool.seek(0)
+            yield from iter_zip_images(spool)
+        return
+
+    for upload in request.files.values():
+        name = upload.filename or ''
+        if name.lower().endswith('.zip'):
+            yield from iter_zip_images(upload.stream)
+        elif name.lower().endswith(('.tar', '.tar.gz', '.tgz')):
+            yield from iter_tar_images(upload.stream)
+        else:
+            yield name, upload.read()
+
+
+def decode_and_enqueue(data, deadline):
+    """
+    解码线程：解码图片后提交到批处理队列，不等待推理结果
+    Returns:
+        (image, 推理 Future)
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('无法解码图片')
+    # 与 /yolo-predict 一致，模型输入为 RGB
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    # 队列满时等待其他请求消化，而不是直接失败
+    while True:
+        try:
+            return image, batcher.enqueue(image)
+        except QueueFullError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+def decode_only(data):
+    """解码线程：缓存命中且需要标注图片时只解码不推理"""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('无法解码图片')
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def batch_result(index, name, width, height, rets, image=None):
+    """单张图片的 NDJSON 结果；image 不为空时附带标注图片"""
+    item = {
+        "index": index,
+        "name": name,
+        "status": "ok",
+        "width": width,
+        "height": height,
+        "detections": rets
+    }
+    if image is not None:
+        canvas = image.copy()
+        draw_results(canvas, rets)
+        ok, buffer = cv2.imencode('.jpg', cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 85])
+        item["annotated_image"] = base64.b64encode(buffer.tobytes()).decode('ascii') if ok else None
+    return item
+
+
+def stream_batch(sources, annotate):
+    """
+    流水线处理批量图片：读取、解码、推理同时进行，每张图片完成后立即输出一行 NDJSON
+    同时在处理中的图片数量有上限，上传几千张图片时内存占用也保持稳定
+    """
+    start = time.perf_counter()
+    window = max(4, batcher.max_batch_size * 2)
+    pending = {}  # Future -> (index, name, stage, context)
+    count = errors = 0
+
+    def error_line(index, name, e):
+        return json.dumps({"index": index, "name": name, "status": "error", "error": str(e) or type(e).__name__},
+                          ensure_ascii=False) + '\n'
+
+    def harvest(timeout):
+        nonlocal count, errors
+        done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done and timeout:
+            # 长时间没有任何图片完成：剩余图片全部按超时返回
+            for index, name, _, _ in pending.values():
+                errors += 1
+                count += 1
+                yield error_line(index, name, TimeoutError('推理等待超时'))
+            pending.clear()
+            return
+
+        for future in done:
+            index, name, stage, context = pending.pop(future)
+            try:
+                if stage == 'decode':
+                    image, infer_future = future.result()
+                    pending[infer_future] = (index, name, 'infer', (image, context))
+                    continue
+                if stage == 'cached':
+                    cached = context
+                    item = batch_result(index, name, cached['width'], cached['height'], cached['detections'],
+                                        future.result())
+                else:
+                    image, cache_key = context
+                    _, results = future.result()
+                    height, width = image.shape[:2]
+                    rets = format_results(results, width, height)
+                    store_cache(cache_key, width, height, rets)
+                    item = batch_result(index, name, width, height, rets, image if annotate else None)
+                line = json.dumps(item, ensure_ascii=False) + '\n'
+            except Exception as e:
+                errors += 1
+                line = error_line(index, name, e)
+            count += 1
+            yield line
+
+    for index, (name, data) in enumerate(sources):
+        cache_key, cached = lookup_cache(data)
+        if cached is not None:
+            if not annotate:
+                # 缓存命中：不解码、不推理，直接输出
+                count += 1
+                yield json.dumps(batch_result(index, name, cached['width'], cached['height'],
+                                              cached['detections']), ensure_ascii=False) + '\n'
+                continue
+            pending[decode_pool.submit(decode_only, data)] = (index, name, 'cached', cached)
+        else:
+            deadline = time.monotonic() + yolo_opt.request_timeout
+            pending[decode_pool.submit(decode_and_enqueue, data, deadline)] = (index, name, 'decode', cache_key)
+        while len(pending) >= window:
+            yield from harvest(yolo_opt.request_timeout)
+        yield from harvest(0)
+
+    while pending:
+        yield from harvest(yolo_opt.request_timeout)
+
+    yield json.dumps({"done": True, "count": count, "errors": errors,
+                      "elapsed": round(time.perf_counter() - start, 3)}) + '\n'
+
+
+@app.route("/yolo-predict/batch", methods=["POST"])
+def predict_batch_post():
+    """
+    批量预测：multipart 多个图片文件，或请求体为 zip/tar 包
+    结果以 NDJSON 流式返回，每张图片一行（按完成顺序，index 为上传顺序），最后一行为汇总
+    annotate=1 时每行附带 base64 编码的标注图片
+    """
+    annotate = flask.request.args.get('annotate') in ('1', 'true')
+    sources = iter_upload_images(flask.request)
+    return flask.Response(flask.stream_with_context(stream_batch(sources, annotate)),
+                          mimetype='application/x-ndjson')
+
+
+@app.route("/stats", methods=["GET"])
+def stats_get():
+    """批处理队列和结果缓存统计"""
+    return json.dumps({'batcher': batcher.stats() if batcher else None,
+                       'cache': result_cache.stats() if result_cache else None})
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Model prediction')
 
@@ -149,6 +403,17 @@ def parse_args():
     parser.add_argument('--device', default='0', help='cuda device, i.e. 0 or 0,1 or cpu')
     # set port
     parser.add_argument('--port', default='8190', help='port')
+    # 动态批处理
+    parser.add_argument('--max_batch_size', type=int, default=8, help='单批最大图片数')
+    parser.add_argument('--max_batch_delay', type=float, default=10, help='攒批最长等待时间（毫秒）')
+    parser.add_argument('--max_queue', type=int, default=256, help='排队请求上限，超过时返回 503')
+    parser.add_argument('--request_timeout', type=float, default=60, help='单个请求等待推理结果的超时时间（秒）')
+    parser.add_argument('--decode_workers', type=int, default=4, help='批量接口的图片解码线程数')
+    # 结果缓存
+    parser.add_argument('--cache_entries', type=int, default=2048, help='内存中缓存的结果数，0 表示不缓存')
+    parser.add_argument('--cache_mb', type=float, default=64, help='内存缓存上限（MB）')
+    parser.add_argument('--cache_dir', type=str, default=None, help='磁盘缓存目录，不设置时只缓存在内存中')
+    parser.add_argument('--cache_disk_mb', type=float, default=1024, help='磁盘缓存上限（MB）')
 
     return parser.parse_args()
 
@@ -158,9 +423,21 @@ def main(args):
 
     global yolov8_model
     global yolo_opt
+    global batcher
+    global decode_pool
+    global result_cache
     yolo_opt = args
     yolov8_model = YOLOv8OBB(path=str(yolo_opt.det_weights), conf_thres=yolo_opt.conf, device_id=yolo_opt.device)  #
     seg_model = DeeplabV3Seg(path=str(yolo_opt.seg_weights), device_id=yolo_opt.device)
+    batcher = MicroBatcher(infer_batch, max_batch_size=yolo_opt.max_batch_size,
+                           max_delay=yolo_opt.max_batch_delay / 1000.0, max_queue=yolo_opt.max_queue)
+    decode_pool = ThreadPoolExecutor(max_workers=yolo_opt.decode_workers, thread_name_prefix='decode')
+    if yolo_opt.cache_entries > 0:
+        version = model_version(yolo_opt.seg_weights, yolo_opt.det_weights, conf=yolo_opt.conf,
+                                iou=yolov8_model.iou_threshold)
+        result_cache = ResultCache(version, max_entries=yolo_opt.cache_entries,
+                                   max_bytes=int(yolo_opt.cache_mb * 1024 * 1024), disk_dir=yolo_opt.cache_dir,
+                                   disk_max_bytes=int(yolo_opt.cache_disk_mb * 1024 * 1024))
     # image = torch.rand((1, 3, 640, 640))
     # yolov8_model.predict(image,  device=yolo_opt.device, save=False, stream=True, conf=0.5)
     print("load model OK!")
@@ -170,4 +447,4 @@ if __name__ == '__main__':
     args = parse_args()
     main(args)
     # print(args.port)
-    app.run('0.0.0.0', args.port)
+    app.run('0.0.0.0', args.port, threaded=True)
@@ -11,12 +11,16 @@ import traceback
 import atexit
 import json
 
-from page.caiji.loggermodel import logger
+from page.caiji.loggermodel import logger, configure_logging
 from page.caiji.AlertSystem import AlertSystem
 from page.caiji.BladeDetector import BladeDetector
 from page.caiji.CameraManager import CameraManager
 from page.caiji.DetectionWorker import DetectionWorker
+from page.caiji.ShardedDetector import ShardedDetectionWorker
 from page.caiji.HealthMonitor import HealthMonitor
+from page.caiji.MemoryGovernor import MemoryGovernor
+from page.caiji.PreviewServer import PreviewServer
+from page.caiji.SamplingProfiler import SamplingProfiler
 
 
 
@@ -35,18 +39,53 @@ def load_config():
         # 检测配置
         'detection_interval': 1.0,  # 检测间隔（秒）
         'batch_size': 1,
+        'detector_shards': 1,  # 检测分片数，大于1时每个分片独立加载模型并绑定一组CPU核
+        'shard_cores': None,  # 各分片的核列表，如 "0-15;16-31"；为空时按 NUMA 节点自动分配
+        'shard_rebalance_interval': 60,  # 分片间相机负载均衡间隔（秒）
+        'pipeline_queue_size': 0,  # 大于0时启用检测流水线（预处理/分割/检测/后处理并行），值为阶段间队列容量
+        'blade_gate_coverage': 0.0,  # 叶片存在性门限：低分辨率分割的叶片占比低于该值时跳过完整推理，如 0.02；0 表示不启用
+        'blade_gate_size': 256,  # 门限判断的推理边长（分割模型输入高宽为动态时复用分割模型）
+        'blade_gate_weights': None,  # 门限使用的独立小分割模型；分割模型输入尺寸固定时必须配置
 
         # 告警配置
         'alert_api_endpoint': None,  # 设置为实际的API端点，如 'http://alert-system/api/alerts'
         'alert_save_dir': 'alerts',
+        'save_annotated_images': False,  # True 时告警图片烧录检测框（默认保存原图，由仪表板叠加显示）
+        'save_defect_crops': True,  # 每个缺陷另存旋转校正的小图（crops/ 目录），仪表板缺陷视图只加载小图
+        'defect_crop_padding': 0.25,  # 缺陷小图每侧留出的背景占框宽高的比例
+        'defect_crop_max_size': 256,  # 缺陷小图最长边（像素）
 
         # Web API配置
-        'enable_web_api': True,
-        'api_port': 8080,
+        'enable_web_api': True,  # 实时预览（/preview/<camera_id>）和状态接口
+        'api_port': 8081,  # 告警仪表板默认占用 8080
+        'preview_fps': 5,  # 预览帧率上限
+        'preview_max_width': 960,  # 预览图最大宽度
+        'preview_jpeg_quality': 70,
+        'preview_overlay': True,  # 默认叠加最新检测框（URL 参数 overlay=0 关闭）
+
+        # 采样分析（kill -USR2 <pid> 或 POST /api/profile?duration=30 触发，结果写入 profile_dir）
+        'profile_dir': 'profiles',
+        'profile_duration': 30,  # SIGUSR2 触发时的采样时长（秒）
+        'profile_interval': 0.02,  # 采样间隔（秒）
+        'admin_allow_remote': False,  # 管理接口是否允许非本机访问
 
         # 性能配置
         'max_queue_size': 30,
+        'max_concurrent_connects': 8,  # 同时进行的相机连接尝试上限
+        'camera_startup_spread': 10.0,  # 启动时相机首次连接随机分散的时间窗口（秒）
+        'reconnect_max_delay': 120.0,  # 重连指数退避的最大等待时间（秒）
+        'camera_startup_timeout': 30,  # 启动时等待相机首次连接的最长时间（秒）
+        'camera_config_watch_interval': 5.0,  # 相机配置文件检查间隔（秒），修改后自动增删/重连相机；0 表示不监视
+        'camera_overrides': {},  # 单相机覆盖配置，如 {"A02": {"capture_backend": "ffmpeg"}}，修改后热加载
         'frame_skip_ratio': 3,  # 每3帧处理1帧
+        'memory_budget_mb': 0,  # 帧队列、采集缓冲、检测中的帧和预览缓存的内存预算（MB），接近时自动缩短队列；0 表示只统计
+        'memory_check_interval': 5.0,  # 内存统计间隔（秒）
+
+        # 日志配置（写入由后台线程完成，重复消息按窗口限流）
+        'log_level': 'INFO',
+        'log_json': False,  # True 时日志文件为每行一个 JSON 对象
+        'log_rate_limit_window': 60.0,  # 限流窗口（秒），0 表示不限流
+        'log_rate_limit_burst': 5,  # 窗口内同一条消息最多输出次数，其余汇总为“抑制 N 条”
     }
 
     # 尝试从配置文件加载
@@ -78,6 +117,13 @@ class BladeMonitoringSystem:
         self.alert_system = None
         self.detection_worker = None
         self.health_monitor = None
+        self.preview_server = None
+        self.memory_governor = None
+        self.profiler = SamplingProfiler(
+            output_dir=config.get('profile_dir', 'profiles'),
+            interval=config.get('profile_interval', 0.02)
+        )
+        self.profiler.listen()
 
         # 创建结果目录
         self.result_dir = Path('result')
@@ -86,6 +132,8 @@ class BladeMonitoringSystem:
         # 信号处理
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, self.profile_signal_handler)
 
         # 注册退出处理
         atexit.register(self.cleanup)
@@ -97,38 +145,96 @@ class BladeMonitoringSystem:
         try:
             # 1. 初始化相机管理器
             self.camera_manager = CameraManager(
-                config_file=self.config.get('camera_config', './factory.json')
+                config_file=self.config.get('camera_config', './factory.json'),
+                queue_size=self.config.get('max_queue_size', 30),
+                max_concurrent_connects=self.config.get('max_concurrent_connects', 8),
+                startup_spread=self.config.get('camera_startup_spread', 10.0),
+                reconnect_max_delay=self.config.get('reconnect_max_delay', 120.0),
+                overrides_file='conf/config.json'
             )
 
-            # 2. 初始化叶片检测器
-            self.detector = BladeDetector(
-                seg_weights=self.config.get('seg_weights', './models/blade/blade_seg.onnx'),
-                det_weights=self.config.get('det_weights', './models/blade/best.onnx'),
-                conf_threshold=self.config.get('conf_threshold', 0.45),
-                device=self.config.get('device', '0')
-            )
-
-            # 3. 初始化告警系统
+            # 2. 初始化告警系统
             self.alert_system = AlertSystem(
                 api_endpoint=self.config.get('alert_api_endpoint', 'http://localhost:8080/api/alerts'),
-                save_dir=self.config.get('alert_save_dir', 'alerts')
+                save_dir=self.config.get('alert_save_dir', 'alerts'),
+                save_crops=self.config.get('save_defect_crops', True),
+                crop_padding=self.config.get('defect_crop_padding', 0.25),
+                crop_max_size=self.config.get('defect_crop_max_size', 256)
             )
 
-            # 4. 初始化检测工作线程
-            self.detection_worker = DetectionWorker(
+            shards = int(self.config.get('detector_shards', 1) or 1)
+            if shards > 1:
+                # 3/4. 分片模式：每个分片独立的检测器和检测线程，相机按负载分配
+                self.detection_worker = ShardedDetectionWorker(
+                    camera_manager=self.camera_manager,
+                    alert_system=self.alert_system,
+                    seg_weights=self.config.get('seg_weights', './models/blade/blade_seg.onnx'),
+                    det_weights=self.config.get('det_weights', './models/blade/best.onnx'),
+                    conf_threshold=self.config.get('conf_threshold', 0.45),
+                    device=self.config.get('device', '0'),
+                    annotate=self.config.get('save_annotated_images', False),
+                    shards=shards,
+                    core_spec=self.config.get('shard_cores'),
+                    detection_interval=self.config.get('detection_interval', 1.0),
+                    batch_size=self.config.get('batch_size', 1),
+                    rebalance_interval=self.config.get('shard_rebalance_interval', 60),
+                    pipeline_queue_size=self.config.get('pipeline_queue_size', 0),
+                    gate_coverage=self.config.get('blade_gate_coverage', 0.0),
+                    gate_size=self.config.get('blade_gate_size', 256),
+                    gate_weights=self.config.get('blade_gate_weights')
+                )
+            else:
+                # 3. 初始化叶片检测器
+                self.detector = BladeDetector(
+                    seg_weights=self.config.get('seg_weights', './models/blade/blade_seg.onnx'),
+                    det_weights=self.config.get('det_weights', './models/blade/best.onnx'),
+                    conf_threshold=self.config.get('conf_threshold', 0.45),
+                    device=self.config.get('device', '0'),
+                    annotate=self.config.get('save_annotated_images', False),
+                    gate_coverage=self.config.get('blade_gate_coverage', 0.0),
+                    gate_size=self.config.get('blade_gate_size', 256),
+                    gate_weights=self.config.get('blade_gate_weights')
+                )
+
+                # 4. 初始化检测工作线程
+                self.detection_worker = DetectionWorker(
+                    camera_manager=self.camera_manager,
+                    blade_detector=self.detector,
+                    alert_system=self.alert_system,
+                    detection_interval=self.config.get('detection_interval', 1.0),  # 检测间隔
+                    batch_size=self.config.get('batch_size', 1),
+                    pipeline_queue_size=self.config.get('pipeline_queue_size', 0)
+                )
+
+            # 5. 初始化内存预算管理和健康监控（预览服务创建后再关联）
+            self.memory_governor = MemoryGovernor(
+                budget_mb=self.config.get('memory_budget_mb', 0),
                 camera_manager=self.camera_manager,
-                blade_detector=self.detector,
-                alert_system=self.alert_system,
-                detection_interval=self.config.get('detection_interval', 1.0),  # 检测间隔
-                batch_size=self.config.get('batch_size', 1)
+                detection_worker=self.detection_worker,
+                interval=self.config.get('memory_check_interval', 5.0)
             )
-
-            # 5. 初始化健康监控
             self.health_monitor = HealthMonitor(
                 camera_manager=self.camera_manager,
-                detection_worker=self.detection_worker
+                detection_worker=self.detection_worker,
+                memory_governor=self.memory_governor
             )
 
+            # 6. 初始化实时预览服务
+            if self.config.get('enable_web_api', True):
+                self.preview_server = PreviewServer(
+                    camera_manager=self.camera_manager,
+                    port=self.config.get('api_port', 8081),
+                    fps=self.config.get('preview_fps', 5),
+                    max_width=self.config.get('preview_max_width', 960),
+                    quality=self.config.get('preview_jpeg_quality', 70),
+                    overlay=self.config.get('preview_overlay', True),
+                    status_provider=self.health_monitor.get_health_report,
+                    profiler=self.profiler,
+                    allow_remote_admin=self.config.get('admin_allow_remote', False)
+                )
+                self.detection_worker.add_result_listener(self.preview_server.update_detections)
+                self.memory_governor.preview_server = self.preview_server
+
             logger.info("系统初始化完成")
             return True
 
@@ -142,9 +248,15 @@ class BladeMonitoringSystem:
         logger.info("启动风机叶片监控系统...")
 
         try:
-            # 1. 启动相机管理器
+            # 1. 启动相机管理器（内存预算管理先启动，首批帧就受队列长度限制）
+            self.memory_governor.start()
             self.camera_manager.start_all_cameras()
-            time.sleep(5)  # 等待相机连接
+            connected = self.camera_manager.wait_for_cameras(timeout=self.config.get('camera_startup_timeout', 30))
+            logger.info(f"相机首次连接完成: {connected}/{len(self.camera_manager.cameras)}")
+
+            watch_interval = self.config.get('camera_config_watch_interval', 5.0)
+            if watch_interval:
+                self.camera_manager.start_watching(watch_interval)
 
             # 2. 启动检测工作线程
             self.detection_worker.start()
@@ -152,6 +264,10 @@ class BladeMonitoringSystem:
             # 3. 启动健康监控
             self.health_monitor.start()
 
+            # 4. 启动实时预览服务
+            if self.preview_server:
+                self.preview_server.start()
+
             logger.info("风机叶片监控系统启动完成")
             return True
 
@@ -166,14 +282,24 @@ class BladeMonitoringSystem:
         self.cleanup()
         sys.exit(0)
 
+    def profile_signal_handler(self, signum, frame):
+        """SIGUSR2：请求一次采样分析（由分析器的监听线程开始和记录日志，信号处理函数不加锁）"""
+        self.profiler.request(self.config.get('profile_duration', 30))
+
     def cleanup(self):
         """清理资源"""
         logger.info("正在清理系统资源...")
 
         try:
+            if self.preview_server:
+                self.preview_server.stop()
+
             if self.health_monitor:
                 self.health_monitor.stop()
 
+            if self.memory_governor:
+                self.memory_governor.stop()
+
             if self.detection_worker:
                 self.detection_worker.stop()
 
@@ -218,6 +344,7 @@ def main():
 
     # 加载配置
     config = load_config()
+    configure_logging(config)
 
     # 创建监控系统
     monitoring_system = BladeMonitoringSystem(config)
@@ -1,14 +1,24 @@
 // 全局变量
-let currentView = 'grid'; // 'grid' 或 'table'
+let currentView = 'grid'; // 'grid'、'table' 或 'defects'
 let allAlerts = [];
 let filteredAlerts = [];
 let cameras = new Set();
 let defects = new Set();
 let currentAlertDetails = null;
 
+// 详情图叠加标注（告警保存原图时，由前端按检测框绘制）
+let overlayHiddenClasses = new Set();
+
 let currentSearchMode = 'cache'; // 'cache' 或 'file'
 let fileSearchTimer = null;
 let lastSearchParams = null;
+let historyCursors = {}; // 历史搜索各页的翻页游标 {页码: cursor}
+let totalExact = true;   // 总数是否精确（目录流式搜索时只知道是否还有下一页）
+
+// 实时推送（SSE），不可用时退回定时轮询
+let alertEventSource = null;
+let streamConnected = false;
+let cachedAlertsLimit = 1000;
 let modeStartTime = null; // 记录模式切换时间
 let isInitialLoad = true; // 标记是否为初始加载
 
@@ -174,6 +184,64 @@ function loadAlerts() {
 }
 
 
+// 订阅实时告警推送
+function initAlertStream() {
+    if (!window.EventSource) {
+        console.warn('浏览器不支持 SSE，使用定时轮询');
+        return;
+    }
+
+    alertEventSource = new EventSource('/api/alerts/stream');
+
+    alertEventSource.onopen = function() {
+        streamConnected = true;
+        $('#connectionStatus').removeClass('bg-danger').addClass('bg-success').text('已连接');
+        console.log('实时告警推送已连接');
+    };
+
+    // 断线期间的事件由服务端按 Last-Event-ID 补发；EventSource 会自动重连
+    alertEventSource.onerror = function() {
+        streamConnected = false;
+        console.warn('实时告警推送断开，重连期间使用定时轮询');
+    };
+
+    alertEventSource.addEventListener('alert', function(e) {
+        handleStreamAlert(JSON.parse(e.data));
+    });
+
+    // 缺失的事件无法补发（服务重启或断线过久），重新加载一次
+    alertEventSource.addEventListener('reset', function() {
+        if (currentSearchMode === 'cache') {
+            loadAlerts();
+        }
+    });
+}
+
+// 处理推送的新告警
+function handleStreamAlert(alert) {
+    cameraManager.add(alert.camera_id);
+
+    // 历史搜索模式不受实时告警影响
+    if (currentSearchMode !== 'cache') return;
+    if (allAlerts.some(a => a.alert_id === alert.alert_id)) return;
+
+    totalAlerts = Math.min(totalAlerts + 1, cachedAlertsLimit);
+    totalPages = Math.max(1, Math.ceil(totalAlerts / pageSize));
+
+    // 只有第一页需要插入新告警，其他页仅更新分页
+    if (currentPage === 1) {
+        allAlerts.unshift(alert);
+        if (allAlerts.length > pageSize) {
+            allAlerts.pop();
+        }
+        extractFilters();
+        applyLocalFilters();
+    }
+
+    updateLastUpdateTime();
+    updatePagination();
+}
+
 // 从缓存加载告警
 function loadAlertsFromCache() {
     $.ajax({
@@ -226,14 +294,18 @@ function loadAlertsFromFile() {
         return;
     }
 
-    // 保存搜索参数
-    lastSearchParams = {
+    // 保存搜索参数（条件变化后之前的翻页游标失效）
+    const searchParams = {
         start_time: startTime,
         end_time: endTime,
         camera_id: cameraFilter,
         defect_name: defectFilter,
         min_confidence: confidenceMin
     };
+    if (JSON.stringify(searchParams) !== JSON.stringify(lastSearchParams)) {
+        historyCursors = {};
+    }
+    lastSearchParams = searchParams;
 
     $.ajax({
         url: '/api/alerts/search',
@@ -246,9 +318,13 @@ function loadAlertsFromFile() {
             end_time: endTime,
             camera_id: cameraFilter,
             defect_name: defectFilter,
-            min_confidence: confidenceMin
+            min_confidence: confidenceMin,
+            cursor: historyCursors[currentPage] || ''
         },
         success: function(data) {
+            if (data.pagination && data.pagination.next_cursor) {
+                historyCursors[currentPage + 1] = data.pagination.next_cursor;
+            }
             handleAlertsResponse(data);
         },
         error: function(xhr, status, error) {
@@ -265,6 +341,10 @@ function handleAlertsResponse(data) {
         allAlerts = data.alerts;
         totalAlerts = data.pagination.total;
         totalPages = data.pagination.total_pages;
+        totalExact = data.pagination.total_exact !== false;
+        if (data.stats && data.stats.cached_alerts_limit) {
+            cachedAlertsLimit = data.stats.cached_alerts_limit;
+        }
 
         // 如果是初次加载，标记为非初次
         if (isInitialLoad) {
@@ -484,9 +564,14 @@ function addPageButton(pageNum, insertAfter = null, isActive = false) {
 function updatePaginationInfo() {
     const start = (currentPage - 1) * pageSize + 1;
     const end = Math.min(currentPage * pageSize, totalAlerts);
-    const displayText = totalAlerts === 0
+    let displayText = totalAlerts === 0
         ? '暂无告警数据'
         : `正在显示第 ${start}-${end} 条告警，共 ${totalAlerts} 条`;
+    if (totalAlerts > 0 && !totalExact) {
+        displayText = currentPage < totalPages
+            ? `正在显示第 ${start}-${end} 条告警，还有更多`
+            : `正在显示第 ${start}-${end} 条告警`;
+    }
     $('#resultCount').text(displayText);
 }
 
@@ -571,6 +656,7 @@ function updateDisplay() {
     if (filteredAlerts.length === 0) {
         $('#gridView').hide();
         $('#tableView').hide();
+        $('#defectGallery').hide();
         $('#emptyState').show();
         return;
     }
@@ -579,6 +665,8 @@ function updateDisplay() {
 
     if (currentView === 'grid') {
         displayGridView();
+    } else if (currentView === 'defects') {
+        displayDefectGallery();
     } else {
         displayTableView();
     }
@@ -596,16 +684,21 @@ function displayGridView() {
 
     $('#gridView').show();
     $('#tableView').hide();
+    $('#defectGallery').hide();
 }
 
 // 创建宫格卡片
 function createGridCard(alert) {
     const detectionTime = formatDateTime(alert.detection_time);
     const defectNames = alert.detections.map(det => translateDefectName(det.name)).join('、');
-    const imageUrl = getAlertImageUrl(alert);
+    const imageUrl = getAlertThumbUrl(alert, 320);
+    const imageUrl2x = getAlertThumbUrl(alert, 640);
     return `
         <div class="grid-card" onclick="showAlertDetail('${alert.alert_id}')">
             <img src="${imageUrl}"
+                 srcset="${imageUrl} 1x, ${imageUrl2x} 2x"
+                 loading="lazy"
+                 decoding="async"
                  class="grid-image"
                  alt="${alert.camera_name}"
                  onerror="this.onerror=null; this.src='data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAT4AAADBCAIAAADZ6UsfAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAAEXRFWHRTb2Z0d2FyZQBTbmlwYXN0ZV0Xzt0AAAyjSURBVHic7dvpV1RnnsDx59ZKUezFDhoXUFQQEEENLhC3YNt2TNJ2OuN00tN9enpOn/kn5uW8mxfTfU6fSU8mpo3tGo3BGIzG2HGBBsWAbCKuKDtUUVRB3aqaF3dSzQAmaKYm85vz/by69fDcy6VOfeveqnvRRn1hBUAa0/e9AwCeB+kCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLpAiKRLiAS6QIikS4gEukCIpEuIBLp/l/hHhud9Punj4yNjrTevD57ptc7/tWNxmfa+J2uDp9vwlgOTE3daKwPhULhcPib1+rubH9wr2f+v0XX9c721mAw+Ez7hudj+b534P+nD4/8caC/71unvfG3v4hPSDSWjx16r3z9xsLiNZGfDg70XTx/dtXq0hlrjY2O/Pnzc0UlZfPfnwvnzuz60esOR6xSSg/qF+pqVxWVnP7w8KLFeSVr12maFpl57fIXsbFOY+OtLTeSklIWvLB49gY/OX3CN+GNPExNy9hUvf1+T/fFz87mLVsx/x3DcyPdqJjweis2bDJe9O6x0Y62lrXrKqcXopR679/+9VuPe3ObtZZ7bLSluWn6yLKCVanpGQff/f3kpF8pNe5xnz5x2GKxKKVe/+lbSqlgKLipavuJw+8PDvZv3bnbZDIppfRAoPHa5e279nz9e8LG+GyPHtwrXlOemJSslOp73Pu496FS6nZX+/IVhU9bBf+zSDda4hMSU1ypeiBQe/JoWIWnn3kmJacsWpI3o+T5eNz78MKntVNTk1NTkwff/b0xWLllq9Vqbay/XFS61hhpb7npSktPTc947Y2fGSMH/vC77TV7MrNylFI2u13TNF3XU9Mz9u3/u66OW5E96WxvnZz03+vpfnj/rlJqsL/P6/FcqKuN7ICmaVXbaozlFxYv9U1M2Ox2s9nyuPehHgh0d7ZrmtbVcSsyPys7d9ePXn/WPxPzQbpRNDU5+fHJI95xT3FZhXH0m/T7r//lasWGTYuW5M2e7/G4hwb6Iw/do6OhUCgyYjKbE5OS11VuHhzob6q/sq5ys1Lq/Ke1uh6wWq1Wq61q68vGTCO8O7c779+7Y4xMTvpbmpt67nQZDzVNu/zFeZvdbjy8eP5s1daXJ/3+L784v3xFYUyMwxgPh8MWq9VqtUV2acbbTVfHrYTEJFdqulKq9asbfr9ve82ejKxspdSHRw6uXVe5eGn+d3kC8Q1IN1p0PXD4j/+enpmVtzzJ4x6r3lbjdo+dOXWssHjN+o1Vc67SWH+5ubF++ojFbDly8F1jOSEx6c23f7U0v8Bisdrs9qX5BUqpi5+dNZnMc24t1ulMSUlVSg30P8nLL8jKWRD5kd0e43DEGqe7EZc+r0tMTKrZ81qkz4f37y7NX15W8eK3/rGhUKip4UpMjMNkMqWlZ4ZCId+ENzt3QVJyyreui+dDutFisVirt9dk5y5USp375KP33vmtd9xTuWXrmvINc84Ph8PV22pmfyk1m64HjE+tSqlgMGg2z51uWnpmbKxTKXXrqxvZuQsjx3m7PaatpTlnwQtL8paNDA8FdT01PUMpFZ+QuKZ8w/TjakAPmM3zeoUEdd0ZF1+wsmh0ZFgp5R33BIPBuPiE+ayL50O60RIM6rpu/uL8p/d6bpvNlpVFJRPe8aaGqzca6zOzcgpWrZ41P2h6SoQz+H2+yDlt6OnpetxjtSePetxjoVAoFAoZZ9FKqdWla+PiE7zjnnA4fKGuNsWVWrWtpr/vcVDX21tvTt/CuNt9907XhHd8+qAzLr54TXlkn+32GKWU1Wbbu29/T3dnZ1urUmpsdMTpjDPeOBAlpBstI8ND3Z3t+QUr12+smpqcTElNc7nSqrfvGhzo6+7qsFqtM+YHpqZud7SNjQzPGM/Mzp3xwXhiwhvj+K909aBuMpvDodDsHUhKTtn7k/3vv/O73Xv3jY2OeDzudS9uNn40PDQ4NDhwr6e799GDnbv3KqUCgYD3vyfq9/n8ft/oyLAzLn76+PT3l0m/3xEbayxbLBZXavr9ux/pun67sz0zJ/c5vofD/JFutKSmZVRs2KSU6unu6mq/1dRwZWR4KDbWuf8X/7C+csuMycFgMBCYCoWCHo97+vi9nm7/pH9GugN9T1JcacaycdTV50pXKXXl0gWrzfbk8aOH9+/6JiaM0+xFS/KzcnIbr12+f+9O+fqNTmecUiond2FO7sLp63558bOk5BS/z7e5eoc9JmbO7fv9vpgYRyAQMB4mp7ic8fFdHbfaWpqrd+ya3/OE50S6URQOh699eTE+IbG0fL3LlWa2WMZGR4z7ImYYHOgLhUJbd+6e8fnw1PFDs7fZ++hB1YpVxrKu6ybtqddRFy5aEp+QaNw4FQ6HQ0bh4XB27sLTJw6nZ2StXVdpXFuecYTse9Lb9Jere159o62l+UJd7c7de2dMKCxeY7fH9D3pvd54rXz9RuMWDk3TikvLP687Y7Pb8/ILnuWpwjMj3SjSA4FAINDVcWugv2/c43Y645Jdqa7UtMrNW2ccx253tCUmJc84NZ3Towf3JrzjOQteUEoZKX7DJ2TjxiZd13VdHxroz8rOnZjwKk3rfXhfKbUkf7nZbB4eGqw9dXT/z38dWavvSe/xQwcKV5cuXLQkNT3j8Pt/qDtz6qUdP4h8N6aUWvfi5u6u9ri4eIcj9uK5TyIXkOPjE/x+X37BSrOFl1Z08fxGkdVm21S93Vj2+33DgwMD/X0e91jkgqrB6x1vvt4w+3ar2cLhcGPDlWUFq4xD9/DQgFIqxuHw+yZ8vol/+ed/MqYZSff3PT555KDf71OaZjabrRZrMBR0OGIH+p40X28oKatoariyunTt0GC/5euvkfVA4OqXFxvrL68uXVu1rUbTNKcz7rU3fnb8TwcOvPPbLS/tXJy3zNhJr3f8s7Mfb6ratmxF4fE/HTjz0fEfvvqT1pvXz3/6cUlZxa2WZk3TNlfvsNpsc/8l+M5IN1rqak9aZn0XZehoa1FfBxYKhU6fOJyYmDyfy6dtrTfvdne9+davrly6MDw0+Lj3YXKKy+GIHVVDMTGOt//+H41pxqVgV2r662++7XTGWW22poYroyPDL+34Qf2VS9cbrr7y47/Jys4dGx059sF/WK227NyF7rHRG431rTevm0ym3a/sW7rsr6e7CYlJ+3/+6z9fPHfq+KFYZ9zqkrIl+ctPHTu0YOGi5SuLTCbT7r37em53Hjv0Xt+T3pd/+OqyglWFxWtOHv2g41ZLSVnFhk3VfF8VDaQbFbFOZ1FJWWZ2zjfMOXn0A03TNE3LyMwqKi6b8xpPTIzDbvvrIVrTtA2bqtMyMj3usUAgkJScsmp1qaZpzrj4krKKyKfowtWlySkus9mcnOIyRiwWq81mV0rZbPYfv/m2Ky1dKbX7lX2XPq8bGR4qq9gwNTXV0925rnJzUXHZ7EOlxWqt2lazpnxDc1NDsivVbLYszV++ZevLxu3KDkfs0OCAwxH71i9/Y3xWT0vPfOuXv2msv2y2WOg2SrRR33PdAY/vSTgcjlIM32XL0dsrPA3/5CFM9Ar5Llum2/99pAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEikC4hEuoBIpAuIRLqASKQLiES6gEj/CWUYFcGCtMuiAAAAAElFTkSuQmCC';">
@@ -650,6 +743,59 @@ function displayTableView() {
 
     $('#gridView').hide();
     $('#tableView').show();
+    $('#defectGallery').hide();
+}
+
+// 缺陷小图地址（旋转校正的单个缺陷，旧告警由服务端首次访问时截取）
+function getDefectCropUrl(alert, index) {
+    return `/alerts/crops/${encodeURIComponent(alert.alert_id)}/${index}`;
+}
+
+// 显示缺陷视图：当前页告警的每个缺陷一张小图，按缺陷名称和置信度筛选
+function displayDefectGallery() {
+    const container = $('#defectGallery');
+    container.empty();
+
+    const defectName = $('#defectFilter').val();
+    const minConf = parseFloat($('#confidenceMin').val()) || 0;
+    let count = 0;
+
+    filteredAlerts.forEach(alert => {
+        (alert.detections || []).forEach((det, index) => {
+            if ((defectName && det.name !== defectName) || det.conf < minConf) return;
+            container.append(createDefectTile(alert, det, index));
+            count++;
+        });
+    });
+
+    if (count === 0) {
+        container.append('<div class="text-muted text-center w-100 py-4">当前页没有符合条件的缺陷</div>');
+    }
+
+    $('#gridView').hide();
+    $('#tableView').hide();
+    $('#defectGallery').css('display', 'grid');
+}
+
+// 创建缺陷小图卡片
+function createDefectTile(alert, det, index) {
+    const crop = (alert.crops || [])[index];
+    const size = crop ? `width="${crop.width}" height="${crop.height}"` : '';
+    return `
+        <div class="defect-tile" onclick="showAlertDetail('${alert.alert_id}')"
+             title="${alert.camera_name} ${formatDateTime(alert.detection_time)}">
+            <div class="defect-tile-image">
+                <img src="${getDefectCropUrl(alert, index)}" ${size} loading="lazy" decoding="async"
+                     alt="${translateDefectName(det.name)}"
+                     onerror="this.onerror=null; this.style.visibility='hidden';">
+            </div>
+            <div class="defect-tile-info">
+                <span class="defect-tile-name">${translateDefectName(det.name)}</span>
+                <span class="defect-tile-conf">${(det.conf * 100).toFixed(1)}%</span>
+            </div>
+            <div class="defect-tile-meta">${alert.camera_id} · ${formatDateTime(alert.detection_time)}</div>
+        </div>
+    `;
 }
 
 // 创建表格行
@@ -663,7 +809,9 @@ function createTableRow(alert) {
     return `
         <tr>
             <td>
-                <img src="/alerts/images/${alert.image_filename || alert.alert_id + '.jpg'}"
+                <img src="${getAlertThumbUrl(alert, 160)}"
+                     loading="lazy"
+                     decoding="async"
                      class="table-image"
                      onclick="showAlertDetail('${alert.alert_id}')"
                      alt="预览"
@@ -905,11 +1053,14 @@ function showAlertDetail(alertId) {
     $('#detailDefectCount').text(`${alert.detection_count} 个缺陷`);
 
     // 设置图片
-    const imageUrl = `/alerts/images/${alert.image_filename || alert.alert_id + '.jpg'}`;
+    const imageUrl = getAlertImageUrl(alert);
     $('#detailImage').attr('src', imageUrl);
 
+    // 原图告警叠加检测框
+    initDetailOverlay(alert);
+
     // 更新缺陷列表
-    updateDefectList(alert.detections);
+    updateDefectList(alert.detections, alert);
 
     // 显示模态框
     const modal = new bootstrap.Modal(document.getElementById('detailModal'));
@@ -931,7 +1082,7 @@ function formatDetailedTime(dateTimeString) {
 }
 
 // 更新缺陷列表
-function updateDefectList(detections) {
+function updateDefectList(detections, alert) {
     const container = document.getElementById('defectList');
     if (!container) return;
 
@@ -948,6 +1099,8 @@ function updateDefectList(detections) {
                 <span class="defect-name">缺陷 ${index + 1}: ${chineseName}</span>
                 <span class="defect-confidence">${confidencePercent}%</span>
             </div>
+            ${alert ? `<img class="defect-crop" src="${getDefectCropUrl(alert, index)}" loading="lazy"
+                            alt="${chineseName}" onerror="this.remove();">` : ''}
             <div class="defect-coordinates">
                 <div class="coordinate-item">
                     <div>X坐标</div>
@@ -977,11 +1130,161 @@ function updateDefectList(detections) {
 }
 
 
+// 叠加层配色（与后端导出标注图一致，按类别 ID 取色）
+const overlayColors = [
+    '#FF3838', '#FF9D97', '#FF701F', '#FFB21D', '#CFD231', '#48F90A', '#92CC17', '#3DDB86',
+    '#1A9334', '#00D4BB', '#2C99A8', '#00C2FF', '#344593', '#6473FF', '#0018EC', '#8438FF',
+    '#520085', '#CB38FF', '#FF95C8', '#FF37C7'
+];
+
+function overlayColor(det) {
+    return overlayColors[(det.clsId || 0) % overlayColors.length];
+}
+
+// 告警图片是否为原图（需要前端叠加检测框）
+function needsOverlay(alert) {
+    return !!alert && alert.image_annotated === false;
+}
+
+// 初始化详情图叠加层：类别开关和置信度滑块
+function initDetailOverlay(alert) {
+    const section = $('#overlaySection');
+    const canvas = document.getElementById('detailOverlay');
+    overlayHiddenClasses = new Set();
+
+    if (!needsOverlay(alert)) {
+        section.hide();
+        if (canvas) canvas.getContext('2d').clearRect(0, 0, canvas.width, canvas.height);
+        return;
+    }
+
+    $('#overlayMinConf').val(0);
+    $('#overlayMinConfValue').text('0%');
+    const container = $('#overlayClasses');
+    container.empty();
+
+    const classes = [];
+    alert.detections.forEach(det => {
+        if (!classes.some(c => c.name === det.name)) classes.push(det);
+    });
+    classes.forEach((det, index) => {
+        const id = `overlayClass${index}`;
+        container.append(`
+            <div class="form-check">
+                <input class="form-check-input overlay-class-toggle" type="checkbox" id="${id}" value="${det.name}" checked>
+                <label class="form-check-label" for="${id}">
+                    <span class="overlay-class-swatch" style="background: ${overlayColor(det)}"></span>${translateDefectName(det.name)}
+                </label>
+            </div>
+        `);
+    });
+
+    section.show();
+    drawDetailOverlay();
+}
+
+// 当前筛选后需要显示的检测框
+function visibleOverlayDetections(alert) {
+    const minConf = parseInt($('#overlayMinConf').val() || 0) / 100;
+    return alert.detections.filter(det => !overlayHiddenClasses.has(det.name) && det.conf >= minConf);
+}
+
+// 按图片实际显示区域（object-fit: contain）绘制旋转框和标签
+function drawDetailOverlay() {
+    const canvas = document.getElementById('detailOverlay');
+    const image = document.getElementById('detailImage');
+    if (!canvas || !image) return;
+
+    const ctx = canvas.getContext('2d');
+    const ratio = window.devicePixelRatio || 1;
+    const boxWidth = image.clientWidth;
+    const boxHeight = image.clientHeight;
+    canvas.width = Math.round(boxWidth * ratio);
+    canvas.height = Math.round(boxHeight * ratio);
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.clearRect(0, 0, boxWidth, boxHeight);
+
+    const alert = currentAlertDetails;
+    if (!needsOverlay(alert) || !$('#overlayToggle').is(':checked')) return;
+    if (!image.complete || !image.naturalWidth) return;
+
+    // 图片在容器内的显示比例和留白
+    const fit = Math.min(boxWidth / image.naturalWidth, boxHeight / image.naturalHeight);
+    const offsetX = (boxWidth - image.naturalWidth * fit) / 2;
+    const offsetY = (boxHeight - image.naturalHeight * fit) / 2;
+
+    // 检测坐标基于检测时的原图尺寸，图片被压缩过时按比例换算
+    const scaleX = fit * image.naturalWidth / (alert.image_width || image.naturalWidth);
+    const scaleY = fit * image.naturalHeight / (alert.image_height || image.naturalHeight);
+
+    ctx.lineWidth = 2;
+    ctx.font = '12px sans-serif';
+    ctx.textBaseline = 'bottom';
+
+    visibleOverlayDetections(alert).forEach(det => {
+        const color = overlayColor(det);
+        const angle = (det.r || 0) * Math.PI / 180;
+        const cos = Math.cos(angle);
+        const sin = Math.sin(angle);
+        const halfW = det.w / 2;
+        const halfH = det.h / 2;
+
+        // 旋转框四个顶点（与 cv2.boxPoints 的角度约定一致）
+        const points = [[-halfW, -halfH], [halfW, -halfH], [halfW, halfH], [-halfW, halfH]].map(([dx, dy]) => [
+            offsetX + (det.x + dx * cos - dy * sin) * scaleX,
+            offsetY + (det.y + dx * sin + dy * cos) * scaleY
+        ]);
+
+        ctx.strokeStyle = color;
+        ctx.beginPath();
+        points.forEach(([x, y], i) => (i === 0 ? ctx.moveTo(x, y) : ctx.lineTo(x, y)));
+        ctx.closePath();
+        ctx.stroke();
+
+        // 标签放在最上方顶点处
+        const top = points.reduce((a, b) => (b[1] < a[1] ? b : a));
+        const text = `${translateDefectName(det.name)} ${(det.conf * 100).toFixed(1)}%`;
+        const textWidth = ctx.measureText(text).width + 6;
+        const x = Math.min(Math.max(top[0], 0), Math.max(boxWidth - textWidth, 0));
+        const y = Math.max(top[1], 16);
+        ctx.fillStyle = color;
+        ctx.fillRect(x, y - 16, textWidth, 16);
+        ctx.fillStyle = '#FFFFFF';
+        ctx.fillText(text, x + 3, y - 2);
+    });
+}
+
+// 带当前筛选条件的标注图导出地址
+function getAnnotatedImageUrl(alert, download) {
+    const params = new URLSearchParams();
+    if (needsOverlay(alert)) {
+        const minConf = parseInt($('#overlayMinConf').val() || 0) / 100;
+        const classes = [...new Set(alert.detections.map(det => det.name))].filter(name => !overlayHiddenClasses.has(name));
+        if (minConf > 0) params.set('min_conf', minConf);
+        if (overlayHiddenClasses.size > 0) params.set('classes', classes.join(','));  // 全部隐藏时为空，导出不带框
+    }
+    if (download) params.set('download', '1');
+    const query = params.toString();
+    return `/api/alerts/${encodeURIComponent(alert.alert_id)}/annotated${query ? '?' + query : ''}`;
+}
+
+// 全屏查看：原图告警显示服务端烧录后的标注图
+function openDetailFullscreen() {
+    const alert = currentAlertDetails;
+    if (!alert) return;
+    const showBoxes = needsOverlay(alert) && $('#overlayToggle').is(':checked');
+    openFullscreenViewer(showBoxes ? getAnnotatedImageUrl(alert, false) : getAlertImageUrl(alert));
+}
+
+// 导出烧录检测框的告警图片
+function downloadAnnotatedImage() {
+    if (!currentAlertDetails) return;
+    window.location.href = getAnnotatedImageUrl(currentAlertDetails, true);
+}
+
 // 修改更新结果数量
 function updateResultCount() {
-    const start = (currentPage - 1) * pageSize + 1;
-    const end = Math.min(currentPage * pageSize, totalAlerts);
-    $('#resultCount').text(`正在显示第 ${start}-${end} 条告警，共 ${totalAlerts} 条`);
+    updatePaginationInfo();
 }
 
 // 更新最后更新时间
@@ -1114,13 +1417,23 @@ function switchToRealtimeMode() {
 
 
 
-function getAlertImageUrl(alert) {
+function getAlertImagePath(alert) {
     // 如果有相对路径，使用分层结构
     if (alert.relative_path) {
-        return `/alerts/images/${alert.relative_path}/images/${alert.alert_id}.jpg`;
+        return `${alert.relative_path}/images/${alert.alert_id}.jpg`;
     }
     // 否则使用旧格式
-    return `/alerts/images/${alert.image_filename || alert.alert_id + '.jpg'}`;
+    return alert.image_filename || alert.alert_id + '.jpg';
+}
+
+// 原图地址（仅详情和全屏查看时加载）
+function getAlertImageUrl(alert) {
+    return `/alerts/images/${getAlertImagePath(alert)}`;
+}
+
+// 缩略图地址（宽度档位：160、320、640）
+function getAlertThumbUrl(alert, width) {
+    return `/alerts/thumbs/${width}/${getAlertImagePath(alert)}`;
 }
 
 
@@ -1500,6 +1813,9 @@ $(document).ready(function() {
     // 加载初始数据
     loadAlerts();
 
+    // 订阅实时告警推送
+    initAlertStream();
+
     // 初始化风机管理器
     cameraManager.load().then(() => {
         updateAllCamerasFilter();
@@ -1539,22 +1855,30 @@ $(document).ready(function() {
     $('#gridViewBtn').off('click').on('click', function() {
         console.log('切换到宫格视图');
         currentView = 'grid';
+        $('.view-btn').removeClass('active');
         $(this).addClass('active');
-        $('#tableViewBtn').removeClass('active');
         updateDisplay();
     });
 
     $('#tableViewBtn').off('click').on('click', function() {
         console.log('切换到表格视图');
         currentView = 'table';
+        $('.view-btn').removeClass('active');
+        $(this).addClass('active');
+        updateDisplay();
+    });
+
+    $('#defectViewBtn').off('click').on('click', function() {
+        console.log('切换到缺陷视图');
+        currentView = 'defects';
+        $('.view-btn').removeClass('active');
         $(this).addClass('active');
-        $('#gridViewBtn').removeClass('active');
         updateDisplay();
     });
 
     // 初始化视图状态
+    $('.view-btn').removeClass('active');
     $('#gridViewBtn').addClass('active');
-    $('#tableViewBtn').removeClass('active');
 
     // 输入框回车事件
     $('#cameraFilter, #defectFilter, #confidenceMin, #startTime, #endTime').keypress(function(e) {
@@ -1563,6 +1887,24 @@ $(document).ready(function() {
         }
     });
 
+    // 详情图叠加标注：图片加载、开关、阈值变化和窗口缩放时重绘
+    $('#detailImage').on('load', drawDetailOverlay);
+    $('#detailModal').on('shown.bs.modal', drawDetailOverlay);
+    $(window).on('resize', drawDetailOverlay);
+    $('#overlayToggle').on('change', drawDetailOverlay);
+    $('#overlayMinConf').on('input', function() {
+        $('#overlayMinConfValue').text(`${$(this).val()}%`);
+        drawDetailOverlay();
+    });
+    $('#overlayClasses').on('change', '.overlay-class-toggle', function() {
+        if (this.checked) {
+            overlayHiddenClasses.delete(this.value);
+        } else {
+            overlayHiddenClasses.add(this.value);
+        }
+        drawDetailOverlay();
+    });
+
     // 每页显示数量选择器事件
     $('#pageSizeSelect').change(function() {
         pageSize = parseInt($(this).val());
@@ -1570,9 +1912,9 @@ $(document).ready(function() {
         loadAlerts();
     });
 
-    // 自动刷新（每30秒，仅实时模式）
+    // 自动刷新（每30秒，仅实时模式且实时推送不可用时）
     setInterval(function() {
-        if (currentSearchMode === 'cache') {
+        if (currentSearchMode === 'cache' && !streamConnected) {
             loadAlerts();
         }
         // 更新模式指示器的时间显示